@@ -0,0 +1,473 @@
+#!/usr/bin/env python3
+
+
+import base64
+import json
+import socket
+import threading
+import time
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def _b64(data: bytes) -> str:
+    return base64.b64encode(data).decode("utf-8")
+
+
+def _unb64(data) -> bytes:
+    if data is None:
+        return b''
+    return base64.b64decode(data)
+
+
+class FakeEtcd:
+    """
+    In-process stand-in for the etcd v3 JSON gateway (MVCC keyspace, leases,
+    transactions and watches), good enough for benchmarks and local checks.
+
+    Every request sleeps latency seconds first, to model a remote cluster,
+    and is counted in round_trips (and per path in calls).
+    """
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.revision = 1
+        self.lock = threading.Condition()
+        self.kvs = {}        # key -> kv dict (latest, live keys only)
+        self.history = []    # list of (revision, type, kv, prev_kv)
+        self.leases = {}     # id -> {"ttl", "expires", "keys"}
+        self.next_lease = 7587000000000000000
+        self.round_trips = 0
+        self.calls = {}
+
+    # Keyspace helpers
+    def _in_range(self, key, start, end):
+        if not end:
+            return key == start
+        if end == b'\0':
+            return key >= start
+        return start <= key < end
+
+    def _expire(self):
+        now = time.monotonic()
+        for lease_id in [
+            i for i, lease in self.leases.items() if lease["expires"] <= now
+        ]:
+            self._revoke(lease_id)
+
+    def _revoke(self, lease_id):
+        lease = self.leases.pop(lease_id, None)
+        if lease is None:
+            return False
+        keys = [k for k in lease["keys"] if k in self.kvs]
+        if keys:
+            self.revision += 1
+            for key in keys:
+                self._delete_key(key)
+        return True
+
+    def _delete_key(self, key):
+        prev = self.kvs.pop(key)
+        if prev.get("lease"):
+            lease = self.leases.get(int(prev["lease"]))
+            if lease:
+                lease["keys"].discard(key)
+        self.history.append((
+            self.revision, "DELETE",
+            {"key": key, "mod_revision": self.revision}, prev
+        ))
+        self.lock.notify_all()
+
+    def _put_key(self, key, value, lease_id=0):
+        if lease_id and lease_id not in self.leases:
+            raise KeyError("etcdserver: requested lease not found")
+        prev = self.kvs.get(key)
+        if prev and prev.get("lease"):
+            old = self.leases.get(int(prev["lease"]))
+            if old:
+                old["keys"].discard(key)
+        kv = {
+            "key": key,
+            "value": value,
+            "create_revision": (
+                prev["create_revision"] if prev else self.revision
+            ),
+            "mod_revision": self.revision,
+            "version": (prev["version"] + 1) if prev else 1,
+        }
+        if lease_id:
+            kv["lease"] = lease_id
+            self.leases[lease_id]["keys"].add(key)
+        self.kvs[key] = kv
+        self.history.append((self.revision, "PUT", kv, prev))
+        self.lock.notify_all()
+        return prev
+
+    def _kv_at(self, key, revision):
+        """Reconstruct the value of key at a historic revision"""
+        latest = None
+        for rev, kind, kv, prev in self.history:
+            if rev > revision:
+                break
+            if kv["key"] == key:
+                latest = kv if kind == "PUT" else None
+        return latest
+
+    def _encode_kv(self, kv, keys_only=False):
+        out = {
+            "key": _b64(kv["key"]),
+            "create_revision": str(kv["create_revision"]),
+            "mod_revision": str(kv["mod_revision"]),
+            "version": str(kv["version"]),
+        }
+        if kv.get("lease"):
+            out["lease"] = str(kv["lease"])
+        if not keys_only:
+            out["value"] = _b64(kv["value"])
+        return out
+
+    def _header(self):
+        return {"cluster_id": "1", "member_id": "1",
+                "revision": str(self.revision), "raft_term": "2"}
+
+    # Request handlers (already decoded JSON payloads)
+    def range(self, req):
+        start = _unb64(req.get("key"))
+        end = _unb64(req.get("range_end"))
+        revision = int(req.get("revision", 0) or 0)
+
+        if revision and revision < self.revision:
+            keys = {kv["key"] for _, _, kv, _ in self.history}
+            kvs = [self._kv_at(k, revision) for k in keys]
+            kvs = [kv for kv in kvs if kv]
+        else:
+            kvs = list(self.kvs.values())
+
+        kvs = sorted(
+            [kv for kv in kvs if self._in_range(kv["key"], start, end)],
+            key=lambda kv: kv["key"]
+        )
+        min_mod = int(req.get("min_mod_revision", 0) or 0)
+        if min_mod:
+            kvs = [kv for kv in kvs if kv["mod_revision"] >= min_mod]
+
+        target = int(req.get("sort_target", 0) or 0)
+        order = int(req.get("sort_order", 0) or 0)
+        if target == 2:
+            kvs.sort(key=lambda kv: kv["create_revision"])
+        elif target == 3:
+            kvs.sort(key=lambda kv: kv["mod_revision"])
+        if order == 2:
+            kvs.reverse()
+
+        result = {"header": self._header(), "count": str(len(kvs))}
+        if req.get("count_only"):
+            return result
+
+        limit = int(req.get("limit", 0) or 0)
+        if limit and len(kvs) > limit:
+            kvs = kvs[:limit]
+            result["more"] = True
+
+        if kvs:
+            result["kvs"] = [
+                self._encode_kv(kv, req.get("keys_only")) for kv in kvs
+            ]
+        return result
+
+    def put(self, req):
+        self.revision += 1
+        try:
+            prev = self._put_key(
+                _unb64(req["key"]), _unb64(req.get("value")),
+                int(req.get("lease", 0) or 0)
+            )
+        except KeyError:
+            self.revision -= 1
+            raise
+        result = {"header": self._header()}
+        if req.get("prev_kv") and prev:
+            result["prev_kv"] = self._encode_kv(prev)
+        return result
+
+    def deleterange(self, req):
+        start = _unb64(req.get("key"))
+        end = _unb64(req.get("range_end"))
+        keys = [k for k in self.kvs if self._in_range(k, start, end)]
+        if keys:
+            self.revision += 1
+        for key in keys:
+            self._delete_key(key)
+        result = {"header": self._header()}
+        if keys:
+            result["deleted"] = str(len(keys))
+        return result
+
+    def _compare(self, cmp):
+        key = _unb64(cmp["key"])
+        end = _unb64(cmp.get("range_end"))
+        kvs = [kv for k, kv in self.kvs.items() if self._in_range(k, key, end)]
+        if not kvs:
+            kvs = [None]
+        target = cmp.get("target", "VERSION")
+        result = cmp.get("result", "EQUAL")
+
+        for kv in kvs:
+            if target == "CREATE":
+                actual = kv["create_revision"] if kv else 0
+                expected = int(cmp.get("create_revision", 0))
+            elif target == "MOD":
+                actual = kv["mod_revision"] if kv else 0
+                expected = int(cmp.get("mod_revision", 0))
+            elif target == "VALUE":
+                actual = kv["value"] if kv else b''
+                expected = _unb64(cmp.get("value"))
+            elif target == "LEASE":
+                actual = int(kv.get("lease", 0)) if kv else 0
+                expected = int(cmp.get("lease", 0))
+            else:
+                actual = kv["version"] if kv else 0
+                expected = int(cmp.get("version", 0))
+
+            ok = {
+                "EQUAL": actual == expected,
+                "NOT_EQUAL": actual != expected,
+                "GREATER": actual > expected,
+                "LESS": actual < expected,
+            }[result]
+            if not ok:
+                return False
+        return True
+
+    def txn(self, req):
+        succeeded = all(self._compare(c) for c in req.get("compare", []))
+        ops = req.get("success" if succeeded else "failure", []) or []
+
+        writes = any("request_range" not in op for op in ops)
+        if writes:
+            for op in ops:
+                lease_id = int(
+                    op.get("request_put", {}).get("lease", 0) or 0
+                )
+                if lease_id and lease_id not in self.leases:
+                    raise KeyError("etcdserver: requested lease not found")
+            self.revision += 1
+
+        responses = []
+        for op in ops:
+            if "request_put" in op:
+                put = op["request_put"]
+                self._put_key(
+                    _unb64(put["key"]), _unb64(put.get("value")),
+                    int(put.get("lease", 0) or 0)
+                )
+                responses.append({"response_put": {"header": self._header()}})
+            elif "request_range" in op:
+                responses.append({"response_range": self.range(
+                    op["request_range"]
+                )})
+            elif "request_delete_range" in op:
+                dr = op["request_delete_range"]
+                start = _unb64(dr.get("key"))
+                end = _unb64(dr.get("range_end"))
+                keys = [k for k in self.kvs if self._in_range(k, start, end)]
+                for key in keys:
+                    self._delete_key(key)
+                out = {"header": self._header()}
+                if keys:
+                    out["deleted"] = str(len(keys))
+                responses.append({"response_delete_range": out})
+
+        result = {"header": self._header(), "responses": responses}
+        if succeeded:
+            result["succeeded"] = True
+        return result
+
+    def lease_grant(self, req):
+        ttl = int(req.get("TTL", 0))
+        lease_id = int(req.get("ID", 0) or 0)
+        if lease_id in self.leases:
+            raise KeyError("etcdserver: lease already exists")
+        if not lease_id:
+            self.next_lease += 1
+            lease_id = self.next_lease
+        self.leases[lease_id] = {
+            "ttl": ttl, "expires": time.monotonic() + ttl, "keys": set()
+        }
+        return {"header": self._header(), "ID": str(lease_id),
+                "TTL": str(ttl)}
+
+    def lease_revoke(self, req):
+        if not self._revoke(int(req["ID"])):
+            raise KeyError("etcdserver: requested lease not found")
+        return {"header": self._header()}
+
+    def lease_timetolive(self, req):
+        lease_id = int(req["ID"])
+        lease = self.leases.get(lease_id)
+        if lease is None:
+            return {"header": self._header(), "ID": str(lease_id),
+                    "TTL": "-1"}
+        remaining = max(0, int(lease["expires"] - time.monotonic()))
+        result = {"header": self._header(), "ID": str(lease_id),
+                  "TTL": str(remaining), "grantedTTL": str(lease["ttl"])}
+        if req.get("keys"):
+            result["keys"] = [_b64(k) for k in sorted(lease["keys"])]
+        return result
+
+    def lease_keepalive(self, req):
+        lease_id = int(req["ID"])
+        lease = self.leases.get(lease_id)
+        if lease is None:
+            return {"result": {"header": self._header(), "ID": str(lease_id)}}
+        lease["expires"] = time.monotonic() + lease["ttl"]
+        return {"result": {"header": self._header(), "ID": str(lease_id),
+                           "TTL": str(lease["ttl"])}}
+
+    def lease_leases(self, req):
+        return {"header": self._header(),
+                "leases": [{"ID": str(i)} for i in self.leases]}
+
+    def status(self, req):
+        return {"header": self._header(), "version": "3.5.0-fake",
+                "dbSize": "0", "leader": "1"}
+
+    ROUTES = {
+        "/v3/kv/range": "range",
+        "/v3/kv/put": "put",
+        "/v3/kv/deleterange": "deleterange",
+        "/v3/kv/txn": "txn",
+        "/v3/lease/grant": "lease_grant",
+        "/v3/kv/lease/revoke": "lease_revoke",
+        "/v3/lease/revoke": "lease_revoke",
+        "/v3/kv/lease/timetolive": "lease_timetolive",
+        "/v3/lease/timetolive": "lease_timetolive",
+        "/v3/lease/keepalive": "lease_keepalive",
+        "/v3/lease/leases": "lease_leases",
+        "/v3/maintenance/status": "status",
+    }
+
+    def handle(self, path, req):
+        with self.lock:
+            self.round_trips += 1
+            self.calls[path] = self.calls.get(path, 0) + 1
+            self._expire()
+            return getattr(self, self.ROUTES[path])(req)
+
+    def watch_events(self, req, since):
+        """Block until events newer than since are available"""
+        start = _unb64(req.get("key"))
+        end = _unb64(req.get("range_end"))
+        with self.lock:
+            while True:
+                self._expire()
+                events = [
+                    (rev, kind, kv, prev)
+                    for rev, kind, kv, prev in self.history
+                    if rev > since and self._in_range(kv["key"], start, end)
+                ]
+                if events:
+                    return events, self.revision
+                if self.history and self.history[-1][0] > since:
+                    since = self.history[-1][0]
+                self.lock.wait(timeout=0.25)
+
+    # HTTP plumbing
+    def serve(self, host="127.0.0.1", port=0):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def setup(self):
+                BaseHTTPRequestHandler.setup(self)
+                # Headers and body are separate writes: without this, Nagle
+                # and delayed ACKs add ~40ms to every reply
+                self.request.setsockopt(
+                    socket.IPPROTO_TCP, socket.TCP_NODELAY, 1
+                )
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                req = json.loads(self.rfile.read(length) or b'{}')
+                if fake.latency:
+                    time.sleep(fake.latency)
+
+                if self.path == "/v3/watch":
+                    return self._watch(req.get("create_request", {}))
+
+                if self.path not in fake.ROUTES:
+                    return self._reply(404, {"error": "not found"})
+                try:
+                    body = fake.handle(self.path, req)
+                except KeyError as err:
+                    return self._reply(400, {"error": str(err), "code": 5})
+                self._reply(200, body)
+
+            def _reply(self, code, body):
+                data = json.dumps(body).encode("utf-8")
+                self.send_response(code)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _chunk(self, body):
+                data = json.dumps(body).encode("utf-8") + b'\n'
+                self.wfile.write(b'%x\r\n%s\r\n' % (len(data), data))
+                self.wfile.flush()
+
+            def _watch(self, req):
+                with fake.lock:
+                    fake.round_trips += 1
+                    since = int(req.get("start_revision", 0) or 0) - 1
+                    if since < 0:
+                        since = fake.revision
+                    header = fake._header()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                try:
+                    self._chunk({"result": {"header": header,
+                                            "created": True}})
+                    while True:
+                        events, revision = fake.watch_events(req, since)
+                        out = []
+                        for rev, kind, kv, prev in events:
+                            event = {"kv": fake._encode_kv(kv)
+                                     if kind == "PUT" else {
+                                         "key": _b64(kv["key"]),
+                                         "mod_revision": str(rev)}}
+                            if kind == "DELETE":
+                                event["type"] = "DELETE"
+                            if req.get("prev_kv") and prev:
+                                event["prev_kv"] = fake._encode_kv(prev)
+                            out.append(event)
+                            since = rev
+                        self._chunk({"result": {
+                            "header": {"revision": str(revision)},
+                            "events": out
+                        }})
+                except (BrokenPipeError, ConnectionResetError):
+                    return
+
+        server = ThreadingHTTPServer((host, port), Handler)
+        server.daemon_threads = True
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        return server
+
+
+# Standalone: python benchmarks/fake_etcd.py [port] [latency ms]
+if __name__ == "__main__":
+    import sys
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else 2379
+    latency = float(sys.argv[2]) / 1000 if len(sys.argv) > 2 else 0.0
+
+    server = FakeEtcd(latency).serve(port=port)
+    print(f'fake etcd gateway on {server.server_address}')
+    threading.Event().wait()
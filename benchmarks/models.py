@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+"""
+Microbenchmark every schema model in service.models, per serialization step.
+
+    python -m benchmarks.models                   # every model
+    python -m benchmarks.models -m Reservation Project -n 20000
+
+Per model, microseconds per call: building it validated and unvalidated
+(construct, as the storage backends do), rendering it the way FastAPI does
+for a response model (revalidate, jsonable_encoder, json) and in one pass
+(service.codec.dump_models), and decoding its stored value as JSON and as
+msgpack (with the stored sizes).  Name validation is timed last.
+"""
+
+
+import argparse
+import inspect
+import json
+import sys
+import timeit
+
+import validators
+from fastapi.encoders import jsonable_encoder
+from fastapi.utils import create_response_field
+from pydantic import BaseModel
+
+from service import codec, models
+
+
+# A typical instance of every model, as field values
+RESERVATION = {
+    "project": "vxlan-evpn-core", "email": "student@example.com",
+    "id": 7587000000000000001, "ttl": 3600
+}
+SAMPLES = {
+    "Version": {"version": "0.3.0"},
+    "ProjectCore": {"name": "vxlan-evpn-core", "title": "VXLAN EVPN Core"},
+    "Project": {
+        "name": "vxlan-evpn-core", "title": "VXLAN EVPN Core",
+        "description": "An environment to demonstrate VXLAN EVPN."
+    },
+    "ScenarioCore": {
+        "name": "vpc-bgw-as-dci", "title": "vPC BGW as DCI",
+        "project": "vxlan-evpn-core"
+    },
+    "Scenario": {
+        "name": "vpc-bgw-as-dci", "title": "vPC BGW as DCI",
+        "project": "vxlan-evpn-core",
+        "description": "An environment to demonstrate VXLAN EVPN."
+    },
+    "BulkResult": {"name": "vxlan-evpn-core", "status_code": 200},
+    "LeaseRequest": {"ttl": 3600},
+    "Lease": {"ttl": 3600, "id": 7587000000000000001},
+    "ReservationEmail": {"email": "student@example.com"},
+    "ReservationProject": {"project": "vxlan-evpn-core"},
+    "ReservationCore": {
+        "project": "vxlan-evpn-core", "email": "student@example.com"
+    },
+    "Reservation": RESERVATION,
+    "ReservationRenewal": {
+        "email": "student@example.com", "duration": 3600, "auto": False
+    },
+    "WaitlistInput": {
+        "email": "student@example.com", "duration": 3600, "priority": 0
+    },
+    "Waiter": {
+        "project": "vxlan-evpn-core", "email": "student@example.com",
+        "duration": 3600, "priority": 0, "position": 1
+    },
+    "WaitlistStatus": {
+        "project": "vxlan-evpn-core", "email": "student@example.com",
+        "reservation": RESERVATION
+    },
+}
+# Input models are their schema plus validators
+SAMPLES["ProjectInput"] = SAMPLES["Project"]
+SAMPLES["ScenarioInput"] = SAMPLES["Scenario"]
+SAMPLES["ReservationInput"] = dict(
+    SAMPLES["ReservationCore"], duration=3600
+)
+
+
+def schema_models() -> dict:
+    return {
+        name: model for name, model in inspect.getmembers(models)
+        if inspect.isclass(model) and issubclass(model, BaseModel)
+        and model is not BaseModel
+    }
+
+
+def per_call(fn, number: int) -> float:
+    # Best of 3, in microseconds
+    return min(timeit.repeat(fn, number=number, repeat=3)) / number * 1e6
+
+
+def fastapi_render(field, instance) -> bytes:
+    # What a route with a response model does with an endpoint's result
+    value, _ = field.validate(instance, {}, loc=("response",))
+    return json.dumps(
+        jsonable_encoder(value), ensure_ascii=False, separators=(",", ":")
+    ).encode("utf-8")
+
+
+def measure(model, sample: dict, number: int) -> dict:
+    instance = model(**sample)
+    field = create_response_field(name=model.__name__, type_=model)
+    stored_json = codec.dumps_json(sample)
+    stored_msgpack = codec.dumps_msgpack(sample)
+
+    # Both renderings must agree before their speed means anything
+    assert fastapi_render(field, instance) == codec.dump_models(instance)
+
+    return {
+        "validate": per_call(lambda: model(**sample), number),
+        "construct": per_call(lambda: model.construct(**sample), number),
+        "fastapi": per_call(lambda: fastapi_render(field, instance), number),
+        "one_pass": per_call(lambda: codec.dump_models(instance), number),
+        "json_in": per_call(lambda: json.loads(stored_json), number),
+        "codec_json": per_call(lambda: codec.loads(stored_json), number),
+        "msgpack": per_call(lambda: codec.loads(stored_msgpack), number),
+        "json_bytes": len(stored_json),
+        "msgpack_bytes": len(stored_msgpack),
+    }
+
+
+def report(results: dict):
+    columns = (
+        "validate", "construct", "fastapi", "one_pass",
+        "json_in", "codec_json", "msgpack"
+    )
+    print(
+        f'{"model":<20}' + ''.join(f'{c:>11}' for c in columns)
+        + f'{"bytes":>11}'
+    )
+    for name, r in results.items():
+        print(
+            f'{name:<20}' + ''.join(f'{r[c]:>11.2f}' for c in columns)
+            + f'{r["json_bytes"]:>6}/{r["msgpack_bytes"]:<4}'
+        )
+
+
+def report_names(number: int):
+    name = "vxlan-evpn-core"
+    print(f'\n{"name validation":<20}{"us/call":>11}')
+    for label, fn in (
+        ("validators.url", lambda: validators.url(f'http://localhost/{name}')),
+        ("valid_url_path", lambda: models.valid_url_path(name)),
+        ("valid_url_path %", lambda: models.valid_url_path("a%20b")),
+    ):
+        print(f'{label:<20}{per_call(fn, number):>11.2f}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    available = schema_models()
+    parser.add_argument(
+        '-m', '--models', nargs='+', choices=sorted(available),
+        default=sorted(available)
+    )
+    parser.add_argument(
+        '-n', '--number', type=int, default=10000,
+        help='calls per timing (default 10000)'
+    )
+    args = parser.parse_args()
+
+    missing = sorted(set(available) - set(SAMPLES))
+    if missing:
+        sys.exit(f'No benchmark sample for {", ".join(missing)}')
+
+    report({
+        name: measure(available[name], SAMPLES[name], args.number)
+        for name in args.models
+    })
+    report_names(args.number)
+
+
+if __name__ == "__main__":
+    main()
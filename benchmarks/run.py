@@ -0,0 +1,338 @@
+#!/usr/bin/env python3
+"""
+Benchmark the conductor API in process, per storage backend and request mix.
+
+    python -m benchmarks.run                      # every backend and mix
+    python -m benchmarks.run -b local etcd -m list --latency 2
+    python -m benchmarks.run --save main          # keep as a baseline
+    python -m benchmarks.run --compare main       # exit 1 on regressions
+
+Requests go straight to the ASGI app (no sockets), so what is measured is
+the service plus its storage.  etcd backends talk to benchmarks.fake_etcd,
+which adds --latency milliseconds to every round trip.
+"""
+
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+import httpx
+
+from benchmarks.fake_etcd import FakeEtcd
+
+
+BASELINES = os.path.join(os.path.dirname(__file__), 'baselines')
+
+# Backend name -> conductor environment
+BACKENDS = {
+    "local": {"CONDUCTOR_STORAGE_TYPE": "LOCAL"},
+    "sqlite": {"CONDUCTOR_STORAGE_TYPE": "SQLITE"},
+    "etcd": {"CONDUCTOR_STORAGE_TYPE": "ETCD", "CONDUCTOR_STORAGE_ASYNC": "1"},
+    "etcd-sync": {
+        "CONDUCTOR_STORAGE_TYPE": "ETCD", "CONDUCTOR_STORAGE_ASYNC": "0"
+    },
+    "etcd-cache": {
+        "CONDUCTOR_STORAGE_TYPE": "ETCD", "CONDUCTOR_STORAGE_CACHE": "1"
+    },
+}
+
+# Catalog every run starts from
+SEED_PROJECTS = 200
+SEED_SCENARIOS = 400
+
+
+# Request mixes: each step sends one or more requests for worker n
+async def list_heavy(client: httpx.AsyncClient, n: int, step: int):
+    pick = random.random()
+    if pick < 0.4:
+        await request(client, 'GET', '/project/')
+    elif pick < 0.7:
+        await request(client, 'GET', '/scenario/')
+    elif pick < 0.8:
+        await request(client, 'GET', '/reserve/project/')
+    elif pick < 0.9:
+        project = random.randrange(SEED_PROJECTS)
+        await request(client, 'GET', f'/scenario/?project=bench-{project}')
+    else:
+        await request(
+            client, 'GET', f'/project/bench-{random.randrange(SEED_PROJECTS)}'
+        )
+
+
+async def reservation_churn(client: httpx.AsyncClient, n: int, step: int):
+    # Each worker reserves, checks and releases its own project
+    project = f'bench-{n}'
+    email = f'worker-{n}@bench.example.com'
+
+    await request(client, 'POST', '/reserve/project/', json={
+        "project": project, "email": email, "duration": 60
+    })
+    await request(client, 'GET', f'/reserve/project/{project}')
+    await request(
+        client, 'DELETE', f'/reserve/project/{project}', json={"email": email}
+    )
+
+
+async def create_burst(client: httpx.AsyncClient, n: int, step: int):
+    await request(client, 'POST', '/project/', json={
+        "name": f'burst-{n}-{step}', "title": "Burst",
+        "description": "Created by the create burst benchmark"
+    })
+
+
+MIXES = {
+    "list": list_heavy,
+    "churn": reservation_churn,
+    "burst": create_burst,
+}
+
+
+# Measurement
+latencies = []
+
+
+async def request(client: httpx.AsyncClient, method: str, url: str, **kwargs):
+    started = time.perf_counter()
+    response = await client.request(method, url, **kwargs)
+    latencies.append(time.perf_counter() - started)
+
+    if response.status_code >= 400:
+        raise RuntimeError(f'{method} {url}: {response.status_code}')
+
+
+async def seed(client: httpx.AsyncClient):
+    await client.post('/project/bulk', json=[
+        {"name": f'bench-{i}', "title": f'Project {i}', "description": "-"}
+        for i in range(SEED_PROJECTS)
+    ])
+    await client.post('/scenario/bulk', json=[
+        {
+            "name": f'bench-{i}', "title": f'Scenario {i}',
+            "description": "-", "project": f'bench-{i % SEED_PROJECTS}'
+        }
+        for i in range(SEED_SCENARIOS)
+    ])
+
+
+async def check_headers(client: httpx.AsyncClient):
+    # Paged reads must carry their cursor and entity tag, or clients can
+    # neither page on nor revalidate
+    for url in ('/project/?limit=2', '/scenario/?limit=2'):
+        response = await client.get(url)
+        missing = [
+            header for header in ('ETag', 'X-Next-Cursor')
+            if header not in response.headers
+        ]
+        if missing:
+            raise RuntimeError(f'GET {url}: no {", ".join(missing)}')
+
+        revalidated = await client.get(
+            url, headers={'If-None-Match': response.headers['ETag']}
+        )
+        if revalidated.status_code != 304:
+            raise RuntimeError(
+                f'GET {url}: {revalidated.status_code} for its own ETag'
+            )
+
+
+async def run_mix(app, mix, concurrency: int, steps: int, etcd: FakeEtcd):
+    transport = httpx.ASGITransport(app=app)
+
+    async with httpx.AsyncClient(
+        transport=transport, base_url='http://bench'
+    ) as client:
+        await seed(client)
+        await check_headers(client)
+
+        # Warm up (lazy backend construction, caches, connection pools)
+        await asyncio.gather(*[mix(client, n, -1) for n in range(concurrency)])
+
+        latencies.clear()
+        round_trips = etcd.round_trips if etcd else 0
+        started = time.perf_counter()
+
+        async def worker(n):
+            for step in range(steps):
+                await mix(client, n, step)
+
+        await asyncio.gather(*[worker(n) for n in range(concurrency)])
+        elapsed = time.perf_counter() - started
+
+    count = len(latencies)
+    ordered = sorted(latencies)
+    return {
+        "requests": count,
+        "p50_ms": round(statistics.median(ordered) * 1000, 3),
+        "p99_ms": round(ordered[min(count - 1, int(count * 0.99))] * 1000, 3),
+        "throughput_rps": round(count / elapsed, 1),
+        "round_trips_per_request": (
+            round((etcd.round_trips - round_trips) / count, 3) if etcd else None
+        ),
+    }
+
+
+def run_backend(backend: str, mix: str, args) -> dict:
+    etcd = None
+    environment = dict(BACKENDS[backend])
+
+    if environment["CONDUCTOR_STORAGE_TYPE"] == "ETCD":
+        etcd = FakeEtcd(latency=args.latency / 1000)
+        server = etcd.serve()
+        environment["CONDUCTOR_STORAGE_HOST"] = server.server_address[0]
+        environment["CONDUCTOR_STORAGE_PORT"] = str(server.server_address[1])
+
+    # Local backends write under the working directory
+    os.chdir(tempfile.mkdtemp(prefix='conductor-bench-'))
+    for key in ("CONDUCTOR_STORAGE_ASYNC", "CONDUCTOR_STORAGE_CACHE"):
+        os.environ.pop(key, None)
+    os.environ.update(environment)
+
+    # Fresh storage service for the (shared) app, chosen the usual way
+    from service import conductor
+    from service.metrics import InstrumentedStorage
+    conductor.storage_service = conductor.select_storage()
+    conductor.storage_service.wrapper = InstrumentedStorage
+    conductor.reservation_events.storage_service = conductor.storage_service
+    conductor.auto_renewal.storage_service = conductor.storage_service
+    conductor.waitlist.storage_service = conductor.storage_service
+    conductor.rate_limiter.storage_service = conductor.storage_service
+
+    async def measure():
+        try:
+            return await run_mix(
+                conductor.app, MIXES[mix], args.concurrency, args.steps, etcd
+            )
+        finally:
+            await conductor.storage_service.close()
+
+    try:
+        return asyncio.run(measure())
+    finally:
+        if etcd:
+            server.shutdown()
+
+
+# Baselines
+def compare(results: dict, baseline: dict, tolerance: float) -> list:
+    """Regressions of results against a saved baseline, as messages"""
+
+    regressions = []
+    for name, result in results.items():
+        base = baseline.get(name)
+        if not base:
+            continue
+
+        if result["p99_ms"] > base["p99_ms"] * (1 + tolerance):
+            regressions.append(
+                f'{name}: p99 {base["p99_ms"]} -> {result["p99_ms"]} ms'
+            )
+        if result["throughput_rps"] < base["throughput_rps"] * (1 - tolerance):
+            regressions.append(
+                f'{name}: throughput {base["throughput_rps"]} -> '
+                f'{result["throughput_rps"]} req/s'
+            )
+        # Round trips do not depend on the machine: any increase counts
+        if (result["round_trips_per_request"] or 0) > \
+                (base["round_trips_per_request"] or 0) + 0.01:
+            regressions.append(
+                f'{name}: round trips/request '
+                f'{base["round_trips_per_request"]} -> '
+                f'{result["round_trips_per_request"]}'
+            )
+
+    return regressions
+
+
+def report(results: dict):
+    print(
+        f'{"benchmark":<22} {"requests":>9} {"p50 ms":>9} {"p99 ms":>9} '
+        f'{"req/s":>9} {"trips/req":>10}'
+    )
+    for name, r in results.items():
+        trips = r["round_trips_per_request"]
+        print(
+            f'{name:<22} {r["requests"]:>9} {r["p50_ms"]:>9.2f} '
+            f'{r["p99_ms"]:>9.2f} {r["throughput_rps"]:>9.1f} '
+            f'{"-" if trips is None else trips:>10}'
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument(
+        '-b', '--backends', nargs='+', choices=BACKENDS, default=list(BACKENDS)
+    )
+    parser.add_argument(
+        '-m', '--mixes', nargs='+', choices=MIXES, default=list(MIXES)
+    )
+    parser.add_argument(
+        '-c', '--concurrency', type=int, default=16,
+        help='concurrent clients (default 16)'
+    )
+    parser.add_argument(
+        '-n', '--steps', type=int, default=20,
+        help='mix steps per client (default 20)'
+    )
+    parser.add_argument(
+        '--latency', type=float, default=1.0,
+        help='fake etcd round trip latency in ms (default 1)'
+    )
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--save', metavar='NAME', help='save as a baseline')
+    parser.add_argument(
+        '--compare', metavar='NAME', help='compare with a saved baseline'
+    )
+    parser.add_argument(
+        '--tolerance', type=float, default=0.2,
+        help='allowed latency/throughput change when comparing (default 0.2)'
+    )
+    args = parser.parse_args()
+
+    # The app reads its storage configuration when first imported
+    os.environ.setdefault('CONDUCTOR_STORAGE_TYPE', 'LOCAL')
+    sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+    cwd = os.getcwd()
+    os.chdir(tempfile.mkdtemp(prefix='conductor-bench-'))
+
+    results = {}
+    for mix in args.mixes:
+        for backend in args.backends:
+            print(f'Running {mix}/{backend}', file=sys.stderr)
+            random.seed(args.seed)
+            results[f'{mix}/{backend}'] = run_backend(backend, mix, args)
+
+    os.chdir(cwd)
+    report(results)
+
+    if args.save:
+        os.makedirs(BASELINES, exist_ok=True)
+        with open(os.path.join(BASELINES, f'{args.save}.json'), 'w') as out:
+            json.dump({
+                "settings": {
+                    "concurrency": args.concurrency, "steps": args.steps,
+                    "latency_ms": args.latency,
+                },
+                "results": results,
+            }, out, indent=2)
+
+    if args.compare:
+        with open(os.path.join(BASELINES, f'{args.compare}.json')) as infile:
+            baseline = json.load(infile)["results"]
+
+        regressions = compare(results, baseline, args.tolerance)
+        for regression in regressions:
+            print(f'REGRESSION {regression}')
+        if regressions:
+            sys.exit(1)
+        print(f'No regressions against {args.compare}')
+
+
+if __name__ == "__main__":
+    main()
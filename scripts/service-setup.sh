@@ -2,7 +2,74 @@
 
 # These are the default values for the Conducter service
 
-# Valid options for CONDUCTOR_STORAGE_TYPE:  ETCD or LOCAL
+# Valid options for CONDUCTOR_STORAGE_TYPE:  ETCD, LOCAL or SQLITE
 export CONDUCTOR_STORAGE_TYPE="ETCD"
+
+# etcd members, comma-separated (host or host:port) for failover
 export CONDUCTOR_STORAGE_HOST="localhost"
 export CONDUCTOR_STORAGE_PORT="2379"
+
+# Serve etcd reads from a watch-driven in-process cache (0 or 1)
+export CONDUCTOR_STORAGE_CACHE="0"
+export CONDUCTOR_CACHE_STALENESS="5"
+
+# Non-blocking etcd client (0 or 1) and its connection pool size
+export CONDUCTOR_STORAGE_ASYNC="1"
+export CONDUCTOR_STORAGE_POOL="100"
+
+# etcd call timeout (s) and retries of reads on another member
+export CONDUCTOR_STORAGE_TIMEOUT="5"
+export CONDUCTOR_STORAGE_RETRIES="2"
+
+# Share one etcd lease among reservations expiring in the same window (s),
+# 0 for a lease per reservation
+export CONDUCTOR_LEASE_WINDOW="0"
+
+# Value encoding for etcd writes, json or msgpack (read either way;
+# msgpack only once every worker runs a release that reads it)
+export CONDUCTOR_STORAGE_CODEC="json"
+
+# Prefix of every etcd key (say /lab-a), so deployments can share a cluster
+export CONDUCTOR_STORAGE_NAMESPACE=""
+
+# Spread projects over several etcd clusters: ';'-separated, each its
+# members as above, optionally named (name=host1,host2); replaces _HOST
+# and the cache/async clients.  Empty for one cluster
+export CONDUCTOR_STORAGE_SHARDS=""
+
+# Seconds between auto-renewal passes, run by one elected worker (0
+# disables auto-renewal)
+export CONDUCTOR_AUTO_RENEW_INTERVAL="0"
+
+# Seconds between waitlist hand-off sweeps (0: reservation watch only)
+export CONDUCTOR_WAITLIST_SWEEP="5"
+
+# Seconds a waiter is kept without polling its status (0: until served)
+export CONDUCTOR_WAITLIST_TTL="300"
+
+# Rate limits (requests a second, 0 disables; bursts of up to _BURST) per
+# client address and per reservation email, shared between workers
+export CONDUCTOR_RATE_CLIENT="0"
+export CONDUCTOR_RATE_CLIENT_BURST="10"
+export CONDUCTOR_RATE_EMAIL="0"
+export CONDUCTOR_RATE_EMAIL_BURST="10"
+
+# Seconds between rate limit usage exchanges between workers
+export CONDUCTOR_RATE_SYNC="1"
+
+# Requests in progress per worker before new ones get 503 (0 disables)
+export CONDUCTOR_MAX_INFLIGHT="0"
+
+# /ready storage probe timeout (s) and application() cold start budget (ms)
+export CONDUCTOR_READY_TIMEOUT="1"
+export CONDUCTOR_STARTUP_BUDGET_MS="50"
+
+# Messages queued per reservation events (SSE) subscriber before dropping it
+export CONDUCTOR_EVENTS_QUEUE="100"
+
+# Server-Timing response header with storage/serialization split (0 or 1)
+export CONDUCTOR_SERVER_TIMING="0"
+
+# Snapshot export/import routes under /admin (0 or 1); they read and
+# replace everything, unauthenticated: only on a trusted network
+export CONDUCTOR_ADMIN_ROUTES="0"
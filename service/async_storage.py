@@ -0,0 +1,546 @@
+#!/usr/bin/env python3
+
+
+import asyncio
+import math
+import time
+from typing import List
+
+import httpx
+import orjson
+from etcd3gw import exceptions as etcd_exceptions
+from etcd3gw.utils import _decode, _encode, _increment_last_byte
+from starlette.concurrency import run_in_threadpool
+
+from service.codec import loads
+from service.etcd_client import IDEMPOTENT, UNAVAILABLE
+from service.etcd_txn import _txn_absent, _txn_present, _txn_put, _txn_count
+from service.etcd_txn import _txn_delete, _txn_get, _txn_got, _txn_leased
+from service.etcd_txn import _txn_unchanged, _expired, _remaining
+from service.exceptions import ProjectNameNotFound, ProjectNameExists
+from service.exceptions import ScenarioNameNotFound, ScenarioNameExists
+from service.exceptions import ReservationNameNotFound, ReservationExists
+from service.exceptions import StorageException
+from service.storage import AsyncStorage, EtcdStorage
+from service.storage import LeaseBuckets, _scenario_index
+from service.storage import _collection_revision, _kvs_revision
+from service.storage import _txn_page, _txn_newest, _txn_tagged_page
+
+from service.models import ProjectCore, ScenarioCore
+from service.models import ReservationCore, Reservation
+from service.models import Lease
+
+
+class AsyncEtcdStorage(AsyncStorage):
+    """
+    Non-blocking etcd backend talking to the v3 JSON gateway over a pooled
+    keep-alive httpx.AsyncClient, so one worker can keep many storage calls
+    in flight.  Request paths (reads, creates, leases) are native; anything
+    else falls back to the synchronous EtcdStorage in the threadpool.
+    """
+
+    def __init__(
+        self,
+        etcd_service="localhost",
+        etcd_port=2379,
+        max_connections=100,
+        timeout=5.0,
+        retries=2,
+        lease_window=0,
+        codec="json",
+        namespace=""
+    ):
+        # Members, their health, the retry policy, the codec and the key
+        # namespace are shared
+        AsyncStorage.__init__(self, EtcdStorage(
+            etcd_service=etcd_service, etcd_port=etcd_port,
+            timeout=timeout, retries=retries, lease_window=lease_window,
+            codec=codec, namespace=namespace
+        ))
+
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_connections
+        )
+        connect, read = self._sync.storage_service.timeout
+        self.timeout = httpx.Timeout(read, connect=connect)
+        self._client = None
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        # Created on first use so it binds to the serving event loop
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                limits=self.limits, timeout=self.timeout
+            )
+        return self._client
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def save_data(self):
+        pass
+
+    async def load_data(self):
+        pass
+
+    async def ping(self, timeout: float = 1.0) -> bool:
+        await self._post('/maintenance/status', {}, timeout=timeout)
+        return True
+
+    # etcd gateway plumbing (mirrors PooledEtcd3Client.post failover)
+    async def _post(self, path: str, payload: dict, **kwargs) -> dict:
+        etcd = self._sync.storage_service
+        idempotent = path in IDEMPOTENT
+        tried = []
+
+        if etcd.namespace:
+            payload = etcd.namespace.request(path, payload)
+
+        for attempt in range(etcd.retries + 1):
+            endpoint = etcd.endpoints.pick(exclude=tried)
+            tried.append(endpoint)
+            last = attempt == etcd.retries
+
+            started = time.monotonic()
+            try:
+                resp = await self.client.post(
+                    etcd.member_url(endpoint, path), json=payload, **kwargs
+                )
+            except httpx.TransportError as ex:
+                etcd.endpoints.failed(endpoint)
+                # Connect failures were never sent, so even writes can move
+                not_sent = isinstance(
+                    ex, (httpx.ConnectError, httpx.ConnectTimeout)
+                )
+                if not last and (idempotent or not_sent):
+                    await asyncio.sleep(etcd.endpoints.backoff(attempt))
+                    continue
+
+                if isinstance(ex, httpx.TimeoutException):
+                    raise etcd_exceptions.ConnectionTimeoutError(str(ex))
+                raise etcd_exceptions.ConnectionFailedError(str(ex))
+
+            if resp.status_code in UNAVAILABLE:
+                etcd.endpoints.failed(endpoint)
+                if not last and idempotent:
+                    await asyncio.sleep(etcd.endpoints.backoff(attempt))
+                    continue
+            else:
+                etcd.endpoints.succeeded(endpoint, time.monotonic() - started)
+
+            if resp.status_code != httpx.codes.OK:
+                raise etcd_exceptions.Etcd3Exception(
+                    resp.text, resp.reason_phrase
+                )
+
+            result = orjson.loads(resp.content)
+            if etcd.namespace:
+                return etcd.namespace.response(path, result)
+            return result
+
+    async def _range(self, key: str, prefix: bool = True, **kwargs) -> dict:
+        payload = {"key": _encode(key)}
+        if prefix:
+            payload["range_end"] = _encode(_increment_last_byte(key))
+        payload.update(kwargs)
+
+        result = await self._post('/kv/range', payload)
+
+        for item in result.get("kvs", []):
+            item["key"] = _decode(item["key"])
+            item["value"] = _decode(item.get("value", ""))
+
+        return result
+
+    async def _range_page(self, prefix: str, limit: int, cursor: str = None):
+        # Start just past the cursor's key, still ending at the prefix end
+        result = await self._range(
+            f'{prefix}{cursor}\0' if cursor else prefix, limit=limit,
+            range_end=_encode(_increment_last_byte(prefix))
+        )
+        items = self._names(result)
+
+        return items, items[-1][0] if items and result.get("more") else None
+
+    async def _get(self, key: str):
+        result = await self._range(key, prefix=False)
+        kvs = result.get("kvs", [])
+        return loads(kvs[0]["value"]) if kvs else None
+
+    async def _txn(self, compare: list, success: list, failure: list = None):
+        result = await self._post('/kv/txn', {
+            "compare": compare, "success": success, "failure": failure or []
+        })
+
+        return result.get("succeeded", False), result.get("responses", [])
+
+    @staticmethod
+    def _names(result: dict):
+        return [
+            (item["key"].decode("utf-8").split('/')[-1], item)
+            for item in result.get("kvs", [])
+        ]
+
+    async def get_revision(
+        self, kind: str, name: str = None, project: str = None
+    ):
+        prefixes = self._sync.PREFIXES
+
+        if self._sync._untagged(kind, name):
+            return None
+
+        if name:
+            result = await self._range(
+                f'{prefixes[kind]}{name}', prefix=False, keys_only=True
+            )
+            kvs = result.get("kvs", [])
+            return kvs[0]["mod_revision"] if kvs else None
+
+        if kind == "scenario" and project:
+            if not self._sync._scenarios_indexed:
+                await run_in_threadpool(self._sync._index_scenarios)
+            prefix = _scenario_index(project)
+        else:
+            prefix = prefixes[kind]
+
+        result = await self._range(
+            prefix, keys_only=True, limit=1, sort_target=3, sort_order=2
+        )
+        return _collection_revision(result.get("kvs", []), result)
+
+    async def get_tagged(
+        self, kind: str, name=None, project=None, limit=None, cursor=None
+    ):
+        # One round trip, tagged as EtcdStorage.get_tagged does
+        prefixes = self._sync.PREFIXES
+
+        # Single reservations are not tagged by the API (remaining time)
+        if name and kind == "reservation":
+            return await run_in_threadpool(self._sync.get_tagged, kind, name)
+
+        if self._sync._untagged(kind):
+            if limit:
+                return await self.get_reservations_page(limit, cursor), None
+            return await self.get_reservations_bulk(), None
+
+        if name:
+            result = await self._range(f'{prefixes[kind]}{name}', prefix=False)
+            kvs = result.get("kvs", [])
+            if not kvs:
+                raise ProjectNameNotFound(name) if kind == "project" \
+                    else ScenarioNameNotFound(name)
+
+            build = self._sync._build_project if kind == "project" \
+                else self._sync._build_scenario
+            return build(name, loads(kvs[0]["value"])), kvs[0]["mod_revision"]
+
+        if kind == "scenario" and project:
+            if not self._sync._scenarios_indexed:
+                await run_in_threadpool(self._sync._index_scenarios)
+            prefix = _scenario_index(project)
+        else:
+            prefix = prefixes[kind]
+
+        if limit:
+            _, responses = await self._txn([], [
+                _txn_page(prefix, limit, cursor), _txn_newest(prefix)
+            ])
+            (items, next_cursor), revision = \
+                _txn_tagged_page(responses, prefix)
+            return (await self._summaries(kind, items), next_cursor), revision
+
+        result = await self._range(prefix)
+        kvs = result.get("kvs", [])
+        return await self._summaries(kind, self._names(result)), \
+            _kvs_revision(kvs)
+
+    async def _summaries(self, kind: str, items: list) -> list:
+        entries = [(name, loads(item["value"])) for name, item in items]
+
+        if kind == "reservation":
+            return await self._build_reservations(entries)
+
+        build = self._sync._build_project if kind == "project" \
+            else self._sync._build_scenario
+        return [build(name, data, core=True) for name, data in entries]
+
+    # Data handling routines
+    async def get_project(self, name, core=False):
+        data = await self._get(f'/project/{name}')
+
+        if data is None:
+            raise ProjectNameNotFound(name)
+
+        return self._sync._build_project(name, data, core)
+
+    async def get_project_list(self) -> List[str]:
+        result = await self._range('/project/', keys_only=True)
+        return [name for name, _ in self._names(result)]
+
+    async def get_projects_bulk(self, core=True) -> List[ProjectCore]:
+        result = await self._range('/project/')
+        return [
+            self._sync._build_project(name, loads(item["value"]), core)
+            for name, item in self._names(result)
+        ]
+
+    async def get_projects_page(self, limit, cursor=None, core=True):
+        items, next_cursor = await self._range_page('/project/', limit, cursor)
+
+        return [
+            self._sync._build_project(name, loads(item["value"]), core)
+            for name, item in items
+        ], next_cursor
+
+    async def create_project(self, name, title, description):
+        data = {'title': title, 'description': description}
+        key = f'/project/{name}'
+
+        succeeded, _ = await self._txn(
+            [_txn_absent(key)], [_txn_put(key, self._sync._dumps(data))]
+        )
+        if not succeeded:
+            raise ProjectNameExists(name)
+
+        return self._sync._build_project(name, data)
+
+    async def get_scenario(self, name, core=False):
+        data = await self._get(f'/scenario/{name}')
+
+        if data is None:
+            raise ScenarioNameNotFound(name)
+
+        return self._sync._build_scenario(name, data, core)
+
+    async def get_scenario_list(self) -> List[str]:
+        result = await self._range('/scenario/', keys_only=True)
+        return [name for name, _ in self._names(result)]
+
+    async def get_scenarios_bulk(self, core=True) -> List[ScenarioCore]:
+        result = await self._range('/scenario/')
+        return [
+            self._sync._build_scenario(name, loads(item["value"]), core)
+            for name, item in self._names(result)
+        ]
+
+    async def get_scenarios_page(
+        self, limit, cursor=None, core=True, project=None
+    ):
+        if project:
+            if not self._sync._scenarios_indexed:
+                await run_in_threadpool(self._sync._index_scenarios)
+            prefix = _scenario_index(project)
+        else:
+            prefix = '/scenario/'
+
+        items, next_cursor = await self._range_page(prefix, limit, cursor)
+
+        return [
+            self._sync._build_scenario(name, loads(item["value"]), core)
+            for name, item in items
+        ], next_cursor
+
+    async def create_scenario(self, name, title, description, project):
+        data = {
+            "title": title,
+            "description": description,
+            "project": project
+        }
+        key = f'/scenario/{name}'
+
+        succeeded, responses = await self._txn(
+            [_txn_absent(key), _txn_present(f'/project/{project}')],
+            [
+                _txn_put(key, self._sync._dumps(data)),
+                _txn_put(_scenario_index(project, name), self._sync._dumps(data))
+            ],
+            [_txn_count(key)]
+        )
+        if not succeeded:
+            if int(responses[0]["response_range"].get("count", 0)):
+                raise ScenarioNameExists(name)
+            raise ProjectNameNotFound(project)
+
+        return self._sync._build_scenario(name, data)
+
+    async def get_scenarios_by_project(
+        self, project, core=True
+    ) -> List[ScenarioCore]:
+        if not self._sync._scenarios_indexed:
+            await run_in_threadpool(self._sync._index_scenarios)
+
+        result = await self._range(_scenario_index(project))
+        return [
+            self._sync._build_scenario(name, loads(item["value"]), core)
+            for name, item in self._names(result)
+        ]
+
+    async def get_reservation_list(self) -> List[str]:
+        # Values too: on a shared lease an expired reservation keeps its key
+        result = await self._range('/reservation/project/')
+        return [
+            name for name, item in self._names(result)
+            if not _expired(loads(item["value"]))
+        ]
+
+    async def get_reservation_count(self) -> int:
+        # A count only read, unless shared leases keep expired keys around
+        if self._sync.lease_buckets is not None:
+            return len(await self.get_reservation_list())
+
+        result = await self._range('/reservation/project/', count_only=True)
+        return int(result.get("count", 0))
+
+    async def get_reservation(self, name: str, core: bool = False):
+        data = await self._get(f'/reservation/project/{name}')
+
+        if data is None or _expired(data):
+            raise ReservationNameNotFound(name)
+
+        return await self._build_reservation(name, data, core)
+
+    async def get_reservations_bulk(self, core=True) -> List[ReservationCore]:
+        result = await self._range('/reservation/project/')
+
+        return await self._build_reservations([
+            (name, loads(item["value"]))
+            for name, item in self._names(result)
+        ], core)
+
+    async def get_reservations_page(self, limit, cursor=None, core=True):
+        items, next_cursor = await self._range_page(
+            '/reservation/project/', limit, cursor
+        )
+
+        return await self._build_reservations([
+            (name, loads(item["value"])) for name, item in items
+        ], core), next_cursor
+
+    async def _build_reservations(self, items: list, core: bool = True):
+        items = [(name, data) for name, data in items if not _expired(data)]
+
+        if core:
+            return [
+                ReservationCore.construct(project=name, email=data["email"])
+                for name, data in items
+            ]
+
+        # Remaining time from stored expiries; leases of older records
+        # (no expiry stored) are asked once each, concurrently
+        legacy = list({int(d["id"]) for _, d in items if "expires" not in d})
+        ttls = dict(zip(legacy, await asyncio.gather(*[
+            self._lease_ttl(id) for id in legacy
+        ])))
+
+        return [
+            Reservation.construct(
+                project=name, email=data["email"], id=int(data["id"]),
+                ttl=(
+                    _remaining(data) if "expires" in data
+                    else ttls[int(data["id"])]
+                )
+            )
+            for name, data in items
+        ]
+
+    async def _lease_ttl(self, id: int) -> int:
+        result = await self._post('/kv/lease/timetolive', {"ID": id})
+        return int(result["TTL"])
+
+    async def _build_reservation(self, name: str, data: dict, core=False):
+        if core:
+            return ReservationCore.construct(project=name, email=data["email"])
+
+        # The lease may be shared and outlast the reservation
+        return Reservation.construct(
+            project=name, email=data["email"], id=int(data["id"]),
+            ttl=(
+                _remaining(data) if "expires" in data
+                else await self._lease_ttl(int(data["id"]))
+            )
+        )
+
+    async def get_lease_count(self) -> int:
+        result = await self._post('/lease/leases', {})
+        return len(result.get("leases", []))
+
+    async def create_lease(self, duration: int) -> Lease:
+        result = await self._post('/lease/grant', {"TTL": duration, "ID": 0})
+
+        return Lease(ttl=duration, id=int(result["ID"]))
+
+    async def _reservation_lease(self, granted: float, duration: int):
+        # As EtcdStorage._reservation_lease, sharing its known windows
+        buckets = self._sync.lease_buckets
+        if buckets is None:
+            return await self.create_lease(duration)
+
+        id, end = buckets.bucket(granted + duration)
+        if not buckets.granted(id):
+            try:
+                await self._post('/lease/grant', {
+                    "TTL": math.ceil(end - time.time()), "ID": id
+                })
+            except etcd_exceptions.Etcd3Exception as err:
+                if 'lease already exists' not in str(err.detail_text):
+                    raise
+            buckets.add(id, end)
+
+        return Lease(ttl=duration, id=id)
+
+    async def revoke_lease(self, id: int) -> bool:
+        try:
+            await self._post('/kv/lease/revoke', {"ID": id})
+        except etcd_exceptions.Etcd3Exception:
+            raise StorageException(status_message='Lease revocation failed')
+
+        return True
+
+    async def release_reservation(self, name: str, id: int) -> bool:
+        if not LeaseBuckets.shared(id):
+            return await self.revoke_lease(id)
+
+        key = f'/reservation/project/{name}'
+        succeeded, _ = await self._txn(
+            [_txn_leased(key, id)], [_txn_delete(key)]
+        )
+        if not succeeded:
+            raise ReservationNameNotFound(name)
+
+        return True
+
+    async def create_reservation(
+        self, project: str, email: str, duration: int
+    ):
+        granted = time.time()
+        lease: Lease = await self._reservation_lease(granted, duration)
+
+        data = {
+            "email": email,
+            "id": lease.id,
+            "ttl": lease.ttl,
+            "expires": granted + lease.ttl
+        }
+        key = f'/reservation/project/{project}'
+        put = _txn_put(key, self._sync._dumps(data), lease.id)
+
+        succeeded, responses = await self._txn(
+            [_txn_absent(key)], [put], [_txn_get(key)]
+        )
+        current = None if succeeded else _txn_got(responses[0])
+        if current and _expired(current[0]):
+            succeeded, _ = await self._txn(
+                [_txn_unchanged(key, current[1])], [put]
+            )
+
+        if not succeeded:
+            if not LeaseBuckets.shared(lease.id):
+                await self.revoke_lease(lease.id)
+            raise ReservationExists(project)
+
+        return Reservation(
+            project=project, email=email, id=lease.id, ttl=lease.ttl
+        )
@@ -0,0 +1,490 @@
+#!/usr/bin/env python3
+
+
+import threading
+import time
+from typing import List
+
+from service.codec import loads
+from service.etcd_txn import _expired
+from service.exceptions import ProjectNameNotFound, ScenarioNameNotFound
+from service.exceptions import ReservationNameNotFound
+from service.storage import EtcdStorage, _page_names
+from service.storage import _tagged_read, _txn_newest, _collection_revision
+from service.watch import EtcdWatcher
+
+from service.models import ProjectCore, ScenarioCore, ReservationCore
+
+
+class CachedEtcdStorage:
+    """
+    In-process read cache in front of an EtcdStorage.
+
+    The project, scenario and reservation prefixes are loaded at a single
+    revision on start, then kept current by one etcd watch resuming from the
+    last revision seen.  A monitor thread periodically asks etcd for the store
+    revision and checks the watch has caught up with it; reads are served from
+    memory only while that check succeeded within max_staleness seconds,
+    otherwise (or for keys this worker just wrote) they go to etcd directly.
+    In a namespace the store revision also moves with other tenants' writes
+    the watch never sees, so memory matching etcd's collection revisions
+    read at that store revision counts as caught up too.
+
+    Anything not cached is delegated to the wrapped EtcdStorage.
+    """
+
+    PREFIXES = EtcdStorage.PREFIXES
+
+    def __init__(self, backend: EtcdStorage, max_staleness: float = 5.0):
+        self._backend = backend
+        self.max_staleness = max_staleness
+
+        # kind -> {name: (decoded value, mod_revision)}
+        self._data = {kind: {} for kind in self.PREFIXES}
+        # kind -> {name: monotonic time written through this worker}
+        self._dirty = {kind: {} for kind in self.PREFIXES}
+        # project name -> names of its cached scenarios
+        self._scenario_index = {}
+
+        self._lock = threading.Condition()
+        self._stopped = threading.Event()
+        self._verified = 0.0
+        self._watcher = None
+        self._monitor = None
+
+        self.revision = 0
+        self.hits = 0
+        self.misses = 0
+
+    def __getattr__(self, attr):
+        return getattr(self._backend, attr)
+
+    # Lifecycle
+    def start(self):
+        revision = self._load()
+
+        self._watcher = EtcdWatcher(
+            self._backend.storage_service, b'\0', b'\0', self._apply,
+            start_revision=revision, on_reset=self._reset
+        )
+        self._watcher.start()
+
+        self._monitor = threading.Thread(target=self._check, daemon=True)
+        self._monitor.start()
+
+        return self
+
+    def stop(self):
+        self._stopped.set()
+        if self._watcher:
+            self._watcher.stop()
+
+    def stats(self) -> dict:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "revision": self.revision,
+            "fresh": self._fresh(),
+            "watch_failures": self._watcher.failures if self._watcher else 0,
+        }
+
+    # Cache maintenance
+    def _load(self) -> int:
+        """Snapshot every cached prefix at one store revision"""
+
+        data = {}
+        revision = 0
+        for kind, prefix in self.PREFIXES.items():
+            if revision:
+                result = self._backend._range(prefix, revision=revision)
+            else:
+                result = self._backend._range(prefix)
+                revision = int(result["header"]["revision"])
+
+            data[kind] = {
+                item["key"].decode("utf-8")[len(prefix):]: (
+                    loads(item["value"]), int(item["mod_revision"])
+                )
+                for item in result.get("kvs", [])
+            }
+
+        index = {}
+        for name, entry in data["scenario"].items():
+            index.setdefault(entry[0]["project"], set()).add(name)
+
+        with self._lock:
+            self._data = data
+            self._scenario_index = index
+            self.revision = revision
+            self._verified = time.monotonic()
+            self._lock.notify_all()
+
+        return revision
+
+    def _reset(self, compact_revision: int) -> int:
+        print(f'etcd watch compacted at {compact_revision}, reloading cache')
+        return self._load()
+
+    def _locate(self, key: bytes):
+        key = key.decode("utf-8", "replace")
+        for kind, prefix in self.PREFIXES.items():
+            if key.startswith(prefix):
+                return kind, key[len(prefix):]
+        return None, None
+
+    def _apply(self, event: dict):
+        kv = event["kv"]
+        revision = int(kv["mod_revision"])
+        kind, name = self._locate(kv["key"])
+
+        with self._lock:
+            if kind is not None:
+                old = self._data[kind].pop(name, None)
+                if kind == "scenario" and old is not None:
+                    self._scenario_index[old[0]["project"]].discard(name)
+
+                if event.get("type") != "DELETE":
+                    value = loads(kv["value"])
+                    self._data[kind][name] = (value, revision)
+                    if kind == "scenario":
+                        self._scenario_index.setdefault(
+                            value["project"], set()
+                        ).add(name)
+
+                self._dirty[kind].pop(name, None)
+
+            self.revision = max(self.revision, revision)
+            self._lock.notify_all()
+
+    def _check(self):
+        """Bound staleness: confirm the watch reaches the store revision"""
+
+        interval = self.max_staleness / 2
+        while not self._stopped.wait(interval):
+            started = time.monotonic()
+            try:
+                # Store revision and every cached collection's revision, at
+                # once (newest key of each prefix, its count the total)
+                result = self._backend.storage_service.transaction({
+                    "compare": [], "failure": [], "success": [
+                        _txn_newest(prefix) for prefix in self.PREFIXES.values()
+                    ]
+                })
+                target = int(result["header"]["revision"])
+                tokens = {
+                    kind: _collection_revision(
+                        response["response_range"].get("kvs", []),
+                        response["response_range"]
+                    )
+                    for kind, response in zip(self.PREFIXES, result["responses"])
+                }
+            except Exception as err:
+                print(f'Cache revision check failed: {err}')
+                continue
+
+            def caught_up():
+                # The watcher also advances on progress notifications
+                revision = max(self.revision, self._watcher.revision)
+                return revision >= target or self._tokens() == tokens
+
+            with self._lock:
+                self._lock.wait_for(
+                    lambda: caught_up() or self._stopped.is_set(),
+                    timeout=self.max_staleness
+                )
+                if caught_up():
+                    # Memory holds what etcd held at target (or later)
+                    self.revision = max(self.revision, target)
+                    self._verified = started
+                else:
+                    print(f'Cache behind etcd ({self.revision} < {target})')
+
+    def _tokens(self) -> dict:
+        # Collection revisions of memory, as etcd gives them (under lock)
+        return {
+            kind: f'{max((e[1] for e in data.values()), default=0)}.{len(data)}'
+            for kind, data in self._data.items()
+        }
+
+    def _fresh(self) -> bool:
+        return (
+            self._watcher is not None and self._watcher.alive and
+            time.monotonic() - self._verified <= self.max_staleness
+        )
+
+    def _cached(self, kind: str, name: str = None) -> bool:
+        """Can this read be answered from memory? Counts hits and misses"""
+
+        with self._lock:
+            dirty = self._dirty[kind]
+            if dirty:
+                expired = time.monotonic() - self.max_staleness
+                for key in [k for k, t in dirty.items() if t < expired]:
+                    del dirty[key]
+
+            usable = self._fresh() and (
+                name not in dirty if name else not dirty
+            )
+
+            if usable:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+        return usable
+
+    def _written(self, kind: str, name: str):
+        with self._lock:
+            self._dirty[kind][name] = time.monotonic()
+
+    def get_revision(self, kind: str, name: str = None, project: str = None):
+        # Same tokens as EtcdStorage.get_revision, without asking etcd
+        if self._backend._untagged(kind, name):
+            return None
+        if not self._cached(kind, name):
+            return self._backend.get_revision(kind, name, project)
+
+        with self._lock:
+            data = self._data[kind]
+
+            if name:
+                entry = data.get(name)
+                return str(entry[1]) if entry else None
+
+            if kind == "scenario" and project:
+                names = self._scenario_index.get(project, ())
+            else:
+                names = data
+
+            revisions = [data[n][1] for n in names]
+
+        return f'{max(revisions, default=0)}.{len(revisions)}'
+
+    def get_tagged(
+        self, kind: str, name=None, project=None, limit=None, cursor=None
+    ):
+        # etcd tags its single read; memory reads the token first, cheaply
+        if not self._cached(kind, name):
+            return self._backend.get_tagged(kind, name, project, limit, cursor)
+
+        revision = self.get_revision(kind, name, project)
+        return _tagged_read(self, kind, name, project, limit, cursor), revision
+
+    # Data handling routines (reads)
+    def get_project(self, name, core=False):
+        if not self._cached("project", name):
+            return self._backend.get_project(name, core)
+
+        entry = self._data["project"].get(name)
+        if entry is None:
+            raise ProjectNameNotFound(name)
+
+        return self._backend._build_project(name, entry[0], core)
+
+    def get_project_list(self) -> List[str]:
+        if not self._cached("project"):
+            return self._backend.get_project_list()
+
+        return sorted(self._data["project"])
+
+    def get_projects_bulk(self, core=True) -> List[ProjectCore]:
+        if not self._cached("project"):
+            return self._backend.get_projects_bulk(core)
+
+        return [
+            self._backend._build_project(name, entry[0], core)
+            for name, entry in sorted(self._data["project"].items())
+        ]
+
+    def get_projects_page(self, limit, cursor=None, core=True):
+        if not self._cached("project"):
+            return self._backend.get_projects_page(limit, cursor, core)
+
+        with self._lock:
+            data = self._data["project"]
+            names, next_cursor = _page_names(data, limit, cursor)
+            entries = [(name, data[name][0]) for name in names]
+
+        return [
+            self._backend._build_project(name, value, core)
+            for name, value in entries
+        ], next_cursor
+
+    def get_scenario(self, name, core=False):
+        if not self._cached("scenario", name):
+            return self._backend.get_scenario(name, core)
+
+        entry = self._data["scenario"].get(name)
+        if entry is None:
+            raise ScenarioNameNotFound(name)
+
+        return self._backend._build_scenario(name, entry[0], core)
+
+    def get_scenario_list(self) -> List[str]:
+        if not self._cached("scenario"):
+            return self._backend.get_scenario_list()
+
+        return sorted(self._data["scenario"])
+
+    def get_scenarios_bulk(self, core=True) -> List[ScenarioCore]:
+        if not self._cached("scenario"):
+            return self._backend.get_scenarios_bulk(core)
+
+        return [
+            self._backend._build_scenario(name, entry[0], core)
+            for name, entry in sorted(self._data["scenario"].items())
+        ]
+
+    def get_scenarios_by_project(self, project, core=True) -> List[ScenarioCore]:
+        if not self._cached("scenario"):
+            return self._backend.get_scenarios_by_project(project, core)
+
+        with self._lock:
+            entries = [
+                (name, self._data["scenario"][name][0])
+                for name in sorted(self._scenario_index.get(project, ()))
+            ]
+
+        return [
+            self._backend._build_scenario(name, value, core)
+            for name, value in entries
+        ]
+
+    def get_scenarios_page(self, limit, cursor=None, core=True, project=None):
+        if not self._cached("scenario"):
+            return self._backend.get_scenarios_page(
+                limit, cursor, core, project
+            )
+
+        with self._lock:
+            data = self._data["scenario"]
+            names, next_cursor = _page_names(
+                self._scenario_index.get(project, ()) if project else data,
+                limit, cursor
+            )
+            entries = [(name, data[name][0]) for name in names]
+
+        return [
+            self._backend._build_scenario(name, value, core)
+            for name, value in entries
+        ], next_cursor
+
+    def get_reservation(self, name: str, core: bool = False):
+        if not self._cached("reservation", name):
+            return self._backend.get_reservation(name, core)
+
+        entry = self._data["reservation"].get(name)
+        if entry is None or _expired(entry[0]):
+            raise ReservationNameNotFound(name)
+
+        return self._backend._build_reservation(name, entry[0], core)
+
+    def get_reservation_list(self) -> List[str]:
+        if not self._cached("reservation"):
+            return self._backend.get_reservation_list()
+
+        with self._lock:
+            return sorted(
+                name for name, entry in self._data["reservation"].items()
+                if not _expired(entry[0])
+            )
+
+    def get_reservation_count(self) -> int:
+        if not self._cached("reservation"):
+            return self._backend.get_reservation_count()
+
+        return len(self.get_reservation_list())
+
+    def get_reservations_bulk(self, core=True) -> List[ReservationCore]:
+        if not self._cached("reservation"):
+            return self._backend.get_reservations_bulk(core)
+
+        return self._backend._build_reservations([
+            (name, entry[0])
+            for name, entry in sorted(self._data["reservation"].items())
+        ], core)
+
+    def get_reservations_page(self, limit, cursor=None, core=True):
+        if not self._cached("reservation"):
+            return self._backend.get_reservations_page(limit, cursor, core)
+
+        with self._lock:
+            data = self._data["reservation"]
+            names, next_cursor = _page_names(data, limit, cursor)
+            entries = [(name, data[name][0]) for name in names]
+
+        return self._backend._build_reservations(entries, core), next_cursor
+
+    # Data handling routines (writes go through, then read direct until the
+    # watch delivers them)
+    def set_project(self, name, title, description):
+        self._written("project", name)
+        return self._backend.set_project(name, title, description)
+
+    def set_scenario(self, name, title, description, project):
+        self._written("scenario", name)
+        return self._backend.set_scenario(name, title, description, project)
+
+    def set_reservation(self, project: str, email: str, duration: int):
+        self._written("reservation", project)
+        return self._backend.set_reservation(project, email, duration)
+
+    def create_project(self, name, title, description):
+        self._written("project", name)
+        return self._backend.create_project(name, title, description)
+
+    def create_scenario(self, name, title, description, project):
+        self._written("scenario", name)
+        return self._backend.create_scenario(
+            name, title, description, project
+        )
+
+    def create_reservation(self, project: str, email: str, duration: int):
+        self._written("reservation", project)
+        return self._backend.create_reservation(project, email, duration)
+
+    def create_projects_bulk(self, projects) -> list:
+        for project in projects:
+            self._written("project", project.name)
+        return self._backend.create_projects_bulk(projects)
+
+    def create_scenarios_bulk(self, scenarios) -> list:
+        for scenario in scenarios:
+            self._written("scenario", scenario.name)
+        return self._backend.create_scenarios_bulk(scenarios)
+
+    def import_batch(self, projects, scenarios, reservations):
+        for project in projects:
+            self._written("project", project.name)
+        for scenario in scenarios:
+            self._written("scenario", scenario.name)
+        for reservation in reservations:
+            self._written("reservation", reservation.project)
+        return self._backend.import_batch(projects, scenarios, reservations)
+
+    def revoke_lease(self, id: int) -> bool:
+        for name, entry in list(self._data["reservation"].items()):
+            if int(entry[0]["id"]) == id:
+                self._written("reservation", name)
+
+        return self._backend.revoke_lease(id)
+
+    def release_reservation(self, name: str, id: int) -> bool:
+        self._written("reservation", name)
+        return self._backend.release_reservation(name, id)
+
+    def renew_reservation(
+        self, project: str, email: str, duration: int = None, auto=None
+    ):
+        self._written("reservation", project)
+        return self._backend.renew_reservation(project, email, duration, auto)
+
+    def renew_due(self, within: float) -> List[str]:
+        names = self._backend.renew_due(within)
+        for name in names:
+            self._written("reservation", name)
+        return names
+
+    def hand_off(self, project: str):
+        self._written("reservation", project)
+        return self._backend.hand_off(project)
@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+
+
+import msgpack
+import orjson
+
+
+# Marker byte of a versioned msgpack value.  JSON values (every key written
+# before, or with the json codec) are objects, so they start with '{'.
+MSGPACK_V1 = b'\x01'
+
+CODECS = ("json", "msgpack")
+
+
+def loads(raw):
+    """Stored value (bytes or str) to data, whichever codec wrote it"""
+
+    if raw[:1] == MSGPACK_V1:
+        return msgpack.unpackb(raw[1:], raw=False)
+
+    return orjson.loads(raw)
+
+
+def dumps_json(data) -> bytes:
+    return orjson.dumps(data)
+
+
+def dumps_msgpack(data) -> bytes:
+    return MSGPACK_V1 + msgpack.packb(data, use_bin_type=True)
+
+
+def encoder(codec: str = "json"):
+    """
+    Value encoder for new writes.  Every reader decodes both, but workers
+    from before msgpack support only read JSON: switch to msgpack once
+    none are left.
+    """
+
+    if codec not in CODECS:
+        raise ValueError(f'Unknown storage codec {codec!r}, use {CODECS}')
+
+    return dumps_msgpack if codec == "msgpack" else dumps_json
+
+
+def dump_models(content) -> bytes:
+    """
+    JSON of pydantic models at any depth (alone, in lists, in models) as
+    their fields, in one pass and without validating them again.
+    """
+
+    return orjson.dumps(content, default=dict)
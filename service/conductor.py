@@ -2,54 +2,225 @@
 
 
 import os
+import time
 
-from typing import List
-from fastapi import FastAPI, HTTPException
+from functools import partial
+from tempfile import SpooledTemporaryFile
+from typing import List, Union
+from fastapi import FastAPI, HTTPException, Header, Query, Request, Response
+from fastapi.responses import ORJSONResponse, StreamingResponse
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
+from starlette.concurrency import run_in_threadpool
 
 from service.storage import StorageService, LocalStorage, EtcdStorage
 from service.storage import StorageException, ReservationPermissionDenied
+from service.storage import SNAPSHOT_MODELS, SNAPSHOT_END, SNAPSHOT_ERROR
+from service.cache import CachedEtcdStorage
+from service.codec import dump_models
+from service.async_storage import AsyncEtcdStorage
+from service.sqlite_storage import SqliteStorage
+from service.shards import ShardedEtcdStorage, parse_shards
+from service.events import ReservationEvents
+from service.renewal import AutoRenewal
+from service.waitlist import Waitlist
+from service.limits import AdmissionMiddleware, RateLimiter, retry_after
+from service.metrics import InstrumentedStorage, MetricsMiddleware, TimedRoute
+from service.metrics import record_failure, timed_render, update_gauges
 
 from service.models import Version
 from service.models import ProjectCore, ProjectInput, Project
 from service.models import ScenarioCore, ScenarioInput, Scenario
 from service.models import ReservationCore, ReservationInput, Reservation
-from service.models import ReservationEmail
+from service.models import ReservationEmail, ReservationRenewal
+from service.models import WaitlistInput, Waiter, WaitlistStatus
+from service.models import BulkResult, ImportSummary
+
+
+# Largest page a list endpoint serves (limit query parameter)
+PAGE_LIMIT_MAX = 1000
+
+# Most items accepted by one bulk create request
+BULK_ITEMS_MAX = 1000
+
+# Longest a waitlist status request waits for a hand-off (seconds)
+WAIT_MAX = 60
+
+# Snapshot export page size, and import batch size (entries)
+EXPORT_PAGE = 500
+IMPORT_BATCH = 1000
+
+# Snapshot bytes an import spools in memory before moving to a file
+IMPORT_SPOOL_MEMORY = 8 * 1024 * 1024
+
+# Opt-in streaming format for the list endpoints, one JSON record per line
+NDJSON = 'application/x-ndjson'
 
 
 # Entry point for gunicorn (Dockerfile)
 def select_storage():
+    """
+    Only decides which backend to use: the backend itself is built by
+    StorageService on first use, and connectivity is checked by /ready.
+    """
+
     storage_type = os.environ.get("CONDUCTOR_STORAGE_TYPE", "ETCD")
 
     if storage_type == "LOCAL":
         print('Conductor using local storage')
-        return StorageService(svc=LocalStorage())
+        return StorageService(factory=LocalStorage)
+
+    if storage_type == "SQLITE":
+        print('Conductor using SQLite storage')
+        return StorageService(factory=SqliteStorage)
 
     if storage_type == "ETCD":
+        # One or more members, comma-separated (host or host:port)
         storage_host = os.environ.get('CONDUCTOR_STORAGE_HOST', 'localhost')
         storage_port = int(os.environ.get('CONDUCTOR_STORAGE_PORT', '2379'))
-
-        etcd_storage = EtcdStorage(
-            etcd_service=storage_host, etcd_port=storage_port
+        pool_size = int(os.environ.get('CONDUCTOR_STORAGE_POOL', '100'))
+        timeout = float(os.environ.get('CONDUCTOR_STORAGE_TIMEOUT', '5'))
+        retries = int(os.environ.get('CONDUCTOR_STORAGE_RETRIES', '2'))
+        lease_window = int(os.environ.get('CONDUCTOR_LEASE_WINDOW', '0'))
+        codec = os.environ.get('CONDUCTOR_STORAGE_CODEC', 'json')
+        namespace = os.environ.get('CONDUCTOR_STORAGE_NAMESPACE', '')
+        shards = os.environ.get('CONDUCTOR_STORAGE_SHARDS', '')
+
+        etcd_storage = partial(
+            EtcdStorage, etcd_service=storage_host, etcd_port=storage_port,
+            pool_size=pool_size, timeout=timeout, retries=retries,
+            lease_window=lease_window, codec=codec, namespace=namespace
         )
 
-        # Test connectivity here (add when I add lease support)
-        etcd_storage.create_lease(10)
+        if namespace:
+            print(f'Conductor keys under etcd namespace {namespace}')
+
+        # Projects spread over several clusters (threadpool client only)
+        if shards:
+            clusters = parse_shards(shards, storage_port)
+            print(
+                'Conductor sharding etcd over '
+                f'{", ".join(name for name, _ in clusters)}'
+            )
+            return StorageService(factory=lambda: ShardedEtcdStorage([
+                (name, etcd_storage(etcd_service=members))
+                for name, members in clusters
+            ]))
 
         print(f'Conductor using etcd: {storage_host}:{storage_port}')
-        return StorageService(svc=etcd_storage)
 
-    raise Exception('ETCD and LOCAL are only supported storage types')
+        # Optional watch-driven read cache in front of etcd
+        if os.environ.get('CONDUCTOR_STORAGE_CACHE', '0') == '1':
+            staleness = float(
+                os.environ.get('CONDUCTOR_CACHE_STALENESS', '5')
+            )
+            print(f'Conductor caching etcd reads (staleness {staleness}s)')
+            return StorageService(
+                factory=lambda: CachedEtcdStorage(
+                    etcd_storage(), staleness
+                ).start()
+            )
+
+        # Non-blocking etcd client unless the threadpool one is requested
+        if os.environ.get('CONDUCTOR_STORAGE_ASYNC', '1') == '1':
+            return StorageService(factory=partial(
+                AsyncEtcdStorage,
+                etcd_service=storage_host, etcd_port=storage_port,
+                max_connections=pool_size, timeout=timeout, retries=retries,
+                lease_window=lease_window, codec=codec, namespace=namespace
+            ))
+
+        return StorageService(factory=etcd_storage)
+
+    raise Exception('ETCD, LOCAL and SQLITE are only supported storage types')
 
 
 def application():
     global storage_service
+    global reservation_events
+    global auto_renewal
+    global waitlist
+    global rate_limiter
+    global admin_routes
     global api
     global app_version
 
-    api = FastAPI()
+    started = time.perf_counter()
+
+    api = FastAPI(default_response_class=ORJSONResponse)
     storage_service = select_storage()
     app_version = Version(version='0.3.0')
 
+    # Admission control: per-requester rate limits shared between workers
+    # (a rate of 0 disables) and an in-flight request cap (0 disables)
+    rate_limiter = RateLimiter(
+        storage_service,
+        limits={
+            scope: (
+                float(os.environ.get(f'CONDUCTOR_RATE_{scope.upper()}', '0')),
+                float(os.environ.get(
+                    f'CONDUCTOR_RATE_{scope.upper()}_BURST', '10'
+                ))
+            )
+            for scope in ("client", "email")
+        },
+        sync_interval=float(os.environ.get('CONDUCTOR_RATE_SYNC', '1'))
+    )
+    api.add_middleware(
+        AdmissionMiddleware, limiter=rate_limiter,
+        max_inflight=int(os.environ.get('CONDUCTOR_MAX_INFLIGHT', '0'))
+    )
+    api.add_event_handler('startup', rate_limiter.start)
+
+    # Request and storage timing for /metrics, optionally as Server-Timing
+    api.router.route_class = TimedRoute
+    api.add_middleware(
+        MetricsMiddleware,
+        server_timing=os.environ.get('CONDUCTOR_SERVER_TIMING', '0') == '1'
+    )
+    storage_service.wrapper = InstrumentedStorage
+
+    # One reservation watch per worker, started by the first subscriber
+    reservation_events = ReservationEvents(
+        storage_service,
+        queue_size=int(os.environ.get('CONDUCTOR_EVENTS_QUEUE', '100'))
+    )
+
+    # Periodic renewal of reservations set to auto-renew (0 disables)
+    auto_renewal = AutoRenewal(
+        storage_service,
+        interval=float(os.environ.get('CONDUCTOR_AUTO_RENEW_INTERVAL', '0'))
+    )
+    api.add_event_handler('startup', auto_renewal.start)
+
+    # Waitlist hand-offs, on the reservation watch plus a sweep (0 disables),
+    # dropping waiters that stopped polling their status (0 keeps them)
+    waitlist = Waitlist(
+        storage_service, reservation_events,
+        sweep_interval=float(os.environ.get('CONDUCTOR_WAITLIST_SWEEP', '5')),
+        waiter_ttl=float(os.environ.get('CONDUCTOR_WAITLIST_TTL', '300'))
+    )
+    api.add_event_handler('startup', waitlist.start)
+
+    # Snapshot export and import (/admin) read and replace everything, and
+    # requests are not authenticated yet: opt-in (0 or 1)
+    admin_routes = os.environ.get('CONDUCTOR_ADMIN_ROUTES', '0') == '1'
+    if admin_routes:
+        print('Conductor admin routes enabled')
+
+    # Stop the watch and release pooled storage connections on shutdown
+    api.add_event_handler('shutdown', auto_renewal.close)
+    api.add_event_handler('shutdown', waitlist.close)
+    api.add_event_handler('shutdown', rate_limiter.close)
+    api.add_event_handler('shutdown', reservation_events.close)
+    api.add_event_handler('shutdown', storage_service.close)
+
+    # Cold start budget: no storage I/O happens here, keep it that way
+    elapsed = (time.perf_counter() - started) * 1000
+    budget = float(os.environ.get('CONDUCTOR_STARTUP_BUDGET_MS', '50'))
+    print(f'Conductor application ready in {elapsed:.1f}ms')
+    if elapsed > budget:
+        print(f'Conductor startup exceeded budget ({budget:.0f}ms)')
+
     return api
 
 
@@ -57,163 +228,481 @@ def application():
 app = application()
 
 
+class ModelResponse(ORJSONResponse):
+    """
+    Models the storage backend built (or lists of them), rendered in one
+    pass.  Returning it skips FastAPI revalidating them against the
+    response model and converting them with jsonable_encoder; the response
+    model still documents the endpoint.  Headers set on the injected
+    Response (ETag, X-Next-Cursor) are not merged into a returned one, so
+    pass them in: headers=dict(response.headers).
+    """
+
+    @timed_render
+    def render(self, content) -> bytes:
+        return dump_models(content)
+
+
+def admin_only():
+    # Disabled admin routes answer as if they did not exist
+    if not admin_routes:
+        raise HTTPException(status_code=404, detail='Not Found')
+
+
+def error_record(err: Exception, **counts) -> bytes:
+    # Last line of an NDJSON stream cut short, so it never passes for whole
+    message = getattr(err, 'status_message', None) or str(err)
+    return dump_models({SNAPSHOT_ERROR: {'message': message, **counts}}) \
+        + b'\n'
+
+
+def generic_failure(err: Exception) -> HTTPException:
+    # Unexpected errors are counted and logged with their traceback; the
+    # client is only told the request failed
+    record_failure(err)
+    return HTTPException(status_code=400, detail='Generic failure')
+
+
+def admit(email: str):
+    # Per-requester rate limit of the reservation endpoints
+    wait = rate_limiter.check('email', email)
+    if wait:
+        raise HTTPException(
+            status_code=429, detail='Too many requests',
+            headers={'Retry-After': retry_after(wait)}
+        )
+
+
+def set_next_cursor(response: Response, next_cursor: str):
+    # Pass as ?cursor= to get the following page; absent on the last page
+    if next_cursor:
+        response.headers['X-Next-Cursor'] = next_cursor
+
+
+async def revalidation_etag(
+    request: Request, kind: str, name: str = None, project: str = None
+):
+    # Only a conditional request reads the revision alone, before the data
+    # (so a concurrent change can never be hidden); others take the ETag
+    # from the data read itself (storage_service.fetch_tagged)
+    if not request.headers.get('if-none-match'):
+        return None
+    return await storage_service.etag(kind, name, project)
+
+
+def set_etag(response: Response, etag: str):
+    if etag:
+        response.headers['ETag'] = etag
+
+
+def not_modified(request: Request, etag: str) -> bool:
+    if not etag:
+        return False
+
+    tags = request.headers.get('if-none-match', '')
+    return any(
+        tag.strip() in (etag, f'W/{etag}', '*') for tag in tags.split(',')
+    )
+
+
+def wants_ndjson(request: Request) -> bool:
+    return NDJSON in request.headers.get('accept', '')
+
+
+async def stream_ndjson(fetch_page, cursor: str = None, limit: int = None):
+    """
+    Stream a collection as NDJSON, writing each record as soon as its page
+    is read.  The first page is read before responding, so storage errors
+    still get a proper status; later ones end the stream early with an
+    error record counting the records sent.
+    """
+
+    pages = storage_service.page_through(fetch_page, cursor, limit)
+    first = await pages.__anext__()
+
+    async def body():
+        records = 0
+        try:
+            for record in first:
+                yield dump_models(record) + b'\n'
+            records += len(first)
+            async for page in pages:
+                for record in page:
+                    yield dump_models(record) + b'\n'
+                records += len(page)
+        except Exception as err:
+            record_failure(err, 'NDJSON stream aborted')
+            yield error_record(err, records=records)
+
+    return StreamingResponse(body(), media_type=NDJSON)
+
+
+@api.get('/ready')
+async def ready():
+    # Bounded, read-only storage check for orchestrator readiness probes
+    timeout = float(os.environ.get('CONDUCTOR_READY_TIMEOUT', '1'))
+
+    if not await storage_service.ready(timeout=timeout):
+        raise HTTPException(status_code=503, detail='Storage unavailable')
+
+    return {'ready': True}
+
+
+@api.get('/metrics')
+async def metrics():
+    # Prometheus scrape; gauges are read from storage at scrape time
+    await update_gauges(storage_service)
+
+    return Response(
+        generate_latest(), headers={'Content-Type': CONTENT_TYPE_LATEST}
+    )
+
+
 @api.get('/version', response_model=Version)
-def version():
+async def version():
     return app_version
 
 
 @api.get('/project/', response_model=List[ProjectCore])
-def get_all_projects():
+async def get_all_projects(
+    request: Request,
+    response: Response,
+    limit: int = Query(None, ge=1, le=PAGE_LIMIT_MAX),
+    cursor: str = None
+):
     try:
-        summaries: List[ProjectCore] = storage_service.fetch_project()
+        if wants_ndjson(request):
+            return await stream_ndjson(
+                storage_service.fetch_project_page, cursor, limit
+            )
+
+        etag = await revalidation_etag(request, 'project')
+        if not_modified(request, etag):
+            return Response(status_code=304, headers={'ETag': etag})
+
+        if limit:
+            (summaries, next_cursor), etag = \
+                await storage_service.fetch_tagged(
+                    'project', limit=limit, cursor=cursor
+                )
+            set_next_cursor(response, next_cursor)
+        else:
+            summaries, etag = await storage_service.fetch_tagged('project')
+        set_etag(response, etag)
     except StorageException as err:
         raise HTTPException(
             status_code=err.status_code,
             detail=err.status_message
         )
     except Exception as err:
-        print(err)
-        raise HTTPException(status_code=400, detail='Generic failure')
+        raise generic_failure(err)
 
-    return summaries
+    return ModelResponse(summaries, headers=dict(response.headers))
 
 
 @api.post('/project/', response_model=Project)
-def create_project(project: ProjectInput):
+async def create_project(project: ProjectInput):
     # FastAPI will return 422? if there's data validation issues
 
     try:
-        result = storage_service.create_project(project)
+        result = await storage_service.create_project(project)
+    except StorageException as err:
+        raise HTTPException(
+            status_code=err.status_code,
+            detail=err.status_message
+        )
+    except Exception as err:
+        raise generic_failure(err)
+
+    return ModelResponse(result)
+
+
+@api.post('/project/bulk', response_model=List[BulkResult])
+async def create_projects(projects: List[ProjectInput]):
+    # The whole batch is validated first (422); then a result per project
+    if len(projects) > BULK_ITEMS_MAX:
+        raise HTTPException(
+            status_code=413, detail=f'At most {BULK_ITEMS_MAX} projects'
+        )
+
+    try:
+        results = await storage_service.create_projects(projects)
     except StorageException as err:
         raise HTTPException(
             status_code=err.status_code,
             detail=err.status_message
         )
     except Exception as err:
-        print(err)
-        raise HTTPException(status_code=400, detail='Generic failure')
+        raise generic_failure(err)
 
-    return result
+    return ModelResponse(results)
 
 
 @api.get('/project/{name}', response_model=Project)
-def get_project(name: str):
+async def get_project(name: str, request: Request, response: Response):
 
     try:
-        project = storage_service.fetch_project(name)
+        etag = await revalidation_etag(request, 'project', name)
+        if not_modified(request, etag):
+            return Response(status_code=304, headers={'ETag': etag})
+
+        project, etag = await storage_service.fetch_tagged('project', name)
+        set_etag(response, etag)
     except StorageException as err:
         raise HTTPException(
             status_code=err.status_code,
             detail=err.status_message
         )
     except Exception as err:
-        print(err)
-        raise HTTPException(status_code=400, detail='Generic failure')
+        raise generic_failure(err)
 
-    return project
+    return ModelResponse(project, headers=dict(response.headers))
 
 
 @api.get('/scenario/', response_model=List[ScenarioCore])
-def get_all_scenarios():
+async def get_all_scenarios(
+    request: Request,
+    response: Response,
+    project: str = None,
+    limit: int = Query(None, ge=1, le=PAGE_LIMIT_MAX),
+    cursor: str = None
+):
     try:
-        summaries: List[ScenarioCore] = storage_service.fetch_scenario()
+        if wants_ndjson(request):
+            return await stream_ndjson(
+                partial(storage_service.fetch_scenario_page, project=project),
+                cursor, limit
+            )
+
+        etag = await revalidation_etag(request, 'scenario', project=project)
+        if not_modified(request, etag):
+            return Response(status_code=304, headers={'ETag': etag})
+
+        if limit:
+            (summaries, next_cursor), etag = \
+                await storage_service.fetch_tagged(
+                    'scenario', project=project, limit=limit, cursor=cursor
+                )
+            set_next_cursor(response, next_cursor)
+        else:
+            summaries, etag = await storage_service.fetch_tagged(
+                'scenario', project=project
+            )
+        set_etag(response, etag)
     except StorageException as err:
         raise HTTPException(
             status_code=err.status_code,
             detail=err.status_message
         )
     except Exception as err:
-        print(err)
-        raise HTTPException(status_code=400, detail='Generic failure')
+        raise generic_failure(err)
 
-    return summaries
+    return ModelResponse(summaries, headers=dict(response.headers))
 
 
 @api.post('/scenario/', response_model=Scenario)
-def create_scenario(scenario: ScenarioInput):
+async def create_scenario(scenario: ScenarioInput):
     try:
-        result: Scenario = storage_service.create_scenario(scenario)
+        result: Scenario = await storage_service.create_scenario(scenario)
     except StorageException as err:
         raise HTTPException(
             status_code=err.status_code,
             detail=err.status_message
         )
     except Exception as err:
-        print(err)
-        raise HTTPException(status_code=400, detail='Generic failure')
+        raise generic_failure(err)
+
+    return ModelResponse(result)
 
-    return result
+
+@api.post('/scenario/bulk', response_model=List[BulkResult])
+async def create_scenarios(scenarios: List[ScenarioInput]):
+    # The whole batch is validated first (422); then a result per scenario
+    # (404 for those whose project does not exist)
+    if len(scenarios) > BULK_ITEMS_MAX:
+        raise HTTPException(
+            status_code=413, detail=f'At most {BULK_ITEMS_MAX} scenarios'
+        )
+
+    try:
+        results = await storage_service.create_scenarios(scenarios)
+    except StorageException as err:
+        raise HTTPException(
+            status_code=err.status_code,
+            detail=err.status_message
+        )
+    except Exception as err:
+        raise generic_failure(err)
+
+    return ModelResponse(results)
 
 
 @api.get('/scenario/{name}', response_model=Scenario)
-def get_scenario(name: str):
+async def get_scenario(name: str, request: Request, response: Response):
 
     try:
-        scenario: Scenario = storage_service.fetch_scenario(name)
+        etag = await revalidation_etag(request, 'scenario', name)
+        if not_modified(request, etag):
+            return Response(status_code=304, headers={'ETag': etag})
+
+        scenario, etag = await storage_service.fetch_tagged('scenario', name)
+        set_etag(response, etag)
     except StorageException as err:
         raise HTTPException(
             status_code=err.status_code,
             detail=err.status_message
         )
     except Exception as err:
-        print(err)
-        raise HTTPException(status_code=400, detail='Generic failure')
+        raise generic_failure(err)
 
-    return scenario
+    return ModelResponse(scenario, headers=dict(response.headers))
 
 
 @api.post('/reserve/project/', response_model=Reservation)
-def create_reservation(reservation: ReservationInput):
+async def create_reservation(reservation: ReservationInput):
+    admit(reservation.email)
+
     try:
-        result: Reservation = storage_service.create_reservation(reservation)
+        result: Reservation = await storage_service.create_reservation(reservation)
     except StorageException as err:
         raise HTTPException(
             status_code=err.status_code,
             detail=err.status_message
         )
     except Exception as err:
-        print(err)
-        raise HTTPException(status_code=400, detail='Generic failure')
+        raise generic_failure(err)
+
+    return ModelResponse(result)
+
+
+@api.get(
+    '/reserve/project/',
+    response_model=Union[List[Reservation], List[ReservationCore]]
+)
+async def get_all_reservations(
+    request: Request,
+    response: Response,
+    detail: bool = False,
+    limit: int = Query(None, ge=1, le=PAGE_LIMIT_MAX),
+    cursor: str = None
+):
+    try:
+        if wants_ndjson(request):
+            return await stream_ndjson(
+                partial(storage_service.fetch_reservation_page, detail=detail),
+                cursor, limit
+            )
+
+        # Remaining time changes by the second, so only summaries get ETags
+        if detail:
+            if limit:
+                summaries, next_cursor = \
+                    await storage_service.fetch_reservation_page(
+                        limit, cursor, detail=detail
+                    )
+                set_next_cursor(response, next_cursor)
+            else:
+                summaries: List[Reservation] = \
+                    await storage_service.fetch_reservation(detail=detail)
+        else:
+            etag = await revalidation_etag(request, 'reservation')
+            if not_modified(request, etag):
+                return Response(status_code=304, headers={'ETag': etag})
+
+            if limit:
+                (summaries, next_cursor), etag = \
+                    await storage_service.fetch_tagged(
+                        'reservation', limit=limit, cursor=cursor
+                    )
+                set_next_cursor(response, next_cursor)
+            else:
+                summaries, etag = \
+                    await storage_service.fetch_tagged('reservation')
+            set_etag(response, etag)
+    except StorageException as err:
+        raise HTTPException(
+            status_code=err.status_code,
+            detail=err.status_message
+        )
+    except Exception as err:
+        raise generic_failure(err)
 
-    return result
+    return ModelResponse(summaries, headers=dict(response.headers))
 
 
-@api.get('/reserve/project/', response_model=List[ReservationCore])
-def get_all_reservations():
+@api.get('/reserve/project/events')
+async def get_reservation_events(last_event_id: str = Header(None)):
+    """
+    Server-Sent Events: created, updated, deleted (revoked or expired) and
+    reset (list again) events, with the etcd revision as event id.
+    """
+
     try:
-        summaries: List[ReservationCore] = storage_service.fetch_reservation()
+        subscription = await reservation_events.subscribe(last_event_id)
     except StorageException as err:
         raise HTTPException(
             status_code=err.status_code,
             detail=err.status_message
         )
     except Exception as err:
-        print(err)
-        raise HTTPException(status_code=400, detail='Generic failure')
+        raise generic_failure(err)
+
+    async def stream():
+        try:
+            async for message in subscription:
+                yield message
+        finally:
+            subscription.close()
 
-    return summaries
+    return StreamingResponse(
+        stream(), media_type='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
 
 
 @api.get('/reserve/project/{name}', response_model=Reservation)
-def get_reservation(name: str):
+async def get_reservation(name: str):
     try:
-        reservation: Reservation = storage_service.fetch_reservation(name)
+        reservation: Reservation = await storage_service.fetch_reservation(name)
     except StorageException as err:
         raise HTTPException(
             status_code=err.status_code,
             detail=err.status_message
         )
     except Exception as err:
-        print(err)
-        raise HTTPException(status_code=400, detail='Generic failure')
+        raise generic_failure(err)
+
+    return ModelResponse(reservation)
 
-    return reservation
+
+@api.put('/reserve/project/{name}/renew', response_model=Reservation)
+async def renew_reservation(name: str, renewal: ReservationRenewal):
+    admit(renewal.email)
+
+    if renewal.auto and not auto_renewal.enabled:
+        raise HTTPException(status_code=501, detail='Auto-renewal is disabled')
+
+    try:
+        return ModelResponse(await storage_service.renew_reservation(name, renewal))
+    except ReservationPermissionDenied as err:
+        print(err.status_message)
+        raise HTTPException(
+            status_code=err.status_code,
+            detail=err.status_message
+        )
+    except StorageException as err:
+        raise HTTPException(
+            status_code=err.status_code,
+            detail=err.status_message
+        )
+    except Exception as err:
+        raise generic_failure(err)
 
 
 @api.delete('/reserve/project/{name}')
-def delete_reservation(name: str, email: ReservationEmail):
+async def delete_reservation(name: str, email: ReservationEmail):
     try:
-        return storage_service.delete_reservation(name, email)
+        return await storage_service.delete_reservation(name, email)
     except ReservationPermissionDenied as err:
         print(err.status_message)
         raise HTTPException(
@@ -226,5 +715,171 @@ def delete_reservation(name: str, email: ReservationEmail):
             detail=err.status_message
         )
     except Exception as err:
-        print(err)
-        raise HTTPException(status_code=400, detail='Generic failure')
+        raise generic_failure(err)
+
+
+@api.post('/reserve/project/{name}/queue', response_model=WaitlistStatus)
+async def enqueue_reservation(name: str, waiter: WaitlistInput):
+    """
+    Wait for a reserved project instead of retrying: the reservation is
+    handed to the first waiter as soon as the project is free.  Follow up
+    with the status long-poll (or the reservation events).
+    """
+
+    admit(waiter.email)
+
+    try:
+        return ModelResponse(await waitlist.enqueue(name, waiter))
+    except StorageException as err:
+        raise HTTPException(
+            status_code=err.status_code,
+            detail=err.status_message
+        )
+    except Exception as err:
+        raise generic_failure(err)
+
+
+@api.get('/reserve/project/{name}/queue', response_model=List[Waiter])
+async def get_waitlist(name: str):
+    try:
+        return ModelResponse(await storage_service.fetch_waitlist(name))
+    except StorageException as err:
+        raise HTTPException(
+            status_code=err.status_code,
+            detail=err.status_message
+        )
+    except Exception as err:
+        raise generic_failure(err)
+
+
+@api.get(
+    '/reserve/project/{name}/queue/{email}', response_model=WaitlistStatus
+)
+async def get_waitlist_status(
+    name: str, email: str, wait: float = Query(0, ge=0, le=WAIT_MAX)
+):
+    # Never rate limited (limits.EXEMPT): waiting here is what a queued
+    # requester is meant to do instead of retrying the reservation.
+    # Long-poll: returns early once the reservation is handed over
+    try:
+        return ModelResponse(await waitlist.status(name, email, wait))
+    except StorageException as err:
+        raise HTTPException(
+            status_code=err.status_code,
+            detail=err.status_message
+        )
+    except Exception as err:
+        raise generic_failure(err)
+
+
+@api.delete('/reserve/project/{name}/queue')
+async def dequeue_reservation(name: str, email: ReservationEmail):
+    try:
+        return await storage_service.dequeue_reservation(name, email)
+    except StorageException as err:
+        raise HTTPException(
+            status_code=err.status_code,
+            detail=err.status_message
+        )
+    except Exception as err:
+        raise generic_failure(err)
+
+
+async def spooled_chunks(spool, size: int = 64 * 1024):
+    # Chunks of a spooled request body, from the start (off the event loop
+    # once on disk)
+    await run_in_threadpool(spool.seek, 0)
+    while True:
+        chunk = await run_in_threadpool(spool.read, size)
+        if not chunk:
+            return
+        yield chunk
+
+
+async def ndjson_lines(chunks):
+    # Lines of a streamed request body, holding no more than one chunk
+    pending = b''
+    async for chunk in chunks:
+        lines = (pending + chunk).split(b'\n')
+        pending = lines.pop()
+        for line in lines:
+            yield line
+
+    if pending:
+        yield pending
+
+
+@api.get('/admin/export')
+async def export_catalog(
+    page_size: int = Query(EXPORT_PAGE, ge=1, le=PAGE_LIMIT_MAX)
+):
+    """
+    Snapshot of every project, scenario and active reservation (with its
+    remaining TTL) as NDJSON, one {kind: entry} per line, read a page at a
+    time at one storage revision, then an end record counting them (an
+    error record if the export fails part way).  POST it to /admin/import
+    to restore.
+    """
+
+    admin_only()
+
+    try:
+        pages = storage_service.export_catalog(page_size)
+        first = await pages.__anext__()
+    except StorageException as err:
+        raise HTTPException(
+            status_code=err.status_code,
+            detail=err.status_message
+        )
+    except Exception as err:
+        raise generic_failure(err)
+
+    counts = {kind: 0 for kind in SNAPSHOT_MODELS}
+
+    def lines(kind, page) -> bytes:
+        counts[kind] += len(page)
+        return b''.join(dump_models({kind: entry}) + b'\n' for entry in page)
+
+    async def body():
+        # One chunk per page
+        try:
+            yield lines(*first)
+            async for kind, page in pages:
+                yield lines(kind, page)
+        except Exception as err:
+            record_failure(err, 'Export aborted')
+            yield error_record(err, **counts)
+            return
+
+        yield dump_models({SNAPSHOT_END: counts}) + b'\n'
+
+    return StreamingResponse(body(), media_type=NDJSON)
+
+
+@api.post('/admin/import', response_model=ImportSummary)
+async def import_catalog(
+    request: Request,
+    batch_size: int = Query(IMPORT_BATCH, ge=1, le=10 * BULK_ITEMS_MAX)
+):
+    # Streamed NDJSON (as exported), spooled and checked complete before
+    # anything is written, then written batch_size entries at a time; on a
+    # storage error the batches before it stay written
+    admin_only()
+
+    try:
+        with SpooledTemporaryFile(max_size=IMPORT_SPOOL_MEMORY) as spool:
+            async for chunk in request.stream():
+                await run_in_threadpool(spool.write, chunk)
+
+            summary = await storage_service.import_catalog(
+                lambda: ndjson_lines(spooled_chunks(spool)), batch_size
+            )
+    except StorageException as err:
+        raise HTTPException(
+            status_code=err.status_code,
+            detail=err.status_message
+        )
+    except Exception as err:
+        raise generic_failure(err)
+
+    return ModelResponse(summary)
@@ -0,0 +1,339 @@
+#!/usr/bin/env python3
+
+
+import random
+import threading
+import time
+from typing import List, Tuple
+
+import orjson
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import MaxRetryError, NewConnectionError
+from etcd3gw import exceptions as etcd_exceptions
+from etcd3gw.client import Etcd3Client, _EXCEPTIONS_BY_CODE
+from etcd3gw.utils import _decode, _encode, _increment_last_byte
+
+
+# Gateway calls that only read: safe to send again, to another member
+IDEMPOTENT = frozenset({
+    '/kv/range', '/maintenance/status', '/lease/leases',
+    '/lease/timetolive', '/kv/lease/timetolive',
+})
+
+# Gateway answers meaning the member itself is unwell (no leader, timeout)
+UNAVAILABLE = frozenset({503, 504})
+
+
+def parse_endpoints(hosts: str, port: int) -> List[Tuple[str, int]]:
+    """
+    Members from a comma-separated host list, each optionally host:port
+    ([addr]:port for IPv6); port is used where none is given.
+    """
+
+    endpoints = []
+    for entry in hosts.split(','):
+        entry = entry.strip()
+        if not entry:
+            continue
+
+        host, member_port = entry, port
+        if entry.startswith('['):
+            host, _, rest = entry[1:].partition(']')
+            if rest.startswith(':'):
+                member_port = int(rest[1:])
+        elif entry.count(':') == 1:
+            host, member_port = entry.split(':')
+
+        endpoints.append((host, int(member_port)))
+
+    if not endpoints:
+        raise ValueError(f'No etcd endpoints in {hosts!r}')
+
+    return endpoints
+
+
+class EtcdEndpoints:
+    """
+    The etcd members a client may use, and how each has been doing.
+
+    Calls go to the member with the lowest smoothed latency that is not
+    cooling down after a failure.  Consecutive failures lengthen the cool
+    down exponentially (jittered).  A member unused for refresh seconds is
+    picked once more, so a recovered or formerly slow member is measured
+    again instead of being avoided for good.  Shared by the synchronous and
+    async clients of one backend, so both see the same member health.
+    """
+
+    def __init__(
+        self, endpoints: List[Tuple[str, int]], cooldown=1.0,
+        cooldown_max=30.0, refresh=30.0, smoothing=0.2,
+        backoff_base=0.05, backoff_max=1.0
+    ):
+        self.endpoints = list(endpoints)
+        self.cooldown = cooldown
+        self.cooldown_max = cooldown_max
+        self.refresh = refresh
+        self.smoothing = smoothing
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+
+        self._lock = threading.Lock()
+        self._state = {
+            endpoint: {
+                "latency": None, "failures": 0, "down_until": 0.0,
+                "used": None
+            }
+            for endpoint in self.endpoints
+        }
+
+    def best(self, exclude=()) -> Tuple[str, int]:
+        """Preferred member right now (no bookkeeping)"""
+
+        now = time.monotonic()
+        with self._lock:
+            return self._choose(now, exclude, refresh=False)
+
+    def pick(self, exclude=()) -> Tuple[str, int]:
+        """Member for the next call; exclude the ones already tried"""
+
+        now = time.monotonic()
+        with self._lock:
+            endpoint = self._choose(now, exclude, refresh=True)
+            self._state[endpoint]["used"] = now
+
+        return endpoint
+
+    def _choose(self, now: float, exclude, refresh: bool):
+        candidates = [e for e in self.endpoints if e not in exclude]
+        candidates = candidates or self.endpoints
+
+        up = [e for e in candidates if self._state[e]["down_until"] <= now]
+        if not up:
+            # All cooling down: the one due back first
+            return min(candidates, key=lambda e: self._state[e]["down_until"])
+
+        if refresh:
+            for endpoint in up:
+                used = self._state[endpoint]["used"]
+                if used is None or now - used >= self.refresh:
+                    return endpoint
+
+        return min(up, key=lambda e: self._state[e]["latency"] or 0.0)
+
+    def succeeded(self, endpoint: Tuple[str, int], elapsed: float):
+        with self._lock:
+            state = self._state[endpoint]
+            state["failures"] = 0
+            state["down_until"] = 0.0
+            state["latency"] = elapsed if state["latency"] is None else (
+                self.smoothing * elapsed
+                + (1 - self.smoothing) * state["latency"]
+            )
+
+    def failed(self, endpoint: Tuple[str, int]):
+        with self._lock:
+            state = self._state[endpoint]
+            state["failures"] += 1
+            cooldown = min(
+                self.cooldown_max,
+                self.cooldown * 2 ** (state["failures"] - 1)
+            )
+            state["down_until"] = time.monotonic() + random.uniform(
+                cooldown / 2, cooldown
+            )
+
+    def backoff(self, attempt: int) -> float:
+        # Full jitter, so retrying workers do not arrive in step
+        return random.uniform(
+            0, min(self.backoff_max, self.backoff_base * 2 ** attempt)
+        )
+
+    def status(self) -> List[dict]:
+        now = time.monotonic()
+        with self._lock:
+            return [
+                {
+                    "endpoint": f'{host}:{port}',
+                    "latency": self._state[(host, port)]["latency"],
+                    "failures": self._state[(host, port)]["failures"],
+                    "up": self._state[(host, port)]["down_until"] <= now,
+                }
+                for host, port in self.endpoints
+            ]
+
+
+class KeyNamespace:
+    """
+    Keeps a deployment's keys under its own prefix in a shared cluster, the
+    way etcd's namespace client does: keys and ranges of outgoing gateway
+    requests are prefixed and keys in the answers stripped again, so the
+    service builds and sees its usual keys.  A NUL range end (every key from
+    there on) stops at the end of the namespace instead.
+    """
+
+    def __init__(self, prefix: str):
+        self.prefix = prefix.encode('utf-8')
+        self.end = _increment_last_byte(self.prefix)
+
+    def _range(self, request: dict) -> dict:
+        request = dict(request)
+        if "key" in request:
+            request["key"] = _encode(self.prefix + _decode(request["key"]))
+        if "range_end" in request:
+            end = _decode(request["range_end"])
+            request["range_end"] = _encode(
+                self.end if end == b'\0' else self.prefix + end
+            )
+        return request
+
+    def _strip(self, kvs: list):
+        for kv in kvs:
+            kv["key"] = _encode(self.strip(_decode(kv["key"])))
+
+    def strip(self, key: bytes) -> bytes:
+        return key[len(self.prefix):]
+
+    def request(self, path: str, payload: dict) -> dict:
+        if path in ('/kv/range', '/kv/put', '/kv/deleterange'):
+            return self._range(payload)
+
+        if path == '/kv/txn':
+            payload = dict(payload)
+            payload["compare"] = [
+                self._range(compare) for compare in payload.get("compare", [])
+            ]
+            for branch in ("success", "failure"):
+                # request_range, request_put or request_delete_range
+                payload[branch] = [
+                    {kind: self._range(request) for kind, request in op.items()}
+                    for op in payload.get(branch, [])
+                ]
+            return payload
+
+        if path == '/watch' and "create_request" in payload:
+            return {"create_request": self._range(payload["create_request"])}
+
+        return payload
+
+    def response(self, path: str, result: dict) -> dict:
+        if path == '/kv/txn':
+            answers = [
+                answer for response in result.get("responses", [])
+                for answer in response.values()
+            ]
+        else:
+            answers = [result]
+
+        for answer in answers:
+            self._strip(answer.get("kvs", []))
+            self._strip(answer.get("prev_kvs", []))
+            if "prev_kv" in answer:
+                self._strip([answer["prev_kv"]])
+
+        return result
+
+
+def _not_sent(ex: requests.exceptions.RequestException) -> bool:
+    # The connection was never made, so the request can not have applied
+    if isinstance(ex, requests.exceptions.ConnectTimeout):
+        return True
+
+    reason = ex.args[0] if ex.args else None
+    return isinstance(reason, MaxRetryError) and \
+        isinstance(reason.reason, NewConnectionError)
+
+
+class PooledEtcd3Client(Etcd3Client):
+    """
+    Etcd3Client over several members: a bounded keep-alive connection pool,
+    a timeout on every call, and failover.  Reads (IDEMPOTENT) are retried
+    on another member after a jittered backoff; writes only when they were
+    never sent (connection refused or connect timeout), so a write is never
+    applied twice.  Keys stay under namespace, if given (KeyNamespace).
+    """
+
+    def __init__(
+        self, endpoints: EtcdEndpoints, pool_size=10, timeout=5.0,
+        connect_timeout=1.0, retries=2, api_path='/v3/', namespace=''
+    ):
+        host, port = endpoints.endpoints[0]
+        Etcd3Client.__init__(self, host=host, port=port, api_path=api_path)
+
+        self.endpoints = endpoints
+        self.retries = retries
+        self.timeout = (min(connect_timeout, timeout), timeout)
+        self.namespace = KeyNamespace(namespace) if namespace else None
+
+        adapter = HTTPAdapter(
+            pool_connections=len(endpoints.endpoints), pool_maxsize=pool_size
+        )
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def member_url(self, endpoint: Tuple[str, int], path: str) -> str:
+        host, port = endpoint
+        if ':' in host:
+            host = f'[{host}]'
+        return f'{self.protocol}://{host}:{port}{self.api_path}' \
+            f'{path.lstrip("/")}'
+
+    def get_url(self, path):
+        # Preferred member; post() resolves the member again per attempt
+        return self.member_url(self.endpoints.best(), path)
+
+    def post(self, url, json=None, timeout=None, **kwargs):
+        path = '/' + url.split(self.api_path, 1)[-1]
+        idempotent = path in IDEMPOTENT
+        tried = []
+
+        if self.namespace:
+            # Etcd3Client.transaction sends its body serialized already
+            if json is None and kwargs.get('data'):
+                json = orjson.loads(kwargs.pop('data'))
+            if json is not None:
+                json = self.namespace.request(path, json)
+
+        for attempt in range(self.retries + 1):
+            endpoint = self.endpoints.pick(exclude=tried)
+            tried.append(endpoint)
+            last = attempt == self.retries
+
+            started = time.monotonic()
+            try:
+                resp = self.session.post(
+                    self.member_url(endpoint, path), json=json,
+                    timeout=timeout or self.timeout, **kwargs
+                )
+            except (
+                requests.exceptions.Timeout,
+                requests.exceptions.ConnectionError
+            ) as ex:
+                self.endpoints.failed(endpoint)
+                if not last and (idempotent or _not_sent(ex)):
+                    time.sleep(self.endpoints.backoff(attempt))
+                    continue
+
+                if isinstance(ex, requests.exceptions.Timeout):
+                    raise etcd_exceptions.ConnectionTimeoutError(str(ex))
+                raise etcd_exceptions.ConnectionFailedError(str(ex))
+
+            if resp.status_code in UNAVAILABLE:
+                self.endpoints.failed(endpoint)
+                if not last and idempotent:
+                    time.sleep(self.endpoints.backoff(attempt))
+                    continue
+            else:
+                self.endpoints.succeeded(endpoint, time.monotonic() - started)
+
+            if resp.status_code in _EXCEPTIONS_BY_CODE:
+                raise _EXCEPTIONS_BY_CODE[resp.status_code](
+                    resp.text, resp.reason
+                )
+            if resp.status_code != requests.codes['ok']:
+                raise etcd_exceptions.Etcd3Exception(resp.text, resp.reason)
+
+            result = orjson.loads(resp.content)
+            if self.namespace:
+                return self.namespace.response(path, result)
+            return result
@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+
+
+import json
+import time
+
+from etcd3gw.utils import _decode, _encode, _increment_last_byte
+
+from service.codec import loads
+
+
+# etcd's default limit (--max-txn-ops) on compares, and on operations per
+# branch, in one transaction
+TXN_OPS_MAX = 128
+
+# Bytes of operations sent in one transaction, as the gateway's JSON: base64
+# keeps this under etcd's default request limit (--max-request-bytes, 1.5
+# MiB) once decoded, with room for the rest of the request
+TXN_BYTES_MAX = 1024 * 1024
+
+
+# etcd transaction building blocks
+def _txn_absent(key: str) -> dict:
+    return {
+        "key": _encode(key), "result": "EQUAL",
+        "target": "CREATE", "create_revision": 0
+    }
+
+
+def _txn_present(key: str) -> dict:
+    return {
+        "key": _encode(key), "result": "GREATER",
+        "target": "CREATE", "create_revision": 0
+    }
+
+
+def _txn_put(key: str, value, lease: int = 0) -> dict:
+    request = {"key": _encode(key), "value": _encode(value)}
+    if lease:
+        request["lease"] = lease
+    return {"request_put": request}
+
+
+def _txn_bytes(ops: list) -> int:
+    return len(json.dumps(ops))
+
+
+def _txn_count(key: str) -> dict:
+    return {"request_range": {"key": _encode(key), "count_only": True}}
+
+
+def _txn_counted(response: dict) -> int:
+    return int(response["response_range"].get("count", 0))
+
+
+def _txn_delete(key: str) -> dict:
+    return {"request_delete_range": {"key": _encode(key)}}
+
+
+def _txn_get(key: str) -> dict:
+    return {"request_range": {"key": _encode(key)}}
+
+
+def _txn_range(prefix: str) -> dict:
+    return {"request_range": {
+        "key": _encode(prefix),
+        "range_end": _encode(_increment_last_byte(prefix))
+    }}
+
+
+def _txn_ranged(response: dict) -> list:
+    """Items a _txn_range read, keys and values decoded to bytes"""
+
+    kvs = response["response_range"].get("kvs", [])
+    for item in kvs:
+        item["key"] = _decode(item["key"])
+        item["value"] = _decode(item.get("value", ""))
+    return kvs
+
+
+def _txn_got(response: dict):
+    """(data, mod_revision) of the key a _txn_get read, None if absent"""
+
+    kvs = response["response_range"].get("kvs", [])
+    if not kvs:
+        return None
+    return loads(_decode(kvs[0]["value"])), int(kvs[0]["mod_revision"])
+
+
+def _txn_unchanged(key: str, mod_revision: int) -> dict:
+    return {
+        "key": _encode(key), "result": "EQUAL",
+        "target": "MOD", "mod_revision": mod_revision
+    }
+
+
+def _txn_leased(key: str, lease: int) -> dict:
+    return {
+        "key": _encode(key), "result": "EQUAL",
+        "target": "LEASE", "lease": lease
+    }
+
+
+def _remaining(data: dict) -> int:
+    """Seconds left on a reservation, from the expiry stored with it"""
+    return max(0, int(data["expires"] - time.time()))
+
+
+def _expired(data: dict) -> bool:
+    # On a shared lease the key can outlive its reservation by a window
+    return "expires" in data and data["expires"] <= time.time()
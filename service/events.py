@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+
+
+import asyncio
+import json
+import time
+from collections import deque
+
+from service.codec import loads
+from service.storage import StorageService
+
+
+class Subscription:
+    """
+    One SSE client: a bounded queue of formatted messages.  A subscriber
+    whose queue fills up is dropped rather than slowing everybody down; it
+    is sent what was queued, then the stream ends and the client resumes
+    with Last-Event-ID.
+    """
+
+    def __init__(self, hub, queue_size: int, keepalive: float):
+        self.hub = hub
+        self.queue = asyncio.Queue(maxsize=queue_size)
+        self.keepalive = keepalive
+        self.dropped = False
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self) -> str:
+        if self.dropped and self.queue.empty():
+            raise StopAsyncIteration
+
+        try:
+            return await asyncio.wait_for(self.queue.get(), self.keepalive)
+        except asyncio.TimeoutError:
+            # Comment line: keeps proxies from closing an idle stream
+            return ': keepalive\n\n'
+
+    def close(self):
+        self.hub.unsubscribe(self)
+
+
+class ReservationEvents:
+    """
+    Fans one etcd watch on the reservation prefix out to any number of SSE
+    subscribers in this worker.  The watch starts with the first subscriber.
+
+    Every message has the etcd revision of its change as id.  The last
+    history_size messages are kept, so a client reconnecting with
+    Last-Event-ID gets what it missed; if that is no longer kept (or
+    predates the watch) it gets a 'reset' event and should list again.
+    """
+
+    def __init__(
+        self, storage_service: StorageService,
+        queue_size=100, history_size=1000, keepalive=15.0
+    ):
+        self.storage_service = storage_service
+        self.queue_size = queue_size
+        self.keepalive = keepalive
+
+        self._subscribers = set()
+        self._listeners = []
+        self._history = deque(maxlen=history_size)     # (revision, message)
+        self._loop = None
+        self._watcher = None
+        self._starting = None
+
+        # Changes up to this revision can not be replayed
+        self.revision = 0
+        self.replayable = 0
+        self.dropped = 0
+
+    async def start(self):
+        # Created here so it belongs to the serving event loop
+        if self._starting is None:
+            self._starting = asyncio.Lock()
+
+        async with self._starting:
+            if self._watcher is not None:
+                return
+
+            self._loop = asyncio.get_running_loop()
+            self._watcher, self.revision = \
+                await self.storage_service.watch_reservations(
+                    self._on_event, self._on_reset
+                )
+            self.replayable = self.revision
+
+    def close(self):
+        if self._watcher is not None:
+            self._watcher.stop()
+            self._watcher = None
+
+    def stats(self) -> dict:
+        return {
+            "subscribers": len(self._subscribers),
+            "revision": self.revision,
+            "history": len(self._history),
+            "dropped": self.dropped,
+        }
+
+    async def subscribe(self, last_event_id: str = None) -> Subscription:
+        await self.start()
+
+        subscription = Subscription(self, self.queue_size, self.keepalive)
+
+        # Replay and registration happen without yielding to the loop, so
+        # no event can fall between them
+        if last_event_id is not None:
+            try:
+                last = int(last_event_id)
+            except ValueError:
+                last = -1
+
+            if last < self.replayable:
+                self._deliver(subscription, self._reset_message())
+            else:
+                for revision, message in self._history:
+                    if revision > last:
+                        self._deliver(subscription, message)
+
+        if not subscription.dropped:
+            self._subscribers.add(subscription)
+
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        self._subscribers.discard(subscription)
+
+    def listen(self, listener):
+        """
+        In-process consumer of the same watch: listener(name, project, data)
+        is called on the event loop for every change, and with name 'reset'
+        (project None) when changes were lost.
+        """
+
+        self._listeners.append(listener)
+
+    # Watch thread side: hand everything over to the event loop
+    def _on_event(self, event: dict):
+        self._loop.call_soon_threadsafe(self._publish, event)
+
+    def _on_reset(self, revision: int):
+        self._loop.call_soon_threadsafe(self._reset, revision)
+
+    # Event loop side
+    def _publish(self, event: dict):
+        kv = event["kv"]
+        revision = int(kv["mod_revision"])
+        project = kv["key"].decode("utf-8").split('/')[-1]
+
+        if event.get("type") == "DELETE":
+            # Revoked or expired, etcd does not tell them apart
+            name, data = "deleted", {"project": project}
+        else:
+            value = loads(kv["value"])
+            name = "created" if int(kv.get("version", 0)) == 1 else "updated"
+            data = {
+                "project": project, "email": value["email"],
+                "id": int(value["id"]),
+                "ttl": max(0, int(value["expires"] - time.time()))
+                if "expires" in value else int(value["ttl"])
+            }
+
+        message = self._format(revision, name, data)
+
+        if len(self._history) == self._history.maxlen:
+            self.replayable = self._history[0][0]
+        self._history.append((revision, message))
+        self.revision = revision
+
+        for subscription in list(self._subscribers):
+            self._deliver(subscription, message)
+
+        self._notify(name, project, data)
+
+    def _reset(self, revision: int):
+        # Changes were lost: nothing before this point can be replayed
+        self._history.clear()
+        self.revision = self.replayable = revision
+
+        message = self._reset_message()
+        for subscription in list(self._subscribers):
+            self._deliver(subscription, message)
+
+        self._notify("reset", None, {})
+
+    def _notify(self, name: str, project: str, data: dict):
+        for listener in self._listeners:
+            try:
+                listener(name, project, data)
+            except Exception as err:
+                print(f'Reservation listener failed: {err}')
+
+    def _reset_message(self) -> str:
+        return self._format(self.revision, "reset", {})
+
+    def _deliver(self, subscription: Subscription, message: str):
+        try:
+            subscription.queue.put_nowait(message)
+        except asyncio.QueueFull:
+            # Slow consumer: drop it, it resumes from its last event id
+            subscription.dropped = True
+            self._subscribers.discard(subscription)
+            self.dropped += 1
+
+    @staticmethod
+    def _format(revision: int, name: str, data: dict) -> str:
+        return f'id: {revision}\nevent: {name}\ndata: {json.dumps(data)}\n\n'
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+
+
+class StorageException(Exception):
+    def __init__(self, status_code=500, status_message="Undefined"):
+        Exception.__init__(self)
+        self.status_code = status_code
+        self.status_message = status_message
+
+
+class ProjectNameNotFound(StorageException):
+    def __init__(self, project_name):
+        StorageException.__init__(
+            self, status_code=404,
+            status_message=f'Project {project_name} not found'
+        )
+        self.project_name = project_name
+
+
+class ScenarioNameNotFound(StorageException):
+    def __init__(self, scenario_name):
+        StorageException.__init__(
+            self, status_code=404,
+            status_message=f'Scenario {scenario_name} not found'
+        )
+        self.scenario_name = scenario_name
+
+
+class ReservationNameNotFound(StorageException):
+    def __init__(self, reservation_name):
+        StorageException.__init__(
+            self, status_code=404,
+            status_message=f'Reservation {reservation_name} not found'
+        )
+        self.reservation_name = reservation_name
+
+
+class ProjectNameExists(StorageException):
+    def __init__(self, project_name):
+        StorageException.__init__(
+            self, status_code=409,
+            status_message=f'Project {project_name} exists'
+        )
+        self.project_name = project_name
+
+
+class ScenarioNameExists(StorageException):
+    def __init__(self, scenario_name):
+        StorageException.__init__(
+            self, status_code=409,
+            status_message=f'Scenario {scenario_name} exists'
+        )
+        self.scenario_name = scenario_name
+
+
+class ReservationExists(StorageException):
+    def __init__(self, reservation_name):
+        StorageException.__init__(
+            self, status_code=409,
+            status_message=f'Reservation for {reservation_name} exists'
+        )
+        self.reservation_name = reservation_name
+
+
+class ReservationPermissionDenied(StorageException):
+    def __init__(self, requester, owner):
+        self.status_code = 401
+        self.status_message = f'You ({requester}) are not the owner ({owner}).'
+        self.requester = requester
+        self.owner = owner
+
+
+class EntryTooLarge(StorageException):
+    def __init__(self, name):
+        StorageException.__init__(
+            self, status_code=413,
+            status_message=f'{name} is too large to store'
+        )
+        self.name = name
+
+
+class WaiterNotFound(StorageException):
+    def __init__(self, project, email):
+        StorageException.__init__(
+            self, status_code=404,
+            status_message=f'{email} is not waiting for {project}'
+        )
+        self.project = project
+        self.email = email
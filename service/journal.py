@@ -0,0 +1,198 @@
+#!/usr/bin/env python3
+
+
+import json
+import os
+import threading
+import time
+
+
+class JournalCorrupt(Exception):
+    pass
+
+
+class Journal:
+    """
+    Write-ahead log plus compacted snapshot for LocalStorage.
+
+    Each change is appended to '<snapshot>.log' as one JSON line, so a write
+    costs the same however large the catalog is.  commit() waits until the
+    flusher thread has fsync'ed the log past the caller's records; concurrent
+    writers share one fsync (group commit).  Once the log holds as many
+    records as the catalog has entries, the whole dataset is written to a
+    temporary file, fsync'ed and renamed over the snapshot, then the log is
+    emptied.
+
+    On load the snapshot is read and newer log records replayed; a record
+    torn by a crash mid-append ends the replay and is cut off the log.
+    """
+
+    def __init__(self, snapshot_name, commit_interval=0.005, compact_min=1000):
+        self.snapshot_name = snapshot_name
+        self.log_name = f'{snapshot_name}.log'
+        self.commit_interval = commit_interval
+        self.compact_min = compact_min
+
+        self.seq = 0        # last record appended
+        self.synced = 0     # last record known to be on disk
+        self.records = 0    # records in the log since the last snapshot
+
+        self._cond = threading.Condition()
+        self._stop = threading.Event()
+        self._log = None
+        self._flusher = None
+
+    # Recovery
+    def load(self) -> dict:
+        data = {}
+
+        try:
+            with open(self.snapshot_name, "r") as infile:
+                snapshot = json.load(infile)
+        except FileNotFoundError:
+            snapshot = None
+        except ValueError as err:
+            # Snapshots are replaced atomically, so this is not a torn write
+            raise JournalCorrupt(f'{self.snapshot_name}: {err}')
+
+        if snapshot is not None:
+            if "seq" in snapshot and "data" in snapshot:
+                data, self.seq = snapshot["data"], snapshot["seq"]
+            else:
+                # Plain data file from before the journal existed
+                data = snapshot
+
+        good = 0
+        try:
+            with open(self.log_name, "rb") as infile:
+                for line in infile:
+                    try:
+                        if not line.endswith(b'\n'):
+                            raise ValueError('incomplete record')
+                        record = json.loads(line)
+                    except ValueError:
+                        print(f'Journal: dropping torn record at {good}')
+                        break
+
+                    good += len(line)
+                    if record["seq"] <= self.seq:
+                        continue
+
+                    self._apply(data, record)
+                    self.seq = record["seq"]
+                    self.records += 1
+        except FileNotFoundError:
+            pass
+
+        os.makedirs(os.path.dirname(self.log_name) or '.', exist_ok=True)
+        self._log = open(self.log_name, "ab")
+        self._log.truncate(good)
+        self.synced = self.seq
+
+        self._flusher = threading.Thread(target=self._flush, daemon=True)
+        self._flusher.start()
+
+        return data
+
+    @staticmethod
+    def _apply(data: dict, record: dict):
+        entries = data.setdefault(record["kind"], {})
+
+        if record["op"] == "put":
+            entries[record["name"]] = record["value"]
+        else:
+            entries.pop(record["name"], None)
+
+    # Writing
+    def append(self, op: str, kind: str, name: str, value=None):
+        with self._cond:
+            self.seq += 1
+            self.records += 1
+
+            record = {"seq": self.seq, "op": op, "kind": kind, "name": name}
+            if value is not None:
+                record["value"] = value
+
+            self._log.write(json.dumps(record).encode("utf-8") + b'\n')
+            self._cond.notify_all()
+
+    def commit(self):
+        """Block until everything appended so far is on disk"""
+
+        with self._cond:
+            target = self.seq
+            while self.synced < target:
+                self._cond.wait()
+
+    def close(self):
+        """Stop the flusher once everything appended is on disk"""
+
+        if self._flusher is None:
+            return
+
+        with self._cond:
+            self._stop.set()
+            self._cond.notify_all()
+        self._flusher.join()
+        self._flusher = None
+
+        self._log.close()
+
+    def _flush(self):
+        while True:
+            with self._cond:
+                while self.synced >= self.seq and not self._stop.is_set():
+                    self._cond.wait()
+                if self.synced >= self.seq:
+                    return
+
+            # Let concurrent writers join this fsync
+            if not self._stop.is_set():
+                time.sleep(self.commit_interval)
+
+            with self._cond:
+                target = self.seq
+                self._log.flush()
+                fileno = self._log.fileno()
+
+            os.fsync(fileno)
+
+            with self._cond:
+                self.synced = max(self.synced, target)
+                self._cond.notify_all()
+
+    # Compaction
+    def needs_compaction(self, size: int) -> bool:
+        return self.records >= max(self.compact_min, size)
+
+    def compact(self, data: dict):
+        """
+        Write data (which must include every appended record, so call with
+        the storage lock held) as the new snapshot, then empty the log.
+        """
+
+        with self._cond:
+            temp_name = f'{self.snapshot_name}.tmp'
+            with open(temp_name, "w") as outfile:
+                json.dump({"seq": self.seq, "data": data}, outfile)
+                outfile.flush()
+                os.fsync(outfile.fileno())
+
+            os.replace(temp_name, self.snapshot_name)
+            self._fsync_dir()
+
+            self._log.truncate(0)
+            self._log.flush()
+            os.fsync(self._log.fileno())
+
+            self.synced = self.seq
+            self.records = 0
+            self._cond.notify_all()
+
+    def _fsync_dir(self):
+        # Make the rename itself durable
+        fd = os.open(os.path.dirname(self.snapshot_name) or '.', os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
@@ -0,0 +1,231 @@
+#!/usr/bin/env python3
+
+
+import asyncio
+import math
+import os
+import re
+import socket
+import time
+import uuid
+
+from starlette.responses import JSONResponse
+
+from service.metrics import REFUSED
+from service.storage import StorageService
+
+
+# Never refused: probes, metrics and the long-lived streams and polls
+EXEMPT = re.compile(
+    r'^/(ready|metrics|version)$'
+    r'|^/reserve/project/events$'
+    r'|^/reserve/project/[^/]+/queue/[^/]+$'
+)
+
+
+def retry_after(wait: float) -> str:
+    return str(max(1, math.ceil(wait)))
+
+
+class TokenBucket:
+    """Tokens refilled at rate a second, up to burst; a request takes one"""
+
+    __slots__ = ("tokens", "updated")
+
+    def __init__(self, burst: float, now: float):
+        self.tokens = burst
+        self.updated = now
+
+    def refill(self, rate: float, burst: float, now: float) -> float:
+        self.tokens = min(burst, self.tokens + (now - self.updated) * rate)
+        self.updated = now
+        return self.tokens
+
+
+class RateLimiter:
+    """
+    Token buckets per requester, by scope: "client" address or reservation
+    "email", each with its (rate a second, burst); a rate of 0 disables a
+    scope.  Requests are admitted from this worker's buckets alone, with
+    no storage round trip.
+
+    Every sync_interval, the counts of requests each worker admitted are
+    exchanged through the storage backend (share_usage) and charged to the
+    same requesters' buckets in the other workers.  So a requester's budget
+    is shared by every worker, give or take one interval of its traffic.
+
+    Buckets refilled to full are dropped every PRUNE_INTERVAL seconds (by
+    check, whether or not usage is shared), so idle requesters cost nothing.
+    """
+
+    PRUNE_INTERVAL = 10.0
+
+    def __init__(
+        self, storage_service: StorageService, limits: dict,
+        sync_interval: float = 1.0
+    ):
+        self.storage_service = storage_service
+        self.limits = {
+            scope: (rate, max(1.0, burst))
+            for scope, (rate, burst) in limits.items() if rate > 0
+        }
+        self.sync_interval = sync_interval
+        self.worker = f'{socket.gethostname()}-{os.getpid()}-' \
+            f'{uuid.uuid4().hex[:8]}'
+
+        self._buckets = {}      # "scope:key" -> TokenBucket
+        self._used = {}         # "scope:key" -> admitted here, cumulative
+        self._seen = {}         # (worker, "scope:key") -> its count seen
+        self._workers = set()   # other workers whose records were seen
+        self._pruned = time.monotonic()
+        self._task = None
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.limits)
+
+    def start(self):
+        if self.enabled and self.sync_interval > 0 and self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def check(self, scope: str, key: str) -> float:
+        """
+        0 when the request is admitted (taking a token), otherwise the
+        seconds until it would be.
+        """
+
+        limit = self.limits.get(scope)
+        if limit is None or not key:
+            return 0.0
+
+        now = time.monotonic()
+        if now - self._pruned >= self.PRUNE_INTERVAL:
+            self._prune()
+
+        rate, burst = limit
+        name = f'{scope}:{key}'
+        bucket = self._bucket(name, burst)
+
+        tokens = bucket.refill(rate, burst, now)
+        if tokens < 1:
+            REFUSED.labels(f'rate_{scope}').inc()
+            return (1 - tokens) / rate
+
+        bucket.tokens -= 1
+        self._used[name] = self._used.get(name, 0) + 1
+        return 0.0
+
+    def _bucket(self, name: str, burst: float) -> TokenBucket:
+        bucket = self._buckets.get(name)
+        if bucket is None:
+            bucket = self._buckets[name] = TokenBucket(
+                burst, time.monotonic()
+            )
+        return bucket
+
+    async def sync(self):
+        self._prune()
+        records = await self.storage_service.share_usage(
+            self.worker, dict(self._used), 3 * self.sync_interval
+        )
+        self.merge(records)
+
+    def merge(self, records: dict):
+        """
+        Charge what the other workers admitted since their records were
+        last seen.  A worker seen for the first time only sets the baseline,
+        its earlier traffic has already been refilled or charged.
+        """
+
+        now = time.monotonic()
+        seen = {}
+
+        for worker, usage in records.items():
+            for name, count in usage.items():
+                seen[(worker, name)] = count
+                if worker not in self._workers:
+                    continue
+
+                # Lower than seen: that worker forgot the key meanwhile
+                last = self._seen.get((worker, name), 0)
+                self._charge(name, count - last if count >= last else count, now)
+
+        self._seen = seen
+        self._workers = set(records)
+
+    def _charge(self, name: str, count: int, now: float):
+        limit = self.limits.get(name.split(':', 1)[0])
+        if limit is None or count <= 0:
+            return
+
+        rate, burst = limit
+        bucket = self._bucket(name, burst)
+        bucket.refill(rate, burst, now)
+        # May go below zero: the requester waits off its debt
+        bucket.tokens -= count
+
+    def _prune(self):
+        # Buckets refilled to full hold nothing worth sharing
+        now = self._pruned = time.monotonic()
+        for name, bucket in list(self._buckets.items()):
+            rate, burst = self.limits[name.split(':', 1)[0]]
+            if bucket.refill(rate, burst, now) >= burst:
+                del self._buckets[name]
+                self._used.pop(name, None)
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.sync_interval)
+
+            try:
+                await self.sync()
+            except Exception as err:
+                print(f'Rate limit usage not shared: {err}')
+
+
+class AdmissionMiddleware:
+    """
+    ASGI middleware shedding load before storage saturates.  With
+    max_inflight requests already in progress in this worker, a new one
+    gets 503; a client address over its rate gets 429.  Both come with
+    Retry-After.  EXEMPT paths are always admitted.
+    """
+
+    def __init__(self, app, limiter: RateLimiter, max_inflight: int = 0):
+        self.app = app
+        self.limiter = limiter
+        self.max_inflight = max_inflight
+        self.inflight = 0
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or EXEMPT.match(scope["path"]):
+            return await self.app(scope, receive, send)
+
+        if self.max_inflight and self.inflight >= self.max_inflight:
+            REFUSED.labels('busy').inc()
+            return await self._refuse(scope, receive, send, 503, 1.0)
+
+        client = scope.get("client")
+        wait = self.limiter.check("client", client[0] if client else None)
+        if wait:
+            return await self._refuse(scope, receive, send, 429, wait)
+
+        self.inflight += 1
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.inflight -= 1
+
+    @staticmethod
+    async def _refuse(scope, receive, send, status_code: int, wait: float):
+        detail = 'Too many requests' if status_code == 429 else 'Server busy'
+        response = JSONResponse(
+            {"detail": detail}, status_code=status_code,
+            headers={"Retry-After": retry_after(wait)}
+        )
+        await response(scope, receive, send)
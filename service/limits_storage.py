@@ -0,0 +1,46 @@
+#!/usr/bin/env python3
+
+
+import math
+
+from service.codec import loads
+from service.etcd_txn import _txn_put, _txn_range, _txn_ranged
+
+
+class EtcdUsage:
+    """
+    Rate limiting usage shared between workers (see Storage.share_usage)
+    through etcd, mixed into EtcdStorage.
+    """
+
+    # Rate limiting usage, one key per worker
+    RATE_USAGE = "/ratelimit/worker/"
+
+    # Lease of this worker's record, granted on first use
+    _usage_lease = None
+
+    def share_usage(self, worker: str, usage: dict, ttl: float) -> dict:
+        """
+        One transaction writes this worker's record and reads them all.
+        The record is on a lease of its own, kept alive here, so those of
+        workers that stopped disappear after ttl.
+        """
+
+        if self._usage_lease is None or \
+                not self._keep_alive(self._usage_lease):
+            self._usage_lease = self.create_lease(math.ceil(ttl)).id
+
+        key = f'{self.RATE_USAGE}{worker}'
+        _, responses = self._txn([], [
+            _txn_put(key, self._dumps(usage), self._usage_lease),
+            _txn_range(self.RATE_USAGE)
+        ])
+
+        records = {
+            item["key"].decode("utf-8")[len(self.RATE_USAGE):]:
+                loads(item["value"])
+            for item in _txn_ranged(responses[1])
+        }
+        records.pop(worker, None)
+
+        return records
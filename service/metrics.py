@@ -0,0 +1,266 @@
+#!/usr/bin/env python3
+
+
+import time
+import traceback
+from contextvars import ContextVar
+from functools import wraps
+
+from etcd3gw.client import Etcd3Client
+from fastapi.routing import APIRoute
+from prometheus_client import Counter, Gauge, Histogram
+
+from service.storage import StorageException
+
+
+BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+    0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0
+)
+
+REQUEST_SECONDS = Histogram(
+    'conductor_request_seconds', 'HTTP requests by route and status',
+    ['method', 'route', 'status'], buckets=BUCKETS
+)
+STORAGE_SECONDS = Histogram(
+    'conductor_storage_seconds',
+    'Storage method calls (outcome ok, storage_error or failure)',
+    ['method', 'outcome'], buckets=BUCKETS
+)
+ETCD_SECONDS = Histogram(
+    'conductor_etcd_request_seconds', 'etcd gateway round trips by API path',
+    ['path'], buckets=BUCKETS
+)
+RESERVATIONS = Gauge(
+    'conductor_reservations_active', 'Reservations currently held'
+)
+LEASES = Gauge(
+    'conductor_leases', 'Leases currently granted by the storage backend'
+)
+FAILURES = Counter(
+    'conductor_request_failures',
+    'Unexpected errors failing a request or ending its stream, by route and '
+    'exception type',
+    ['route', 'error']
+)
+REFUSED = Counter(
+    'conductor_requests_refused',
+    'Requests refused by admission control (rate_client, rate_email, busy)',
+    ['reason']
+)
+
+# Per request: route template, seconds in storage, in the endpoint and
+# rendering responses
+_timing: ContextVar = ContextVar('conductor_timing', default=None)
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware observing every HTTP request in REQUEST_SECONDS, by
+    route template (not raw path) and status code.  With server_timing it
+    also adds a Server-Timing header splitting the time before the response
+    starts into storage, endpoint (the rest of the handler) and serialize
+    (request validation and response serialization).
+    """
+
+    def __init__(self, app, server_timing: bool = False):
+        self.app = app
+        self.server_timing = server_timing
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        timing = {
+            "route": None, "storage": 0.0, "endpoint": 0.0, "render": 0.0
+        }
+        token = _timing.set(timing)
+        started = time.perf_counter()
+        status = 500
+
+        async def send_timed(message):
+            nonlocal status
+
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                if self.server_timing:
+                    header = self._server_timing(
+                        timing, time.perf_counter() - started
+                    )
+                    message = dict(message, headers=list(
+                        message.get("headers", [])
+                    ) + [(b'server-timing', header.encode('latin-1'))])
+
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_timed)
+        finally:
+            REQUEST_SECONDS.labels(
+                scope["method"], timing["route"] or 'unmatched', str(status)
+            ).observe(time.perf_counter() - started)
+            _timing.reset(token)
+
+    @staticmethod
+    def _server_timing(timing: dict, total: float) -> str:
+        storage = timing["storage"]
+        endpoint = max(0.0, timing["endpoint"] - storage)
+        serialize = max(0.0, total - timing["endpoint"])
+
+        return ', '.join(
+            f'{name};dur={seconds * 1000:.2f}' for name, seconds in (
+                ("storage", storage), ("endpoint", endpoint),
+                ("serialize", serialize), ("total", total)
+            )
+        )
+
+
+def record_failure(err: Exception, what: str = 'Request failed'):
+    """
+    Count an unexpected error in FAILURES, under the route of the request
+    it happened in, and print it with its traceback.
+    """
+
+    timing = _timing.get()
+    route = (timing or {}).get("route") or 'unmatched'
+
+    FAILURES.labels(route, type(err).__name__).inc()
+    print(f'{what} ({route}): {err!r}')
+    traceback.print_exception(type(err), err, err.__traceback__)
+
+
+class TimedRoute(APIRoute):
+    """Route class recording its template and endpoint time per request"""
+
+    def __init__(self, path, endpoint, **kwargs):
+        @wraps(endpoint)
+        async def timed(*args, **kw):
+            timing = _timing.get()
+            rendered = timing["render"] if timing is not None else 0.0
+            started = time.perf_counter()
+            try:
+                return await endpoint(*args, **kw)
+            finally:
+                if timing is not None:
+                    # A response rendered by the endpoint counts as serialize
+                    timing["endpoint"] += time.perf_counter() - started \
+                        - (timing["render"] - rendered)
+
+        APIRoute.__init__(self, path, timed, **kwargs)
+
+    def get_route_handler(self):
+        handler = APIRoute.get_route_handler(self)
+        path = self.path
+
+        async def route_handler(request):
+            # Set before validation, so 422s are counted under their route
+            timing = _timing.get()
+            if timing is not None:
+                timing["route"] = path
+            return await handler(request)
+
+        return route_handler
+
+
+def timed_render(render):
+    """
+    Decorates a Response class's render, so its time is serialize time even
+    when the endpoint builds the response (rendering it in the constructor).
+    """
+
+    @wraps(render)
+    def timed(self, content):
+        started = time.perf_counter()
+        try:
+            return render(self, content)
+        finally:
+            timing = _timing.get()
+            if timing is not None:
+                timing["render"] += time.perf_counter() - started
+
+    return timed
+
+
+class InstrumentedStorage:
+    """
+    Wraps an attached (async) storage backend: every method call is timed
+    in STORAGE_SECONDS and added to the request's storage time, and etcd
+    gateway round trips are timed per API path in ETCD_SECONDS.
+    """
+
+    def __init__(self, svc):
+        self._svc = svc
+        self._count_round_trips(svc)
+
+    def __getattr__(self, attr):
+        method = getattr(self._svc, attr)
+        if not callable(method):
+            return method
+
+        @wraps(method)
+        async def call(*args, **kwargs):
+            started = time.perf_counter()
+            outcome = 'ok'
+            try:
+                return await method(*args, **kwargs)
+            except StorageException:
+                outcome = 'storage_error'
+                raise
+            except Exception:
+                outcome = 'failure'
+                raise
+            finally:
+                elapsed = time.perf_counter() - started
+                STORAGE_SECONDS.labels(attr, outcome).observe(elapsed)
+
+                timing = _timing.get()
+                if timing is not None:
+                    timing["storage"] += elapsed
+
+        return call
+
+    @staticmethod
+    def _count_round_trips(svc):
+        # Synchronous etcd client (also behind the cache and the async one)
+        client = getattr(getattr(svc, '_sync', svc), 'storage_service', None)
+        if isinstance(client, Etcd3Client):
+            client.post = _timed_post(client.post)
+
+        # Native async etcd backend
+        if callable(getattr(type(svc), '_post', None)):
+            svc._post = _timed_async_post(svc._post)
+
+
+def _path(url: str) -> str:
+    return url.split('/v3', 1)[-1]
+
+
+def _timed_post(post):
+    @wraps(post)
+    def timed(url, *args, **kwargs):
+        with ETCD_SECONDS.labels(_path(url)).time():
+            return post(url, *args, **kwargs)
+
+    return timed
+
+
+def _timed_async_post(post):
+    @wraps(post)
+    async def timed(path, *args, **kwargs):
+        with ETCD_SECONDS.labels(path).time():
+            return await post(path, *args, **kwargs)
+
+    return timed
+
+
+async def update_gauges(storage_service):
+    """Refresh the reservation and lease gauges (on scrape)"""
+
+    try:
+        RESERVATIONS.set(await storage_service.count_reservations())
+
+        leases = await storage_service.count_leases()
+        if leases is not None:
+            LEASES.set(leases)
+    except Exception as err:
+        print(f'Metrics gauges not updated: {err}')
@@ -1,16 +1,30 @@
 #!/usr/bin/env python3
 
 
-from pydantic import BaseModel, EmailStr
+import re
+from functools import lru_cache
+from typing import List
+
+from pydantic import BaseModel, EmailStr, Field
 from pydantic import validator
 import validators
 
 
+# Names plainly valid as URL paths (lowercase letters, digits, unreserved
+# punctuation), accepted without the full URL check
+SIMPLE_PATH = re.compile(r'[a-z0-9][a-z0-9._~-]*')
+
+
+@lru_cache(maxsize=4096)
+def _valid_url(param: str) -> bool:
+    return bool(validators.url(f'http://localhost/{param}'))
+
+
 # Validator methods
 def valid_url_path(param: str) -> str:
     if not param.islower():
         raise ValueError("name must be valid URL path, must be lowercase")
-    if not validators.url(f'http://localhost/{param}'):
+    if not SIMPLE_PATH.fullmatch(param) and not _valid_url(param):
         raise ValueError("name must be a valid URL path, URL path invalid")
     return param
 
@@ -71,6 +85,13 @@ class ScenarioInput(Scenario):
         }
 
 
+class BulkResult(BaseModel):
+    # Outcome of one item of a bulk request, as its own request would end
+    name: str
+    status_code: int
+    detail: str = None
+
+
 class LeaseRequest(BaseModel):
     ttl: int
 
@@ -102,3 +123,61 @@ class ReservationInput(ReservationCore):
     _project_is_valid_url = validator('project', allow_reuse=True)(valid_url_path)
 
     duration: int
+
+
+class ReservationImport(ReservationCore):
+    # Active reservation of a snapshot: it runs for ttl more seconds
+    _project_is_valid_url = validator('project', allow_reuse=True)(valid_url_path)
+
+    ttl: int = Field(..., ge=1)
+
+
+class ImportSummary(BaseModel):
+    # Entries written per kind; lines rejected, with the first few errors
+    projects: int = 0
+    scenarios: int = 0
+    reservations: int = 0
+    rejected: int = 0
+    errors: List[str] = []
+
+
+class ReservationRenewal(ReservationEmail):
+    # New duration from now (default: the reservation's own), and whether
+    # the service keeps renewing it (default: unchanged)
+    duration: int = Field(None, ge=1)
+    auto: bool = None
+
+    class Config:
+        schema_extra = {
+            "example": {
+                "email": "student@example.com",
+                "duration": 3600,
+                "auto": False
+            }
+        }
+
+
+class WaitlistInput(ReservationEmail):
+    # Reservation duration once granted; higher priority is served first
+    duration: int = Field(..., ge=1)
+    priority: int = 0
+
+    class Config:
+        schema_extra = {
+            "example": {
+                "email": "student@example.com",
+                "duration": 3600,
+                "priority": 0
+            }
+        }
+
+
+class Waiter(WaitlistInput, ReservationProject):
+    # 1-based place in the waitlist
+    position: int
+
+
+class WaitlistStatus(ReservationCore):
+    # Position while waiting, or the reservation once handed off
+    position: int = None
+    reservation: Reservation = None
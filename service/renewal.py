@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+
+
+import asyncio
+import os
+import socket
+import uuid
+
+from service.storage import StorageService
+
+
+class AutoRenewal:
+    """
+    Periodic pass renewing every reservation set to auto-renew, all at once
+    (the backends batch the writes).  Only the worker leading the renewal
+    role (see Storage.lead) renews; the others stand by.  A pass renews what
+    would expire before the pass after next, plus however long the role
+    takes to pass on (LEAD_INTERVALS), so a reservation survives one failed
+    or late pass, and its renewer stopping.  Disabled with an interval of 0.
+    """
+
+    # Intervals a stopped leader holds the role for
+    LEAD_INTERVALS = 2
+
+    def __init__(self, storage_service: StorageService, interval: float = 0):
+        self.storage_service = storage_service
+        self.interval = interval
+        self.renewed = 0
+        self.worker = f'{socket.gethostname()}-{os.getpid()}-' \
+            f'{uuid.uuid4().hex[:8]}'
+
+        self._task = None
+
+    @property
+    def enabled(self) -> bool:
+        return self.interval > 0
+
+    def start(self):
+        if self.enabled and self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def renew(self) -> list:
+        lead = self.LEAD_INTERVALS * self.interval
+        if not await self.storage_service.lead('renewal', self.worker, lead):
+            return []
+
+        names = await self.storage_service.renew_due(2 * self.interval + lead)
+        self.renewed += len(names)
+        return names
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+
+            try:
+                await self.renew()
+            except Exception as err:
+                print(f'Auto-renewal pass failed: {err}')
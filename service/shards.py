@@ -0,0 +1,525 @@
+#!/usr/bin/env python3
+
+
+import bisect
+import hashlib
+import heapq
+from concurrent.futures import ThreadPoolExecutor
+from operator import attrgetter
+from typing import List, Tuple
+
+from service.etcd_client import parse_endpoints
+from service.etcd_txn import TXN_OPS_MAX
+from service.etcd_txn import _txn_count, _txn_counted, _txn_delete
+from service.exceptions import StorageException
+from service.exceptions import ScenarioNameExists, ScenarioNameNotFound
+from service.storage import Storage, EtcdStorage, _scenario_index
+
+from service.models import Project, Scenario
+
+
+def parse_shards(spec: str, port: int) -> List[Tuple[str, str]]:
+    """
+    (name, members) of each cluster in a ';'-separated list.  A cluster is
+    its comma-separated members (as CONDUCTOR_STORAGE_HOST), optionally
+    named as name=members; unnamed clusters are named by position.
+
+    Names place projects, not members: members can change freely, but
+    renaming, adding or removing a cluster moves projects between clusters
+    (about 1/n of them per cluster added), which then needs their data
+    moved too.
+    """
+
+    shards = []
+    for position, entry in enumerate(spec.split(';')):
+        entry = entry.strip()
+        if not entry:
+            continue
+
+        name, _, members = entry.rpartition('=')
+        parse_endpoints(members, port)      # Fail early on a bad list
+        shards.append((name.strip() or str(position), members))
+
+    if not shards:
+        raise ValueError(f'No etcd clusters in {spec!r}')
+    if len({name for name, _ in shards}) < len(shards):
+        raise ValueError(f'Duplicate etcd cluster names in {spec!r}')
+
+    return shards
+
+
+class HashRing:
+    """
+    Consistent hashing of keys onto named shards, each placed at replicas
+    points of the ring so the keys spread evenly.  Adding a shard only
+    moves keys onto it.
+    """
+
+    def __init__(self, names: List[str], replicas: int = 160):
+        points = sorted(
+            (self._hash(f'{name}#{replica}'), name)
+            for name in names for replica in range(replicas)
+        )
+        self._hashes = [point for point, _ in points]
+        self._names = [name for _, name in points]
+
+    @staticmethod
+    def _hash(key: str) -> int:
+        digest = hashlib.blake2b(key.encode('utf-8'), digest_size=8).digest()
+        return int.from_bytes(digest, 'big')
+
+    def locate(self, key: str) -> str:
+        position = bisect.bisect(self._hashes, self._hash(key))
+        return self._names[position % len(self._names)]
+
+
+class ShardedEtcdStorage(Storage):
+    """
+    Projects spread over several etcd clusters, by consistent hashing of the
+    project name (HashRing).  A project's scenarios, reservation and waiters
+    live on its cluster, so every transaction stays on one cluster; only
+    collections and lookups of a scenario by name ask every cluster, in
+    parallel.  Rate limiting usage is shared, and leaders are elected, on
+    the first cluster.
+
+    Scenario names are unique across clusters by checking the others before
+    creating one, which (unlike on one cluster) is not atomic.  Reservation
+    events need a single cluster's revisions, so they are not available:
+    waitlists are then served by their sweep alone.
+    """
+
+    def __init__(self, shards: List[Tuple[str, EtcdStorage]], replicas=160):
+        self.shards = dict(shards)
+        self.ring = HashRing(list(self.shards), replicas)
+
+        self._first = shards[0][1]
+        self._pool = ThreadPoolExecutor(
+            max_workers=4 * len(self.shards),
+            thread_name_prefix='conductor-shards'
+        )
+
+    def _owner(self, project: str) -> EtcdStorage:
+        return self.shards[self.ring.locate(project)]
+
+    def _each(self, call) -> list:
+        """call(shard) on every shard concurrently, results in shard order"""
+        return list(self._pool.map(call, self.shards.values()))
+
+    @staticmethod
+    def _merged(lists: list, key) -> list:
+        # Each shard's list is in name order already
+        return list(heapq.merge(*lists, key=key))
+
+    @staticmethod
+    def _merged_page(pages: list, limit: int, key):
+        """
+        One page from every shard's page after the same cursor: the first
+        limit of their union, more to come if any shard had more.
+        """
+
+        merged = list(heapq.merge(*[page for page, _ in pages], key=key))
+        page = merged[:limit]
+
+        more = len(merged) > limit or any(cursor for _, cursor in pages)
+        return page, key(page[-1]) if more and page else None
+
+    def ping(self, timeout: float = 1.0) -> bool:
+        return all(self._each(lambda shard: shard.ping(timeout)))
+
+    def get_revision(self, kind: str, name: str = None, project: str = None):
+        if kind == "scenario" and name:
+            # Tagged by cluster, in case the scenario moves between them
+            for shard_name, revision in zip(self.shards, self._each(
+                lambda shard: shard.get_revision(kind, name)
+            )):
+                if revision is not None:
+                    return f'{shard_name}.{revision}'
+            return None
+
+        if name or project:
+            return self._owner(name or project).get_revision(
+                kind, name, project
+            )
+
+        return self._joined(self._each(lambda shard: shard.get_revision(kind)))
+
+    @staticmethod
+    def _joined(revisions: list):
+        # A collection is tagged by every shard's revision, or not at all
+        if None in revisions:
+            return None
+        return '-'.join(str(revision) for revision in revisions)
+
+    def get_tagged(
+        self, kind: str, name=None, project=None, limit=None, cursor=None
+    ):
+        # Tokens as get_revision's, each shard's from its own single read
+        if kind == "scenario" and name:
+            def lookup(shard):
+                try:
+                    return shard.get_tagged(kind, name)
+                except ScenarioNameNotFound:
+                    return None
+
+            for shard_name, found in zip(self.shards, self._each(lookup)):
+                if found is not None:
+                    scenario, revision = found
+                    return scenario, f'{shard_name}.{revision}'
+            raise ScenarioNameNotFound(name)
+
+        if name or project:
+            return self._owner(name or project).get_tagged(
+                kind, name, project, limit, cursor
+            )
+
+        tagged = self._each(
+            lambda shard: shard.get_tagged(kind, limit=limit, cursor=cursor)
+        )
+        revision = self._joined([revision for _, revision in tagged])
+        results = [result for result, _ in tagged]
+
+        key = attrgetter("project" if kind == "reservation" else "name")
+        if limit:
+            return self._merged_page(results, limit, key), revision
+        return self._merged(results, key), revision
+
+    def get_lease_count(self):
+        counts = self._each(lambda shard: shard.get_lease_count())
+        return None if None in counts else sum(counts)
+
+    def get_reservation_count(self) -> int:
+        return sum(self._each(lambda shard: shard.get_reservation_count()))
+
+    def watch_reservations(self, callback, on_reset=None):
+        raise StorageException(
+            status_code=501,
+            status_message='Reservation events need a single etcd cluster'
+        )
+
+    def share_usage(self, worker: str, usage: dict, ttl: float) -> dict:
+        return self._first.share_usage(worker, usage, ttl)
+
+    # Snapshots: one revision per shard, entries imported on their owners
+    def snapshot_revision(self):
+        return tuple(self._each(lambda shard: shard.snapshot_revision()))
+
+    def export_page(self, kind: str, limit, cursor=None, revision=None):
+        revisions = dict(zip(
+            self.shards, revision or (None,) * len(self.shards)
+        ))
+        key = (lambda entry: entry.project) if kind == "reservation" \
+            else (lambda entry: entry.name)
+
+        return self._merged_page(list(self._pool.map(
+            lambda shard_name: self.shards[shard_name].export_page(
+                kind, limit, cursor, revisions[shard_name]
+            ),
+            self.shards
+        )), limit, key=key)
+
+    def import_batch(self, projects, scenarios, reservations):
+        parts = {name: ([], [], []) for name in self.shards}
+        for project in projects:
+            parts[self.ring.locate(project.name)][0].append(project)
+        for scenario in scenarios:
+            parts[self.ring.locate(scenario.project)][1].append(scenario)
+        for reservation in reservations:
+            parts[self.ring.locate(reservation.project)][2].append(reservation)
+
+        # A replaced scenario may have been under a project elsewhere
+        owners = {
+            scenario.name: self.ring.locate(scenario.project)
+            for scenario in scenarios
+        }
+        found = self._found(list(owners))
+
+        list(self._pool.map(
+            lambda shard_name: self.shards[shard_name].import_batch(
+                *parts[shard_name]
+            ),
+            self.shards
+        ))
+
+        for shard_name, names in found.items():
+            for name in names:
+                if owners[name] != shard_name:
+                    shard = self.shards[shard_name]
+                    self._drop_scenario(
+                        shard, name, shard.get_scenario(name, core=True).project
+                    )
+
+    # Projects
+    def get_project(self, name, core=False):
+        return self._owner(name).get_project(name, core)
+
+    def set_project(self, name, title, description):
+        return self._owner(name).set_project(name, title, description)
+
+    def create_project(self, name, title, description):
+        return self._owner(name).create_project(name, title, description)
+
+    def get_project_list(self) -> List[str]:
+        return sorted(
+            name
+            for names in self._each(lambda shard: shard.get_project_list())
+            for name in names
+        )
+
+    def create_projects_bulk(self, projects: List[Project]) -> list:
+        return self._bulk_by_owner(
+            projects, [project.name for project in projects],
+            lambda shard, batch: shard.create_projects_bulk(batch)
+        )
+
+    def get_projects_bulk(self, core=True):
+        return self._merged(
+            self._each(lambda shard: shard.get_projects_bulk(core)),
+            key=lambda project: project.name
+        )
+
+    def get_projects_page(self, limit, cursor=None, core=True):
+        return self._merged_page(
+            self._each(
+                lambda shard: shard.get_projects_page(limit, cursor, core)
+            ),
+            limit, key=lambda project: project.name
+        )
+
+    def _bulk_by_owner(self, items: list, projects: List[str], create) -> list:
+        """
+        Bulk create split by owning shard, each part in one call (and
+        concurrently); results in the order of items.
+        """
+
+        parts = {}
+        for position, (item, project) in enumerate(zip(items, projects)):
+            parts.setdefault(self.ring.locate(project), []).append(
+                (position, item)
+            )
+
+        def run(part):
+            shard_name, entries = part
+            return create(
+                self.shards[shard_name], [item for _, item in entries]
+            )
+
+        results = [None] * len(items)
+        for (_, entries), errors in zip(
+            parts.items(), self._pool.map(run, parts.items())
+        ):
+            for (position, _), error in zip(entries, errors):
+                results[position] = error
+
+        return results
+
+    # Scenarios
+    def _found(self, names: List[str]) -> dict:
+        """Shard name -> which of names are scenarios there"""
+
+        def counted(shard):
+            found = set()
+            for start in range(0, len(names), TXN_OPS_MAX):
+                batch = names[start:start + TXN_OPS_MAX]
+                _, responses = shard._txn(
+                    [], [_txn_count(f'/scenario/{name}') for name in batch]
+                )
+                found.update(
+                    name for name, response in zip(batch, responses)
+                    if _txn_counted(response)
+                )
+            return found
+
+        return dict(zip(self.shards, self._each(counted)))
+
+    def _elsewhere(self, found: dict, name: str, project: str) -> bool:
+        # Taken on a shard other than the project's (which reports its own)
+        owner = self.ring.locate(project)
+        return any(
+            name in names
+            for shard_name, names in found.items() if shard_name != owner
+        )
+
+    def _holder(self, name: str):
+        """(shard, scenario) holding the scenario name, or (None, None)"""
+
+        def lookup(shard):
+            try:
+                return shard.get_scenario(name, core=True)
+            except ScenarioNameNotFound:
+                return None
+
+        for shard, scenario in zip(self.shards.values(), self._each(lookup)):
+            if scenario is not None:
+                return shard, scenario
+
+        return None, None
+
+    def get_scenario(self, name, core=False):
+        shard, _ = self._holder(name)
+        if shard is None:
+            raise ScenarioNameNotFound(name)
+
+        return shard.get_scenario(name, core)
+
+    def set_scenario(self, name, title, description, project):
+        owner = self._owner(project)
+
+        # Moving to a project on another shard moves the scenario there
+        shard, scenario = self._holder(name)
+        result = owner.set_scenario(name, title, description, project)
+        if shard is not None and shard is not owner:
+            self._drop_scenario(shard, name, scenario.project)
+
+        return result
+
+    @staticmethod
+    def _drop_scenario(shard: EtcdStorage, name: str, project: str):
+        shard._txn([], [
+            _txn_delete(f'/scenario/{name}'),
+            _txn_delete(_scenario_index(project, name))
+        ])
+
+    def create_scenario(self, name, title, description, project):
+        if self._elsewhere(self._found([name]), name, project):
+            raise ScenarioNameExists(name)
+
+        return self._owner(project).create_scenario(
+            name, title, description, project
+        )
+
+    def create_scenarios_bulk(self, scenarios: List[Scenario]) -> list:
+        results = [None] * len(scenarios)
+
+        # Names taken on other shards, or earlier in the batch, fail here:
+        # each shard only sees its own part
+        found = self._found(list({scenario.name for scenario in scenarios}))
+        pending, seen = [], set()
+        for position, scenario in enumerate(scenarios):
+            if scenario.name in seen or self._elsewhere(
+                found, scenario.name, scenario.project
+            ):
+                results[position] = ScenarioNameExists(scenario.name)
+            else:
+                pending.append((position, scenario))
+            seen.add(scenario.name)
+
+        errors = self._bulk_by_owner(
+            [scenario for _, scenario in pending],
+            [scenario.project for _, scenario in pending],
+            lambda shard, batch: shard.create_scenarios_bulk(batch)
+        )
+        for (position, _), error in zip(pending, errors):
+            results[position] = error
+
+        return results
+
+    def get_scenario_list(self) -> List[str]:
+        return sorted(
+            name
+            for names in self._each(lambda shard: shard.get_scenario_list())
+            for name in names
+        )
+
+    def get_scenarios_bulk(self, core=True):
+        return self._merged(
+            self._each(lambda shard: shard.get_scenarios_bulk(core)),
+            key=lambda scenario: scenario.name
+        )
+
+    def get_scenarios_by_project(self, project, core=True):
+        return self._owner(project).get_scenarios_by_project(project, core)
+
+    def get_scenarios_page(self, limit, cursor=None, core=True, project=None):
+        if project:
+            return self._owner(project).get_scenarios_page(
+                limit, cursor, core, project
+            )
+
+        return self._merged_page(
+            self._each(
+                lambda shard: shard.get_scenarios_page(limit, cursor, core)
+            ),
+            limit, key=lambda scenario: scenario.name
+        )
+
+    # Reservations (named after their project) and waitlists
+    def get_reservation(self, name: str, core: bool = False):
+        return self._owner(name).get_reservation(name, core)
+
+    def set_reservation(self, project: str, email: str, duration: int):
+        return self._owner(project).set_reservation(project, email, duration)
+
+    def create_reservation(self, project: str, email: str, duration: int):
+        return self._owner(project).create_reservation(
+            project, email, duration
+        )
+
+    def release_reservation(self, name: str, id: int) -> bool:
+        return self._owner(name).release_reservation(name, id)
+
+    def renew_reservation(
+        self, project: str, email: str, duration: int = None, auto=None
+    ):
+        return self._owner(project).renew_reservation(
+            project, email, duration, auto
+        )
+
+    def renew_due(self, within: float) -> List[str]:
+        return sorted(
+            name
+            for names in self._each(lambda shard: shard.renew_due(within))
+            for name in names
+        )
+
+    def lead(self, role: str, worker: str, ttl: float) -> bool:
+        return self._first.lead(role, worker, ttl)
+
+    def get_reservation_list(self) -> List[str]:
+        return sorted(
+            name
+            for names in self._each(
+                lambda shard: shard.get_reservation_list()
+            )
+            for name in names
+        )
+
+    def get_reservations_bulk(self, core=True):
+        return self._merged(
+            self._each(lambda shard: shard.get_reservations_bulk(core)),
+            key=lambda reservation: reservation.project
+        )
+
+    def get_reservations_page(self, limit, cursor=None, core=True):
+        return self._merged_page(
+            self._each(
+                lambda shard: shard.get_reservations_page(limit, cursor, core)
+            ),
+            limit, key=lambda reservation: reservation.project
+        )
+
+    def enqueue_reservation(
+        self, project: str, email: str, duration: int, priority: int = 0,
+        ttl: float = None
+    ):
+        return self._owner(project).enqueue_reservation(
+            project, email, duration, priority, ttl
+        )
+
+    def get_waitlist(self, project: str):
+        return self._owner(project).get_waitlist(project)
+
+    def keep_waiting(self, project: str, email: str, ttl: float) -> bool:
+        return self._owner(project).keep_waiting(project, email, ttl)
+
+    def dequeue_reservation(self, project: str, email: str) -> bool:
+        return self._owner(project).dequeue_reservation(project, email)
+
+    def hand_off(self, project: str):
+        return self._owner(project).hand_off(project)
+
+    def waiting_projects(self) -> List[str]:
+        return sorted(
+            name
+            for names in self._each(lambda shard: shard.waiting_projects())
+            for name in names
+        )
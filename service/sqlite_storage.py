@@ -0,0 +1,565 @@
+#!/usr/bin/env python3
+
+
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import List
+
+from service.codec import dumps_json, loads
+from service.storage import Storage, StorageException
+from service.storage import ProjectNameNotFound, ProjectNameExists
+from service.storage import ScenarioNameNotFound, ScenarioNameExists
+from service.storage import ReservationNameNotFound, ReservationExists
+from service.storage import ReservationPermissionDenied
+
+from service.models import Project, ProjectCore, Scenario, ScenarioCore
+from service.models import ReservationCore, Reservation
+from service.models import Lease
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS project (
+    name TEXT PRIMARY KEY,
+    title TEXT NOT NULL,
+    description TEXT NOT NULL
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS scenario (
+    name TEXT PRIMARY KEY,
+    title TEXT NOT NULL,
+    description TEXT NOT NULL,
+    project TEXT NOT NULL
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS scenario_project ON scenario (project, name);
+
+CREATE TABLE IF NOT EXISTS lease (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    ttl INTEGER NOT NULL,
+    expires REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS lease_expires ON lease (expires);
+
+CREATE TABLE IF NOT EXISTS reservation (
+    project TEXT PRIMARY KEY,
+    email TEXT NOT NULL,
+    lease INTEGER NOT NULL,
+    ttl INTEGER NOT NULL,
+    expires REAL NOT NULL,
+    renew INTEGER NOT NULL DEFAULT 0
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS reservation_expires ON reservation (expires);
+CREATE INDEX IF NOT EXISTS reservation_lease ON reservation (lease);
+
+CREATE TABLE IF NOT EXISTS rate_usage (
+    worker TEXT PRIMARY KEY,
+    usage BLOB NOT NULL,
+    expires REAL NOT NULL
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS revision (
+    kind TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+) WITHOUT ROWID;
+INSERT OR IGNORE INTO revision VALUES
+    ('project', 0), ('scenario', 0), ('reservation', 0);
+"""
+
+# Bump a table's revision on every change, whichever process made it
+REVISION_TRIGGER = """
+CREATE TRIGGER IF NOT EXISTS {kind}_{op} AFTER {op} ON {kind}
+BEGIN
+    UPDATE revision SET value = value + 1 WHERE kind = '{kind}';
+END;
+"""
+
+RESERVATION = 'SELECT project, email, lease, ttl, expires FROM reservation'
+INSERT_RESERVATION = 'INTO reservation (project, email, lease, ttl, expires) ' \
+    'VALUES (?, ?, ?, ?, ?)'
+
+
+class SqliteStorage(Storage):
+    """
+    Durable single-node backend on SQLite in WAL mode, safe to share between
+    uvicorn workers.  Each thread keeps its own connection (and so its own
+    compiled statement cache); every write commits on its own, so
+    save_data() has nothing left to do.
+
+    Reservations carry their lease expiry: reads skip expired rows, and
+    expired rows are purged whenever a new lease is granted.
+    """
+
+    def __init__(
+        self, pathname="data", filename="conductor.db", busy_timeout=5.0
+    ):
+        self.storage_name = f'{pathname}/{filename}'
+        self.busy_timeout = busy_timeout
+        self._local = threading.local()
+
+        os.makedirs(pathname, exist_ok=True)
+        self._conn.executescript(SCHEMA + ''.join(
+            REVISION_TRIGGER.format(kind=kind, op=op)
+            for kind in ("project", "scenario", "reservation")
+            for op in ("INSERT", "UPDATE", "DELETE")
+        ))
+        self._migrate()
+
+    def _migrate(self):
+        # Databases created before auto-renewal lack its column
+        columns = {
+            row[1] for row in self._conn.execute(
+                'PRAGMA table_info(reservation)'
+            )
+        }
+        if "renew" not in columns:
+            try:
+                self._conn.execute(
+                    'ALTER TABLE reservation '
+                    'ADD COLUMN renew INTEGER NOT NULL DEFAULT 0'
+                )
+            except sqlite3.OperationalError:
+                pass    # Added meanwhile by another worker
+
+    @property
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+
+        if conn is None:
+            conn = sqlite3.connect(
+                self.storage_name, timeout=self.busy_timeout,
+                isolation_level=None, cached_statements=256
+            )
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+
+        return conn
+
+    @contextmanager
+    def _transaction(self):
+        conn = self._conn
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            yield conn
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        conn.execute('COMMIT')
+
+    def ping(self, timeout: float = 1.0) -> bool:
+        self._conn.execute('SELECT 1').fetchone()
+        return True
+
+    def get_revision(self, kind: str, name: str = None, project: str = None):
+        # One counter per table, so an entry's revision is its table's
+        # Expiring counts as a change, so purge (only if due) before reading
+        now = time.time()
+        if kind == "reservation" and self._conn.execute(
+            'SELECT 1 FROM reservation WHERE expires <= ? LIMIT 1', (now,)
+        ).fetchone():
+            with self._transaction() as conn:
+                conn.execute('DELETE FROM reservation WHERE expires <= ?', (now,))
+
+        return str(self._conn.execute(
+            'SELECT value FROM revision WHERE kind = ?', (kind,)
+        ).fetchone()[0])
+
+    # Data handling routines
+    def get_project(self, name, core=False):
+        row = self._conn.execute(
+            'SELECT title, description FROM project WHERE name = ?', (name,)
+        ).fetchone()
+
+        if row is None:
+            raise ProjectNameNotFound(name)
+
+        return self._build_project(
+            name, {"title": row[0], "description": row[1]}, core
+        )
+
+    def set_project(self, name, title, description):
+        self._conn.execute(
+            'INSERT OR REPLACE INTO project VALUES (?, ?, ?)',
+            (name, title, description)
+        )
+
+        return self.get_project(name)
+
+    def create_project(self, name, title, description):
+        try:
+            self._conn.execute(
+                'INSERT INTO project VALUES (?, ?, ?)',
+                (name, title, description)
+            )
+        except sqlite3.IntegrityError:
+            raise ProjectNameExists(name)
+
+        return self._build_project(
+            name, {"title": title, "description": description}
+        )
+
+    def create_projects_bulk(self, projects: List[Project]) -> list:
+        # One transaction (one commit) for the batch; a failed insert only
+        # undoes itself
+        results = []
+        with self._transaction() as conn:
+            for project in projects:
+                try:
+                    conn.execute(
+                        'INSERT INTO project VALUES (?, ?, ?)',
+                        (project.name, project.title, project.description)
+                    )
+                    results.append(None)
+                except sqlite3.IntegrityError:
+                    results.append(ProjectNameExists(project.name))
+
+        return results
+
+    def get_project_list(self) -> List[str]:
+        return [
+            row[0] for row in
+            self._conn.execute('SELECT name FROM project ORDER BY name')
+        ]
+
+    def get_projects_bulk(self, core=True) -> List[ProjectCore]:
+        return [
+            self._build_project(
+                row[0], {"title": row[1], "description": row[2]}, core
+            )
+            for row in self._conn.execute(
+                'SELECT name, title, description FROM project ORDER BY name'
+            )
+        ]
+
+    def get_projects_page(self, limit, cursor=None, core=True):
+        rows = self._conn.execute(
+            'SELECT name, title, description FROM project '
+            'WHERE name > ? ORDER BY name LIMIT ?', (cursor or '', limit + 1)
+        ).fetchall()
+
+        return [
+            self._build_project(
+                row[0], {"title": row[1], "description": row[2]}, core
+            )
+            for row in rows[:limit]
+        ], self._next_cursor(rows, limit)
+
+    @staticmethod
+    def _next_cursor(rows, limit):
+        # One row past the page was asked for, to know if there is more
+        return rows[limit - 1][0] if len(rows) > limit else None
+
+    def get_scenario(self, name, core=False):
+        row = self._conn.execute(
+            'SELECT title, description, project FROM scenario WHERE name = ?',
+            (name,)
+        ).fetchone()
+
+        if row is None:
+            raise ScenarioNameNotFound(name)
+
+        return self._build_scenario(name, self._scenario_data(row), core)
+
+    @staticmethod
+    def _scenario_data(row) -> dict:
+        return {"title": row[0], "description": row[1], "project": row[2]}
+
+    def set_scenario(self, name, title, description, project):
+        self._conn.execute(
+            'INSERT OR REPLACE INTO scenario VALUES (?, ?, ?, ?)',
+            (name, title, description, project)
+        )
+
+        return self.get_scenario(name)
+
+    def create_scenario(self, name, title, description, project):
+        # Insert only if the project exists, in one statement
+        with self._transaction() as conn:
+            try:
+                inserted = conn.execute(
+                    'INSERT INTO scenario SELECT ?, ?, ?, ? '
+                    'WHERE EXISTS (SELECT 1 FROM project WHERE name = ?)',
+                    (name, title, description, project, project)
+                ).rowcount
+            except sqlite3.IntegrityError:
+                raise ScenarioNameExists(name)
+
+        if not inserted:
+            raise ProjectNameNotFound(project)
+
+        return self._build_scenario(
+            name, self._scenario_data((title, description, project))
+        )
+
+    def create_scenarios_bulk(self, scenarios: List[Scenario]) -> list:
+        results = []
+        with self._transaction() as conn:
+            for scenario in scenarios:
+                try:
+                    inserted = conn.execute(
+                        'INSERT INTO scenario SELECT ?, ?, ?, ? '
+                        'WHERE EXISTS (SELECT 1 FROM project WHERE name = ?)',
+                        (
+                            scenario.name, scenario.title,
+                            scenario.description, scenario.project,
+                            scenario.project
+                        )
+                    ).rowcount
+                except sqlite3.IntegrityError:
+                    results.append(ScenarioNameExists(scenario.name))
+                    continue
+
+                results.append(
+                    None if inserted
+                    else ProjectNameNotFound(scenario.project)
+                )
+
+        return results
+
+    def get_scenario_list(self) -> List[str]:
+        return [
+            row[0] for row in
+            self._conn.execute('SELECT name FROM scenario ORDER BY name')
+        ]
+
+    def get_scenarios_bulk(self, core=True) -> List[ScenarioCore]:
+        return [
+            self._build_scenario(row[0], self._scenario_data(row[1:]), core)
+            for row in self._conn.execute(
+                'SELECT name, title, description, project FROM scenario '
+                'ORDER BY name'
+            )
+        ]
+
+    def get_scenarios_by_project(self, project, core=True) -> List[ScenarioCore]:
+        # Served by the (project, name) index
+        return [
+            self._build_scenario(row[0], self._scenario_data(row[1:]), core)
+            for row in self._conn.execute(
+                'SELECT name, title, description, project FROM scenario '
+                'WHERE project = ? ORDER BY name', (project,)
+            )
+        ]
+
+    def get_scenarios_page(self, limit, cursor=None, core=True, project=None):
+        if project:
+            rows = self._conn.execute(
+                'SELECT name, title, description, project FROM scenario '
+                'WHERE project = ? AND name > ? ORDER BY name LIMIT ?',
+                (project, cursor or '', limit + 1)
+            ).fetchall()
+        else:
+            rows = self._conn.execute(
+                'SELECT name, title, description, project FROM scenario '
+                'WHERE name > ? ORDER BY name LIMIT ?',
+                (cursor or '', limit + 1)
+            ).fetchall()
+
+        return [
+            self._build_scenario(row[0], self._scenario_data(row[1:]), core)
+            for row in rows[:limit]
+        ], self._next_cursor(rows, limit)
+
+    # Reservation and lease routines
+    @staticmethod
+    def _build_reservation(row, core=False):
+        project, email, lease, _, expires = row
+
+        if core:
+            return ReservationCore.construct(project=project, email=email)
+
+        return Reservation.construct(
+            project=project, email=email, id=lease,
+            ttl=max(0, int(expires - time.time()))
+        )
+
+    def get_reservation(self, name: str, core: bool = False):
+        row = self._conn.execute(
+            f'{RESERVATION} WHERE project = ? AND expires > ?',
+            (name, time.time())
+        ).fetchone()
+
+        if row is None:
+            raise ReservationNameNotFound(name)
+
+        return self._build_reservation(row, core)
+
+    def get_reservation_list(self) -> List[str]:
+        return [
+            row[0] for row in self._conn.execute(
+                'SELECT project FROM reservation WHERE expires > ? '
+                'ORDER BY project', (time.time(),)
+            )
+        ]
+
+    def get_reservations_bulk(self, core=True) -> List[ReservationCore]:
+        return [
+            self._build_reservation(row, core)
+            for row in self._conn.execute(
+                f'{RESERVATION} WHERE expires > ? ORDER BY project',
+                (time.time(),)
+            )
+        ]
+
+    def get_reservations_page(self, limit, cursor=None, core=True):
+        rows = self._conn.execute(
+            f'{RESERVATION} WHERE project > ? AND expires > ? '
+            'ORDER BY project LIMIT ?', (cursor or '', time.time(), limit + 1)
+        ).fetchall()
+
+        return [
+            self._build_reservation(row, core) for row in rows[:limit]
+        ], self._next_cursor(rows, limit)
+
+    def _grant(self, conn, duration: int):
+        now = time.time()
+
+        # Purge what has expired (both through their expiry index)
+        conn.execute('DELETE FROM reservation WHERE expires <= ?', (now,))
+        conn.execute('DELETE FROM lease WHERE expires <= ?', (now,))
+
+        cursor = conn.execute(
+            'INSERT INTO lease (ttl, expires) VALUES (?, ?)',
+            (duration, now + duration)
+        )
+
+        return Lease(ttl=duration, id=cursor.lastrowid), now + duration
+
+    def get_lease_count(self) -> int:
+        return self._conn.execute(
+            'SELECT COUNT(*) FROM lease WHERE expires > ?', (time.time(),)
+        ).fetchone()[0]
+
+    def create_lease(self, duration: int) -> Lease:
+        with self._transaction() as conn:
+            lease, _ = self._grant(conn, duration)
+
+        return lease
+
+    def revoke_lease(self, id: int) -> bool:
+        with self._transaction() as conn:
+            if not conn.execute(
+                'DELETE FROM lease WHERE id = ?', (id,)
+            ).rowcount:
+                raise StorageException(
+                    status_message='Lease revocation failed'
+                )
+
+            conn.execute('DELETE FROM reservation WHERE lease = ?', (id,))
+
+        return True
+
+    def set_reservation(self, project: str, email: str, duration: int):
+        with self._transaction() as conn:
+            lease, expires = self._grant(conn, duration)
+            conn.execute(
+                f'INSERT OR REPLACE {INSERT_RESERVATION}',
+                (project, email, lease.id, lease.ttl, expires)
+            )
+
+        return self.get_reservation(project)
+
+    def create_reservation(self, project: str, email: str, duration: int):
+        # Lease and reservation commit together or not at all
+        with self._transaction() as conn:
+            lease, expires = self._grant(conn, duration)
+            try:
+                conn.execute(
+                    f'INSERT {INSERT_RESERVATION}',
+                    (project, email, lease.id, lease.ttl, expires)
+                )
+            except sqlite3.IntegrityError:
+                raise ReservationExists(project)
+
+        return Reservation(
+            project=project, email=email, id=lease.id, ttl=lease.ttl
+        )
+
+    def renew_reservation(
+        self, project: str, email: str, duration: int = None, auto=None
+    ) -> Reservation:
+        with self._transaction() as conn:
+            now = time.time()
+            row = conn.execute(
+                f'{RESERVATION} WHERE project = ? AND expires > ?',
+                (project, now)
+            ).fetchone()
+            if row is None:
+                raise ReservationNameNotFound(project)
+
+            _, owner, lease, ttl, _ = row
+            if owner != email:
+                raise ReservationPermissionDenied(email, owner)
+
+            duration = duration or ttl
+            conn.execute(
+                'UPDATE lease SET ttl = ?, expires = ? WHERE id = ?',
+                (duration, now + duration, lease)
+            )
+            conn.execute(
+                'UPDATE reservation SET ttl = ?, expires = ?, '
+                'renew = COALESCE(?, renew) WHERE project = ?',
+                (duration, now + duration, auto, project)
+            )
+
+        return Reservation(project=project, email=email, id=lease, ttl=duration)
+
+    def renew_due(self, within: float) -> List[str]:
+        # Every due reservation and its lease, in one transaction
+        with self._transaction() as conn:
+            now = time.time()
+            due = (now, now + within)
+            names = [
+                row[0] for row in conn.execute(
+                    'SELECT project FROM reservation WHERE renew = 1 '
+                    'AND expires > ? AND expires <= ?', due
+                )
+            ]
+            conn.execute(
+                'UPDATE lease SET expires = ? + ttl WHERE id IN ('
+                'SELECT lease FROM reservation WHERE renew = 1 '
+                'AND expires > ? AND expires <= ?)', (now, *due)
+            )
+            conn.execute(
+                'UPDATE reservation SET expires = ? + ttl WHERE renew = 1 '
+                'AND expires > ? AND expires <= ?', (now, *due)
+            )
+
+        return names
+
+    def import_batch(self, projects, scenarios, reservations):
+        # The whole batch in one transaction
+        with self._transaction() as conn:
+            conn.executemany(
+                'INSERT OR REPLACE INTO project VALUES (?, ?, ?)',
+                [(p.name, p.title, p.description) for p in projects]
+            )
+            conn.executemany(
+                'INSERT OR REPLACE INTO scenario VALUES (?, ?, ?, ?)',
+                [(s.name, s.title, s.description, s.project) for s in scenarios]
+            )
+            for reservation in reservations:
+                lease, expires = self._grant(conn, reservation.ttl)
+                conn.execute(f'INSERT OR REPLACE {INSERT_RESERVATION}', (
+                    reservation.project, reservation.email,
+                    lease.id, lease.ttl, expires
+                ))
+
+    def share_usage(self, worker: str, usage: dict, ttl: float) -> dict:
+        # Workers share the database: expired records (of workers that
+        # stopped) are purged, this one's written and the others read
+        with self._transaction() as conn:
+            now = time.time()
+            conn.execute('DELETE FROM rate_usage WHERE expires <= ?', (now,))
+            conn.execute(
+                'INSERT OR REPLACE INTO rate_usage VALUES (?, ?, ?)',
+                (worker, dumps_json(usage), now + ttl)
+            )
+            rows = conn.execute(
+                'SELECT worker, usage FROM rate_usage WHERE worker != ?',
+                (worker,)
+            ).fetchall()
+
+        return {name: loads(record) for name, record in rows}
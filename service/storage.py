@@ -1,62 +1,298 @@
 #!/usr/bin/env python3
 
 
-import json
-from typing import List
-
-from etcd3gw.client import Etcd3Client
+import asyncio
+import heapq
+import math
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import AsyncIterator, Callable, List
+
+from pydantic import ValidationError
+from etcd3gw import exceptions as etcd_exceptions
 from etcd3gw.lease import Lease as Etcd3Lease
+from etcd3gw.utils import _decode, _encode, _increment_last_byte
+from starlette.concurrency import run_in_threadpool
+
+from service.codec import encoder, loads
+from service.etcd_client import EtcdEndpoints, PooledEtcd3Client
+from service.etcd_client import parse_endpoints
+from service.etcd_txn import TXN_OPS_MAX, TXN_BYTES_MAX, _expired, _remaining
+from service.etcd_txn import _txn_absent, _txn_present, _txn_put, _txn_bytes
+from service.etcd_txn import _txn_count, _txn_counted, _txn_delete, _txn_get
+from service.etcd_txn import _txn_got, _txn_ranged, _txn_unchanged
+from service.etcd_txn import _txn_leased
+from service.exceptions import StorageException, EntryTooLarge
+from service.exceptions import ProjectNameNotFound, ProjectNameExists
+from service.exceptions import ScenarioNameNotFound, ScenarioNameExists
+from service.exceptions import ReservationNameNotFound, ReservationExists
+from service.exceptions import ReservationPermissionDenied, WaiterNotFound
+from service.journal import Journal, JournalCorrupt
+from service.limits_storage import EtcdUsage
+from service.waitlist_storage import EtcdWaitlist
+from service.watch import EtcdWatcher
 
 from service.models import Project, ProjectInput, ProjectCore
 from service.models import ScenarioCore, ScenarioInput, Scenario
 from service.models import ReservationCore, ReservationInput, Reservation
-from service.models import ReservationEmail
-from service.models import Lease
+from service.models import ReservationEmail, ReservationRenewal
+from service.models import WaitlistInput, Waiter, WaitlistStatus
+from service.models import Lease, BulkResult
+from service.models import ReservationImport, ImportSummary
 
 
-class StorageException(Exception):
-    def __init__(self, status_code=500, status_message="Undefined"):
-        Exception.__init__(self)
-        self.status_code = status_code
-        self.status_message = status_message
+# Snapshot lines are {kind: entry}, exported in this order (scenarios after
+# their projects) and validated on import as their creation would be
+SNAPSHOT_MODELS = {
+    "project": ProjectInput,
+    "scenario": ScenarioInput,
+    "reservation": ReservationImport,
+}
 
+# Import errors reported in detail (the rest are only counted)
+IMPORT_ERRORS_MAX = 100
 
-class ProjectNameNotFound(StorageException):
-    def __init__(self, project_name):
-        StorageException.__init__(
-            self, status_code=404,
-            status_message=f'Project {project_name} not found'
-        )
-        self.project_name = project_name
+# Last line of a complete snapshot, {"end": {kind: entries exported}}; an
+# export that fails part way ends with {"error": {"message": ..., kind: ...}}
+SNAPSHOT_END = "end"
+SNAPSHOT_ERROR = "error"
+
+
+def _scenario_index(project: str, name: str = '') -> str:
+    """Index key of a scenario under its project (or the project's prefix)"""
+    return f'/index/project/{project}/scenario/{name}'
+
+
+def _page_names(names, limit: int, cursor: str = None):
+    """
+    Up to limit names after cursor, in order, plus the cursor of the next
+    page (None on the last).  O(n log limit), nothing else is sorted.
+    """
+
+    page = heapq.nsmallest(
+        limit + 1, (name for name in names if not cursor or name > cursor)
+    )
+    if len(page) > limit:
+        return page[:limit], page[limit - 1]
+
+    return page, None
+
+
+def _collection_revision(newest: list, result: dict) -> str:
+    mod_revision = newest[0]["mod_revision"] if newest else 0
+    return f'{mod_revision}.{result.get("count", 0)}'
+
+
+def _kvs_revision(kvs: list) -> str:
+    """_collection_revision of a whole collection, from its items"""
+    newest = max((int(item["mod_revision"]) for item in kvs), default=0)
+    return f'{newest}.{len(kvs)}'
+
+
+def _txn_page(prefix: str, limit: int, cursor: str = None) -> dict:
+    # Up to limit keys after cursor, still ending at the prefix end
+    return {"request_range": {
+        "key": _encode(f'{prefix}{cursor}\0' if cursor else prefix),
+        "range_end": _encode(_increment_last_byte(prefix)),
+        "limit": limit
+    }}
+
+
+def _txn_newest(prefix: str) -> dict:
+    # Newest key only (sort target MOD, order DESCEND); count is total
+    return {"request_range": {
+        "key": _encode(prefix),
+        "range_end": _encode(_increment_last_byte(prefix)),
+        "keys_only": True, "limit": 1, "sort_target": 3, "sort_order": 2
+    }}
+
+
+def _txn_tagged_page(responses: list, prefix: str):
+    """
+    ((items, next cursor), collection revision) of a _txn_page and
+    _txn_newest read in one transaction; items as _range_page gives them.
+    """
+
+    page, newest = responses
+    items = [
+        (item["key"].decode("utf-8")[len(prefix):], item)
+        for item in _txn_ranged(page)
+    ]
+    more = page["response_range"].get("more")
+    newest = newest["response_range"]
+
+    return (
+        (items, items[-1][0] if items and more else None),
+        _collection_revision(newest.get("kvs", []), newest)
+    )
+
+
+def _tagged_read(
+    storage, kind: str, name=None, project=None, limit=None, cursor=None
+):
+    """
+    What get_tagged reads: an entry in full, else a collection's summaries
+    (a project's scenarios, with project), one page of them with limit.
+    """
+
+    if name:
+        return getattr(storage, f'get_{kind}')(name)
+
+    if limit:
+        if kind == "scenario":
+            return storage.get_scenarios_page(limit, cursor, project=project)
+        return getattr(storage, f'get_{kind}s_page')(limit, cursor)
+
+    if kind == "scenario" and project:
+        return storage.get_scenarios_by_project(project)
+
+    return getattr(storage, f'get_{kind}s_bulk')()
+
+
+class LeaseBuckets:
+    """
+    Shared etcd leases for reservations: one reservation expiring at t is
+    attached to the lease of the window (of window seconds) ending at or
+    after t, so a burst of reservations needs a handful of leases.
+
+    A window's lease ID is derived from its end time, so every worker asks
+    for the same lease and granting it twice is harmless.  Windows granted
+    here are remembered, so most reservations need no lease round trip.
+    Shared lease IDs are recognisable (shared()): those are never revoked,
+    a reservation on one is released by deleting its key.
+    """
+
+    ID_PREFIX = 0x0B0C << 48
+
+    def __init__(self, window: int):
+        self.window = window
+        self._granted = {}      # lease id -> window end
+        self._lock = threading.Lock()
+
+    @classmethod
+    def shared(cls, id: int) -> bool:
+        return id >> 48 == cls.ID_PREFIX >> 48
+
+    def bucket(self, expires: float):
+        """(lease id, window end) for a reservation expiring at expires"""
+
+        end = math.ceil(expires / self.window) * self.window
+        return self.ID_PREFIX | end, end
+
+    def granted(self, id: int) -> bool:
+        now = time.time()
+        with self._lock:
+            for known, end in list(self._granted.items()):
+                if end <= now:
+                    del self._granted[known]
+
+            return id in self._granted
+
+    def add(self, id: int, end: int):
+        with self._lock:
+            self._granted[id] = end
+
+
+class Storage:
+    def ping(self, timeout: float = 1.0) -> bool:
+        return True
 
+    # Stop what the backend runs in the background, on shutdown
+    def close(self):
+        pass
 
-class ScenarioNameNotFound(StorageException):
-    def __init__(self, scenario_name):
-        StorageException.__init__(
-            self, status_code=404,
-            status_message=f'Scenario {scenario_name} not found'
+    # Change tracking for conditional requests: an opaque token that changes
+    # whenever the entry (or without name, the collection) changes.  None
+    # when the backend cannot tell.
+    def get_revision(self, kind: str, name: str = None, project: str = None):
+        return None
+
+    # A read (see _tagged_read) with the get_revision token of what it read.
+    # Here the token is read first, so it is never newer than the data;
+    # backends override to take it from the read itself.
+    def get_tagged(
+        self, kind: str, name=None, project=None, limit=None, cursor=None
+    ):
+        revision = self.get_revision(kind, name, project)
+        return _tagged_read(self, kind, name, project, limit, cursor), revision
+
+    # Leases currently granted (None when the backend cannot tell)
+    def get_lease_count(self):
+        return None
+
+    # Reservations currently held
+    def get_reservation_count(self) -> int:
+        return len(self.get_reservation_list())
+
+    # End one reservation (backends sharing leases delete just its key)
+    def release_reservation(self, name: str, id: int) -> bool:
+        return self.revoke_lease(id)
+
+    # Renewal: extend one reservation for its owner, atomically, to duration
+    # seconds from now (default its own); auto (unless None) sets whether
+    # renew_due keeps renewing it.  renew_due renews every auto-renewed
+    # reservation ending within the next within seconds, for its duration,
+    # and returns their names.
+    def renew_reservation(
+        self, project: str, email: str, duration: int = None, auto=None
+    ) -> Reservation:
+        raise StorageException(
+            status_code=501,
+            status_message='Reservation renewal is not supported'
         )
-        self.scenario_name = scenario_name
 
+    def renew_due(self, within: float) -> List[str]:
+        return []
+
+    # Leadership of a periodic task between workers: True while worker
+    # holds role, kept for ttl seconds after its last call.  Backends
+    # serving a single process have nobody else to elect.
+    def lead(self, role: str, worker: str, ttl: float) -> bool:
+        return True
 
-class ReservationNameNotFound(StorageException):
-    def __init__(self, reservation_name):
-        StorageException.__init__(
-            self, status_code=404,
-            status_message=f'Reservation {reservation_name} not found'
+    # Waitlist: requesters queued for a project, served by priority (higher
+    # first), then in arrival order.  A waiter given a ttl is dropped unless
+    # kept waiting within it.  hand_off grants a free project to its first
+    # waiter (None if it is not free or nobody waits).
+    def enqueue_reservation(
+        self, project: str, email: str, duration: int, priority: int = 0,
+        ttl: float = None
+    ):
+        raise StorageException(
+            status_code=501,
+            status_message='Reservation waitlists need etcd storage'
         )
-        self.reservation_name = reservation_name
 
+    def get_waitlist(self, project: str) -> List[Waiter]:
+        return []
 
-class ReservationPermissionDenied(StorageException):
-    def __init__(self, requester, owner):
-        self.status_code = 401
-        self.status_message = f'You ({requester}) are not the owner ({owner}).'
-        self.requester = requester
-        self.owner = owner
+    def keep_waiting(self, project: str, email: str, ttl: float) -> bool:
+        return False
 
+    def dequeue_reservation(self, project: str, email: str) -> bool:
+        raise WaiterNotFound(project, email)
+
+    def hand_off(self, project: str):
+        return None
+
+    def waiting_projects(self) -> List[str]:
+        return []
+
+    # Rate limiting usage shared between workers: publish this worker's
+    # record (kept for ttl seconds) and get every other worker's.  Backends
+    # serving a single process have nobody to share with.
+    def share_usage(self, worker: str, usage: dict, ttl: float) -> dict:
+        return {}
+
+    def watch_reservations(self, callback, on_reset=None):
+        raise StorageException(
+            status_code=501,
+            status_message='Reservation events need etcd storage'
+        )
 
-class Storage:
     def save_data(self):
         pass
 
@@ -66,44 +302,368 @@ class Storage:
     def get_reservation(self, name, core=False):
         pass
 
+    # Create-if-absent routines (backends override with atomic versions)
+    def create_project(self, name, title, description):
+        try:
+            self.get_project(name)
+        except ProjectNameNotFound:
+            return self.set_project(name, title, description)
+
+        raise ProjectNameExists(name)
+
+    def create_scenario(self, name, title, description, project):
+        try:
+            self.get_scenario(name)
+        except ScenarioNameNotFound:
+            # Does project exist? (If not, pass not found exception back)
+            self.get_project(project, core=True)
+            return self.set_scenario(name, title, description, project)
+
+        raise ScenarioNameExists(name)
+
+    def create_reservation(self, project: str, email: str, duration: int):
+        try:
+            self.get_reservation(project, core=True)
+        except ReservationNameNotFound:
+            return self.set_reservation(project, email, duration)
+
+        raise ReservationExists(project)
+
+    # Bulk create routines: one result per item, None when it was created or
+    # the StorageException its own create would have raised (backends
+    # override to commit the batch at once)
+    def create_projects_bulk(self, projects: List[Project]) -> list:
+        results = []
+        for project in projects:
+            try:
+                self.create_project(
+                    project.name, project.title, project.description
+                )
+                results.append(None)
+            except StorageException as err:
+                results.append(err)
+
+        return results
+
+    def create_scenarios_bulk(self, scenarios: List[Scenario]) -> list:
+        results = []
+        for scenario in scenarios:
+            try:
+                self.create_scenario(
+                    scenario.name, scenario.title,
+                    scenario.description, scenario.project
+                )
+                results.append(None)
+            except StorageException as err:
+                results.append(err)
+
+        return results
+
+    # Bulk summary routines (backends override with a single read)
+    def get_projects_bulk(self, core=True) -> List[ProjectCore]:
+        return [
+            self.get_project(name, core=core)
+            for name in self.get_project_list()
+        ]
+
+    def get_scenarios_bulk(self, core=True) -> List[ScenarioCore]:
+        return [
+            self.get_scenario(name, core=core)
+            for name in self.get_scenario_list()
+        ]
+
+    def get_scenarios_by_project(self, project, core=True) -> List[ScenarioCore]:
+        return [
+            scenario for scenario in self.get_scenarios_bulk(core=core)
+            if scenario.project == project
+        ]
+
+    def get_reservations_bulk(self, core=True) -> List[ReservationCore]:
+        return [
+            self.get_reservation(name, core=core)
+            for name in self.get_reservation_list()
+        ]
+
+    # Paged summary routines: up to limit entries named after cursor, in name
+    # order, with the next page's cursor (backends override with range reads)
+    def get_projects_page(self, limit, cursor=None, core=True):
+        projects = {p.name: p for p in self.get_projects_bulk(core=core)}
+        names, next_cursor = _page_names(projects, limit, cursor)
+
+        return [projects[name] for name in names], next_cursor
+
+    def get_scenarios_page(self, limit, cursor=None, core=True, project=None):
+        if project:
+            scenarios = self.get_scenarios_by_project(project, core=core)
+        else:
+            scenarios = self.get_scenarios_bulk(core=core)
+
+        scenarios = {s.name: s for s in scenarios}
+        names, next_cursor = _page_names(scenarios, limit, cursor)
+
+        return [scenarios[name] for name in names], next_cursor
+
+    def get_reservations_page(self, limit, cursor=None, core=True):
+        reservations = {
+            r.project: r for r in self.get_reservations_bulk(core=core)
+        }
+        names, next_cursor = _page_names(reservations, limit, cursor)
+
+        return [reservations[name] for name in names], next_cursor
+
+    # Snapshot export and import.  snapshot_revision gives a token pinning
+    # export_page reads to one point in time (None: every page reads the
+    # latest).  export_page is one page of kind's full entries, as the
+    # get_*_page routines.  import_batch writes entries as they are,
+    # replacing any of the same name; reservations run for their ttl from
+    # now (backends override to write the batch at once).
+    def snapshot_revision(self):
+        return None
+
+    def export_page(self, kind: str, limit, cursor=None, revision=None):
+        page = {
+            "project": self.get_projects_page,
+            "scenario": self.get_scenarios_page,
+            "reservation": self.get_reservations_page,
+        }[kind]
+
+        return page(limit, cursor, core=False)
+
+    def import_batch(
+        self, projects: List[Project], scenarios: List[Scenario],
+        reservations: List[Reservation]
+    ):
+        for project in projects:
+            self.set_project(project.name, project.title, project.description)
+
+        for scenario in scenarios:
+            self.set_scenario(
+                scenario.name, scenario.title,
+                scenario.description, scenario.project
+            )
+
+        for reservation in reservations:
+            self.set_reservation(
+                reservation.project, reservation.email, reservation.ttl
+            )
+
+    # Schema builders, shared by the storage backends.  Stored data was
+    # validated on the way in, so models are built without validation.
+    @staticmethod
+    def _build_project(name, data, core=False):
+        if core:
+            return ProjectCore.construct(name=name, title=data["title"])
+
+        return Project.construct(
+            name=name, title=data["title"], description=data["description"]
+        )
+
+    @staticmethod
+    def _build_scenario(name, data, core=False):
+        if core:
+            return ScenarioCore.construct(
+                name=name, title=data["title"], project=data["project"]
+            )
+
+        return Scenario.construct(
+            name=name, title=data["title"], project=data["project"],
+            description=data["description"]
+        )
+
+
+class LocalLeases:
+    """
+    In-process lease table for LocalStorage, modelled on etcd leases: each
+    lease has a TTL and a set of attached keys deleted when it expires.
+
+    Expiries are kept in a min-heap, so granting is O(log n) and finding
+    what has expired only looks at the top.  Revoking drops the table entry
+    in O(1); its heap entry is discarded lazily when it reaches the top.
+    Remaining time is read straight from the table in O(1).
+    """
+
+    def __init__(self):
+        self._heap = []     # (expires, lease id)
+        self._leases = {}   # lease id -> [expires, ttl, attached keys]
+        self._next_id = 1
+
+    def __len__(self):
+        return len(self._leases)
+
+    def grant(self, ttl: int, id: int = 0, expires: float = 0) -> Lease:
+        # id and expires are given when restoring persisted leases
+        if not id:
+            id = self._next_id
+        self._next_id = max(self._next_id, id + 1)
+
+        expires = expires or time.time() + ttl
+        self._leases[id] = [expires, ttl, set()]
+        heapq.heappush(self._heap, (expires, id))
+
+        return Lease(ttl=ttl, id=id)
+
+    def attach(self, id: int, key: str):
+        self._leases[id][2].add(key)
+
+    def detach(self, id: int, key: str):
+        if id in self._leases:
+            self._leases[id][2].discard(key)
+
+    def expires(self, id: int) -> float:
+        return self._leases[id][0]
+
+    def renew(self, id: int, ttl: int) -> float:
+        """Restart a lease for ttl seconds, returning its new expiry"""
+
+        lease = self._leases[id]
+        lease[0], lease[1] = time.time() + ttl, ttl
+        heapq.heappush(self._heap, (lease[0], id))
+
+        return lease[0]
+
+    def revoke(self, id: int) -> set:
+        """Drop a lease, returning the keys that were attached to it"""
+
+        lease = self._leases.pop(id, None)
+        return lease[2] if lease else None
+
+    def remaining(self, id: int) -> int:
+        lease = self._leases.get(id)
+        if lease is None:
+            return -1
+        return max(0, int(lease[0] - time.time()))
+
+    def next_expiry(self) -> float:
+        while self._heap and self._heap[0][1] not in self._leases:
+            heapq.heappop(self._heap)
+
+        return self._heap[0][0] if self._heap else None
+
+    def expire(self, now: float = None) -> set:
+        """Pop every lease due by now, returning their attached keys"""
+
+        now = now or time.time()
+        keys = set()
+
+        while self._heap and self._heap[0][0] <= now:
+            expires, id = heapq.heappop(self._heap)
+            lease = self._leases.get(id)
+
+            # Revoked, or re-granted with a later expiry
+            if lease is None or lease[0] != expires:
+                continue
+
+            keys |= self.revoke(id)
+
+        return keys
+
 
 class LocalStorage(Storage):
-    def __init__(self, pathname="data", filename="local_storage.json"):
+    def __init__(
+        self, pathname="data", filename="local_storage.json",
+        sweep_interval=1.0, commit_interval=0.005
+    ):
         self.data = {
             "project": {},
-            "scenario": {}
+            "scenario": {},
+            "reservation": {}
         }
 
         self.storage_path = pathname
         self.storage_file = filename
         self.storage_name = f'{pathname}/{filename}'
 
+        # Serializes check-then-set sequences across request threads
+        self.lock = threading.RLock()
+        self.leases = LocalLeases()
+
+        # project name -> names of its scenarios, kept by _put/_delete
+        self.scenario_index = {}
+
+        # Journal sequence of the last change, per entry and per kind
+        self.revisions = {}
+        self.changed = {}
+
+        # Changes are logged as they happen, save_data() makes them durable
+        self.journal = Journal(
+            self.storage_name, commit_interval=commit_interval
+        )
+
         self.load_data()
 
+        # Expired reservations are also removed on read; the sweeper makes
+        # sure they leave the saved data even when nobody is reading
+        self.sweep_interval = sweep_interval
+        self._stop = threading.Event()
+        self._sweeper = threading.Thread(target=self._sweep, daemon=True)
+        self._sweeper.start()
+
+    def close(self):
+        # The sweeper first: its last save still needs the journal
+        self._stop.set()
+        self._sweeper.join()
+        self.journal.close()
+
+    # Every change goes through here so the journal (and index) sees it
+    def _put(self, kind: str, name: str, value: dict):
+        with self.lock:
+            if kind == "scenario":
+                self._unindex(name)
+                self.scenario_index.setdefault(
+                    value["project"], set()
+                ).add(name)
+
+            self.data[kind][name] = value
+            self.journal.append("put", kind, name, value)
+            self._changed(kind, name)
+
+    def _delete(self, kind: str, name: str):
+        with self.lock:
+            if kind == "scenario":
+                self._unindex(name)
+
+            if self.data[kind].pop(name, None) is not None:
+                self.journal.append("delete", kind, name)
+                self._changed(kind, name)
+
+    def _changed(self, kind: str, name: str):
+        self.revisions[kind, name] = self.changed[kind] = self.journal.seq
+
+    def get_revision(self, kind: str, name: str = None, project: str = None):
+        if kind == "reservation":
+            self._expire()
+
+        with self.lock:
+            if name:
+                if name not in self.data[kind]:
+                    return None
+                # Unchanged since loading
+                return str(self.revisions.get((kind, name), self.journal.seq))
+
+            return str(self.changed.get(kind, self.journal.seq))
+
+    def _unindex(self, name: str):
+        old = self.data["scenario"].get(name)
+        if old is None:
+            return
+
+        names = self.scenario_index.get(old["project"], set())
+        names.discard(name)
+        if not names:
+            self.scenario_index.pop(old["project"], None)
+
     # Data handling routines
     def get_project(self, name, core=False):
         if name not in self.data["project"]:
             raise ProjectNameNotFound(name)
 
-        if core:
-            project = ProjectCore(
-                name=name,
-                title=self.data["project"][name]["title"]
-            )
-        else:
-            project = Project(
-                name=name,
-                title=self.data["project"][name]["title"],
-                description=self.data["project"][name]["description"]
-            )
-
-        return project
+        return self._build_project(name, self.data["project"][name], core)
 
     def set_project(self, name, title, description):
-        self.data["project"][name] = {
+        self._put("project", name, {
             "title": title,
             "description": description
-        }
+        })
 
         # Fetch the project data, in schema format
         return self.get_project(name)
@@ -111,32 +671,51 @@ class LocalStorage(Storage):
     def get_project_list(self) -> List[str]:
         return list(self.data["project"])
 
+    def get_projects_bulk(self, core=True) -> List[ProjectCore]:
+        return [
+            self._build_project(name, data, core)
+            for name, data in list(self.data["project"].items())
+        ]
+
+    def create_projects_bulk(self, projects: List[Project]) -> list:
+        # Journal appends only, flushed by the one save_data() that follows
+        with self.lock:
+            return Storage.create_projects_bulk(self, projects)
+
+    def create_scenarios_bulk(self, scenarios: List[Scenario]) -> list:
+        with self.lock:
+            return Storage.create_scenarios_bulk(self, scenarios)
+
+    def import_batch(self, projects, scenarios, reservations):
+        with self.lock:
+            Storage.import_batch(self, projects, scenarios, reservations)
+
+    def get_projects_page(self, limit, cursor=None, core=True):
+        with self.lock:
+            names, next_cursor = _page_names(
+                self.data["project"], limit, cursor
+            )
+            return [
+                self._build_project(name, self.data["project"][name], core)
+                for name in names
+            ], next_cursor
+
+    def create_project(self, name, title, description):
+        with self.lock:
+            return Storage.create_project(self, name, title, description)
+
     def get_scenario(self, name, core=False):
         if name not in self.data["scenario"]:
             raise ScenarioNameNotFound(name)
 
-        if core:
-            scenario = ScenarioCore(
-                name=name,
-                title=self.data["scenario"][name]["title"],
-                project=self.data["scenario"][name]["project"]
-            )
-        else:
-            scenario = Scenario(
-                name=name,
-                title=self.data["scenario"][name]["title"],
-                project=self.data["scenario"][name]["project"],
-                description=self.data["scenario"][name]["description"]
-            )
-
-        return scenario
+        return self._build_scenario(name, self.data["scenario"][name], core)
 
     def set_scenario(self, name, title, description, project):
-        self.data["scenario"][name] = {
+        self._put("scenario", name, {
             "title": title,
             "description": description,
             "project": project
-        }
+        })
 
         # Fetch the scenario data, in schema format
         return self.get_scenario(name)
@@ -144,48 +723,466 @@ class LocalStorage(Storage):
     def get_scenario_list(self) -> List[str]:
         return list(self.data["scenario"])
 
+    def get_scenarios_bulk(self, core=True) -> List[ScenarioCore]:
+        return [
+            self._build_scenario(name, data, core)
+            for name, data in list(self.data["scenario"].items())
+        ]
+
+    def get_scenarios_by_project(self, project, core=True) -> List[ScenarioCore]:
+        # Index and data read together, built outside the lock
+        with self.lock:
+            items = [
+                (name, self.data["scenario"][name])
+                for name in sorted(self.scenario_index.get(project, ()))
+            ]
+
+        return [
+            self._build_scenario(name, data, core) for name, data in items
+        ]
+
+    def get_scenarios_page(self, limit, cursor=None, core=True, project=None):
+        with self.lock:
+            names, next_cursor = _page_names(
+                self.scenario_index.get(project, ()) if project
+                else self.data["scenario"],
+                limit, cursor
+            )
+            return [
+                self._build_scenario(name, self.data["scenario"][name], core)
+                for name in names
+            ], next_cursor
+
+    def create_scenario(self, name, title, description, project):
+        with self.lock:
+            return Storage.create_scenario(
+                self, name, title, description, project
+            )
+
+    # Reservation and lease routines
+    def _expire(self) -> bool:
+        with self.lock:
+            expired = self.leases.expire()
+            for name in expired:
+                self._delete("reservation", name)
+
+        return bool(expired)
+
+    def _sweep(self):
+        while True:
+            with self.lock:
+                next_expiry = self.leases.next_expiry()
+
+            delay = self.sweep_interval
+            if next_expiry is not None:
+                delay = min(delay, max(0.0, next_expiry - time.time()))
+            if self._stop.wait(delay):
+                return
+
+            if self._expire():
+                self.save_data()
+
+    def get_reservation(self, name: str, core: bool = False):
+        self._expire()
+
+        data = self.data["reservation"].get(name)
+        if data is None:
+            raise ReservationNameNotFound(name)
+
+        return self._build_reservation(name, data, core)
+
+    def _build_reservation(self, name: str, data: dict, core: bool = False):
+        if core:
+            return ReservationCore.construct(project=name, email=data["email"])
+
+        return Reservation.construct(
+            project=name, email=data["email"], id=data["id"],
+            ttl=self.leases.remaining(data["id"])
+        )
+
+    def get_reservation_list(self) -> List[str]:
+        self._expire()
+        return list(self.data["reservation"])
+
+    def get_reservations_bulk(self, core=True) -> List[ReservationCore]:
+        self._expire()
+        return [
+            self._build_reservation(name, data, core)
+            for name, data in list(self.data["reservation"].items())
+        ]
+
+    def get_reservations_page(self, limit, cursor=None, core=True):
+        self._expire()
+
+        with self.lock:
+            names, next_cursor = _page_names(
+                self.data["reservation"], limit, cursor
+            )
+            return [
+                self._build_reservation(
+                    name, self.data["reservation"][name], core
+                )
+                for name in names
+            ], next_cursor
+
+    def get_lease_count(self) -> int:
+        self._expire()
+        return len(self.leases)
+
+    def create_lease(self, duration: int) -> Lease:
+        with self.lock:
+            return self.leases.grant(duration)
+
+    def revoke_lease(self, id: int) -> bool:
+        with self.lock:
+            keys = self.leases.revoke(id)
+            if keys is None:
+                raise StorageException(
+                    status_message='Lease revocation failed'
+                )
+
+            for name in keys:
+                self._delete("reservation", name)
+
+        return True
+
+    def set_reservation(self, project: str, email: str, duration: int):
+        with self.lock:
+            lease: Lease = self.create_lease(duration)
+            self.leases.attach(lease.id, project)
+
+            # Replacing a reservation detaches it from its old lease
+            old = self.data["reservation"].get(project)
+            if old:
+                self.leases.detach(old["id"], project)
+
+            self._put("reservation", project, {
+                "email": email,
+                "id": lease.id,
+                "ttl": lease.ttl,
+                "expires": self.leases.expires(lease.id)
+            })
+
+            return self.get_reservation(project)
+
+    def create_reservation(self, project: str, email: str, duration: int):
+        with self.lock:
+            return Storage.create_reservation(self, project, email, duration)
+
+    def renew_reservation(
+        self, project: str, email: str, duration: int = None, auto=None
+    ) -> Reservation:
+        self._expire()
+
+        with self.lock:
+            data = self.data["reservation"].get(project)
+            if data is None:
+                raise ReservationNameNotFound(project)
+            if data["email"] != email:
+                raise ReservationPermissionDenied(email, data["email"])
+
+            return self._renew(project, data, duration or data["ttl"], auto)
+
+    def renew_due(self, within: float) -> List[str]:
+        self._expire()
+
+        with self.lock:
+            due = time.time() + within
+            names = [
+                name for name, data in self.data["reservation"].items()
+                if data.get("renew") and data["expires"] <= due
+            ]
+            for name in names:
+                data = self.data["reservation"][name]
+                self._renew(name, data, data["ttl"])
+
+        return names
+
+    def _renew(self, project: str, data: dict, duration: int, auto=None):
+        # The lease is this reservation's own: restart it in place
+        data = dict(data, ttl=duration, expires=self.leases.renew(
+            data["id"], duration
+        ))
+        if auto is not None:
+            data["renew"] = auto
+        self._put("reservation", project, data)
+
+        return Reservation(
+            project=project, email=data["email"], id=data["id"], ttl=duration
+        )
+
     def save_data(self):
-        # json the data and save to file
-        with open(self.storage_name, "w") as outfile:
-            json.dump(self.data, outfile)
+        # Wait for the journal to fsync this thread's changes (group commit)
+        self.journal.commit()
+
+        # Fold the log into a fresh snapshot once it outgrows the catalog
+        with self.lock:
+            size = sum(len(entries) for entries in self.data.values())
+            if self.journal.needs_compaction(size):
+                self.journal.compact(self.data)
 
     def load_data(self):
-        # Load the data file if there.  Otherwise, start clean.
+        # Snapshot plus log replay; a missing file means start clean, an
+        # unreadable snapshot is raised rather than silently discarded
         try:
-            with open(self.storage_name, "r") as infile:
-                self.data = json.load(infile)
-        except Exception:
-            pass
+            self.data.update(self.journal.load())
+        except JournalCorrupt as err:
+            raise StorageException(
+                status_message=f'Local storage unreadable: {err}'
+            )
+
+        self.changed = {kind: self.journal.seq for kind in self.data}
 
+        for name, data in self.data["scenario"].items():
+            self.scenario_index.setdefault(data["project"], set()).add(name)
+
+        # Leases live as long as their reservations' stored expiry
+        for name, data in self.data["reservation"].items():
+            self.leases.grant(data["ttl"], data["id"], data["expires"])
+            self.leases.attach(data["id"], name)
+        self._expire()
+
+
+class EtcdStorage(EtcdWaitlist, EtcdUsage, Storage):
+    PREFIXES = {
+        "project": "/project/",
+        "scenario": "/scenario/",
+        "reservation": "/reservation/project/",
+    }
+
+    # Leaders, one key per role naming its worker, on that worker's lease
+    LEADER = "/leader/"
 
-class EtcdStorage(Storage):
     def __init__(
         self,
         etcd_service="localhost",
-        etcd_port=2379
+        etcd_port=2379,
+        pool_size=10,
+        timeout=5.0,
+        retries=2,
+        lease_window=0,
+        codec="json",
+        namespace=""
+    ):
+        """
+        etcd_service may list several members, comma-separated, each as host
+        or host:port (etcd_port otherwise).  Calls go to the healthiest,
+        fastest member and fail over (see PooledEtcd3Client).
+
+        With a lease_window (seconds) reservations share one lease per
+        window of expiry (see LeaseBuckets) instead of one lease each.
+
+        codec is how values are written, json or msgpack (service.codec);
+        values are read whichever way they were written.
+
+        With a namespace (say /lab-a) every key lives under it, so several
+        deployments can share a cluster without seeing each other's data.
+        """
+
+        self.storage_service = PooledEtcd3Client(
+            EtcdEndpoints(parse_endpoints(etcd_service, etcd_port)),
+            pool_size=pool_size, timeout=timeout, retries=retries,
+            namespace=namespace
+        )
+        self.lease_buckets = LeaseBuckets(lease_window) \
+            if lease_window else None
+        self._dumps = encoder(codec)
+        self._leader_leases = {}    # role -> lease, while this worker leads
+
+        self._scenarios_indexed = False
+
+    def _range(self, prefix: str, **kwargs) -> dict:
+        """
+        Raw range read over a key prefix.  Unlike Etcd3Client.get this keeps
+        the response header (store revision) and the 'more' flag.  Keys and
+        values in result["kvs"] are decoded to bytes.
+        """
+
+        payload = {
+            "key": _encode(prefix),
+            "range_end": _encode(_increment_last_byte(prefix)),
+        }
+        payload.update(kwargs)
+
+        result = self.storage_service.post(
+            self.storage_service.get_url('/kv/range'), json=payload
+        )
+
+        for item in result.get("kvs", []):
+            item["key"] = _decode(item["key"])
+            item["value"] = _decode(item.get("value", ""))
+
+        return result
+
+    def _range_page(self, prefix: str, limit: int, cursor: str = None, **kwargs):
+        """
+        One page of a prefix: up to limit (name, item) pairs after cursor and
+        the cursor of the next page, from a single bounded range read.
+        """
+
+        if cursor:
+            # Start just past the cursor's key, still ending at the prefix end
+            kwargs["key"] = _encode(f'{prefix}{cursor}\0')
+
+        result = self._range(prefix, limit=limit, **kwargs)
+        items = [
+            (item["key"].decode("utf-8")[len(prefix):], item)
+            for item in result.get("kvs", [])
+        ]
+
+        return items, items[-1][0] if items and result.get("more") else None
+
+    def get_revision(self, kind: str, name: str = None, project: str = None):
+        """
+        An entry's mod_revision, or for a collection its highest mod_revision
+        and key count: any put raises the first, a delete lowers the second.
+        Key-only reads, values are not fetched.
+        """
+
+        if self._untagged(kind, name):
+            return None
+
+        if name:
+            key = f'{self.PREFIXES[kind]}{name}'
+            kvs = self._range(
+                key, keys_only=True, range_end=_encode(f'{key}\0')
+            ).get("kvs", [])
+            return kvs[0]["mod_revision"] if kvs else None
+
+        # Newest key only (sort target MOD, order DESCEND); count is total
+        result = self._range(
+            self._collection_prefix(kind, project),
+            keys_only=True, limit=1, sort_target=3, sort_order=2
+        )
+        return _collection_revision(result.get("kvs", []), result)
+
+    def _collection_prefix(self, kind: str, project: str = None) -> str:
+        if kind == "scenario" and project:
+            self._index_scenarios()
+            return _scenario_index(project)
+
+        return self.PREFIXES[kind]
+
+    def _untagged(self, kind: str, name: str = None) -> bool:
+        # On shared leases an expired reservation keeps its key until the
+        # window ends: it leaves the list with no change etcd could tag
+        return kind == "reservation" and not name and \
+            self.lease_buckets is not None
+
+    def get_tagged(
+        self, kind: str, name=None, project=None, limit=None, cursor=None
     ):
+        """
+        One round trip, tagged from what it read: an entry's mod_revision,
+        a whole collection's newest mod_revision and count of its items.  A
+        page is read in one transaction with its collection's newest key.
+        """
+
+        # Single reservations are not tagged by the API (remaining time)
+        if name and kind == "reservation":
+            return super().get_tagged(kind, name)
+
+        if self._untagged(kind):
+            return _tagged_read(self, kind, limit=limit, cursor=cursor), None
+
+        if name:
+            key = f'{self.PREFIXES[kind]}{name}'
+            kvs = self._range(key, range_end=_encode(f'{key}\0')).get("kvs", [])
+            if not kvs:
+                raise ProjectNameNotFound(name) if kind == "project" \
+                    else ScenarioNameNotFound(name)
+
+            build = self._build_project if kind == "project" \
+                else self._build_scenario
+            return build(name, loads(kvs[0]["value"])), kvs[0]["mod_revision"]
+
+        prefix = self._collection_prefix(kind, project)
+
+        if limit:
+            _, responses = self._txn([], [
+                _txn_page(prefix, limit, cursor), _txn_newest(prefix)
+            ])
+            (items, next_cursor), revision = \
+                _txn_tagged_page(responses, prefix)
+            return (self._summaries(kind, items), next_cursor), revision
+
+        kvs = self._range(prefix).get("kvs", [])
+        items = [(item["key"].decode("utf-8")[len(prefix):], item) for item in kvs]
+        return self._summaries(kind, items), _kvs_revision(kvs)
+
+    def _summaries(self, kind: str, items: list) -> list:
+        # Summaries of (name, item) pairs read from kind's prefix
+        entries = [(name, loads(item["value"])) for name, item in items]
+
+        if kind == "reservation":
+            return self._build_reservations(entries)
+
+        build = self._build_project if kind == "project" \
+            else self._build_scenario
+        return [build(name, data, core=True) for name, data in entries]
+
+    def watch_reservations(self, callback, on_reset=None):
+        """
+        Start one watch passing every reservation change to callback(event).
+        Returns (watcher, store revision it starts after).  If etcd compacted
+        away changes the watch missed, it resumes from the current revision
+        and on_reset(revision) is told.
+        """
+
+        prefix = self.PREFIXES["reservation"]
+
+        def current_revision():
+            result = self._range(prefix, count_only=True)
+            return int(result["header"]["revision"])
+
+        def reset(compact_revision):
+            revision = current_revision()
+            if on_reset is not None:
+                on_reset(revision)
+            return revision
 
-        self.storage_service = Etcd3Client(
-            host=etcd_service, port=etcd_port, api_path='/v3/'
+        revision = current_revision()
+        watcher = EtcdWatcher(
+            self.storage_service, prefix, _increment_last_byte(prefix),
+            callback, start_revision=revision, on_reset=reset
         )
+        watcher.start()
+
+        return watcher, revision
+
+    def _key_names(self, prefix: str) -> List[str]:
+        # Key-only read, values never leave etcd
+        return [
+            item["key"].decode("utf-8")[len(prefix):]
+            for item in self._range(prefix, keys_only=True).get("kvs", [])
+        ]
 
     # Data handling routines
+    def ping(self, timeout: float = 1.0) -> bool:
+        # Member status is read-only (unlike a probe lease) and bounded
+        self.storage_service.post(
+            self.storage_service.get_url('/maintenance/status'),
+            json={}, timeout=timeout
+        )
+
+        return True
+
+    def _txn(self, compare: list, success: list, failure: list = None):
+        """Single etcd transaction, returns (succeeded, responses)"""
+
+        result = self.storage_service.transaction({
+            "compare": compare, "success": success, "failure": failure or []
+        })
+
+        return result.get("succeeded", False), result.get("responses", [])
+
     def get_project(self, name, core=False):
         value = self.storage_service.get(f'/project/{name}')
 
         if not value:
             raise ProjectNameNotFound(name)
 
-        data = json.loads(value[0])
-
-        if core:
-            project = ProjectCore(name=name, title=data["title"])
-        else:
-            project = Project(
-                name=name, title=data["title"], description=data["description"]
-            )
-
-        return project
+        return self._build_project(name, loads(value[0]), core)
 
     def set_project(self, name, title, description):
         """
@@ -196,80 +1193,479 @@ class EtcdStorage(Storage):
 
         self.storage_service.put(
             key=f'/project/{name}',
-            value=json.dumps(data)
+            value=self._dumps(data)
         )
 
         # Fetch the project data, in schema format
         return self.get_project(name)
 
+    def create_project(self, name, title, description):
+        data = {'title': title, 'description': description}
+        key = f'/project/{name}'
+
+        succeeded, _ = self._txn(
+            [_txn_absent(key)], [_txn_put(key, self._dumps(data))]
+        )
+        if not succeeded:
+            raise ProjectNameExists(name)
+
+        return self._build_project(name, data)
+
     def get_project_list(self) -> List[str]:
-        # Return list of (value, key metadata)
+        return self._key_names('/project/')
+
+    def create_projects_bulk(self, projects: List[Project]) -> list:
+        entries = []
+        for project in projects:
+            key = f'/project/{project.name}'
+            data = {'title': project.title, 'description': project.description}
+
+            entries.append((
+                [_txn_absent(key)],
+                [_txn_put(key, self._dumps(data))],
+                [_txn_count(key)],
+                partial(self._project_error, project)
+            ))
+
+        return self._create_batched(
+            [project.name for project in projects], entries
+        )
+
+    def create_scenarios_bulk(self, scenarios: List[Scenario]) -> list:
+        entries = []
+        for scenario in scenarios:
+            key = f'/scenario/{scenario.name}'
+            project_key = f'/project/{scenario.project}'
+            data = {
+                "title": scenario.title,
+                "description": scenario.description,
+                "project": scenario.project
+            }
+            index_key = _scenario_index(scenario.project, scenario.name)
+
+            entries.append((
+                [_txn_absent(key), _txn_present(project_key)],
+                [
+                    _txn_put(key, self._dumps(data)),
+                    _txn_put(index_key, self._dumps(data))
+                ],
+                [_txn_count(key), _txn_count(project_key)],
+                partial(self._scenario_error, scenario)
+            ))
+
+        return self._create_batched(
+            [scenario.name for scenario in scenarios], entries
+        )
+
+    @staticmethod
+    def _project_error(project: Project, counts: list):
+        if counts[0]:
+            return ProjectNameExists(project.name)
+        return None
+
+    @staticmethod
+    def _scenario_error(scenario: Scenario, counts: list):
+        if counts[0]:
+            return ScenarioNameExists(scenario.name)
+        if not counts[1]:
+            return ProjectNameNotFound(scenario.project)
+        return None
+
+    def _create_batched(self, names: List[str], entries: list) -> list:
+        """
+        Create many entries in as few transactions as TXN_OPS_MAX and
+        TXN_BYTES_MAX allow (halved again if etcd finds one too large).
+        Each entry is (compares, puts, checks, error): error(check counts)
+        gives the exception for an entry that can not be created.
+
+        A transaction creates all its entries or none.  When one fails, the
+        checks read in that same transaction show which entries can not be
+        created; those get their error and the rest are retried, so every
+        retry makes progress.
+        """
+
+        results = [None] * len(entries)
+        pending = []
+
+        # Within the batch the first of a name wins, as if sent in order
+        seen = set()
+        for position, (name, entry) in enumerate(zip(names, entries)):
+            if name in seen:
+                results[position] = entry[3]([1] * len(entry[2]))
+            else:
+                seen.add(name)
+                pending.append((position, entry))
+
+        width = max([len(entry[0]) for _, entry in pending] + [1])
+        size = TXN_OPS_MAX // width
+
+        chunks = deque()
+        chunk, weight = [], 0
+        for position, entry in pending:
+            entry_bytes = _txn_bytes(entry[:3])
+            if chunk and (
+                len(chunk) == size or weight + entry_bytes > TXN_BYTES_MAX
+            ):
+                chunks.append(chunk)
+                chunk, weight = [], 0
+            chunk.append((position, entry))
+            weight += entry_bytes
+        if chunk:
+            chunks.append(chunk)
+
+        while chunks:
+            chunk = chunks.popleft()
+
+            try:
+                succeeded, responses = self._txn(
+                    [op for _, entry in chunk for op in entry[0]],
+                    [op for _, entry in chunk for op in entry[1]],
+                    [op for _, entry in chunk for op in entry[2]]
+                )
+            except etcd_exceptions.Etcd3Exception as err:
+                # Over a limit etcd was started with: halve the chunk
+                if 'request is too large' not in str(err.detail_text):
+                    raise
+                if len(chunk) == 1:
+                    position = chunk[0][0]
+                    results[position] = EntryTooLarge(names[position])
+                else:
+                    half = len(chunk) // 2
+                    chunks.extendleft([chunk[half:], chunk[:half]])
+                continue
+
+            if succeeded:
+                continue
+
+            counts = [_txn_counted(response) for response in responses]
+            retry = []
+            for position, entry in chunk:
+                checks, counts = counts[:len(entry[2])], counts[len(entry[2]):]
+                error = entry[3](checks)
+                if error is None:
+                    retry.append((position, entry))
+                else:
+                    results[position] = error
+
+            if retry:
+                chunks.appendleft(retry)
+
+        return results
+
+    def get_projects_bulk(self, core=True) -> List[ProjectCore]:
+        # One range read, values decoded in place (no per-key fetch)
         results = self.storage_service.get_prefix('/project/')
 
-        projects = [
-            d["key"].decode("utf-8").split('/')[-1]
+        return [
+            self._build_project(
+                d["key"].decode("utf-8").split('/')[-1], loads(v), core
+            )
             for v, d in results
         ]
 
-        return projects
-
     def get_scenario(self, name, core=False):
         value = self.storage_service.get(f'/scenario/{name}')
 
         if not value:
             raise ScenarioNameNotFound(name)
 
-        data = json.loads(value[0])
+        return self._build_scenario(name, loads(value[0]), core)
+
+    def set_scenario(self, name, title, description, project):
+        data = {
+            "title": title,
+            "description": description,
+            "project": project
+        }
+        key = f'/scenario/{name}'
+
+        # Scenario and its index entry change together; moving to another
+        # project drops the old entry
+        success = [
+            _txn_put(key, self._dumps(data)),
+            _txn_put(_scenario_index(project, name), self._dumps(data))
+        ]
+
+        old = self.storage_service.get(key)
+        if old and loads(old[0])["project"] != project:
+            success.append(_txn_delete(
+                _scenario_index(loads(old[0])["project"], name)
+            ))
+
+        self._txn([], success)
+
+        # Fetch the scenario data, in schema format
+        return self.get_scenario(name)
+
+    def create_scenario(self, name, title, description, project):
+        """
+        Scenario must not exist and its project must, checked in the same
+        transaction as the put.  On failure the scenario key is counted to
+        tell the two cases apart.
+        """
+
+        data = {
+            "title": title,
+            "description": description,
+            "project": project
+        }
+        key = f'/scenario/{name}'
+
+        succeeded, responses = self._txn(
+            [_txn_absent(key), _txn_present(f'/project/{project}')],
+            [
+                _txn_put(key, self._dumps(data)),
+                _txn_put(_scenario_index(project, name), self._dumps(data))
+            ],
+            [_txn_count(key)]
+        )
+        if not succeeded:
+            if int(responses[0]["response_range"].get("count", 0)):
+                raise ScenarioNameExists(name)
+            raise ProjectNameNotFound(project)
+
+        return self._build_scenario(name, data)
+
+    def get_scenario_list(self) -> List[str]:
+        return self._key_names('/scenario/')
+
+    def get_scenarios_bulk(self, core=True) -> List[ScenarioCore]:
+        # One range read, values decoded in place (no per-key fetch)
+        results = self.storage_service.get_prefix('/scenario/')
+
+        return [
+            self._build_scenario(
+                d["key"].decode("utf-8").split('/')[-1], loads(v), core
+            )
+            for v, d in results
+        ]
+
+    def get_scenarios_by_project(self, project, core=True) -> List[ScenarioCore]:
+        # One range read over the project's index entries
+        self._index_scenarios()
+        results = self.storage_service.get_prefix(_scenario_index(project))
+
+        return [
+            self._build_scenario(
+                d["key"].decode("utf-8").split('/')[-1], loads(v), core
+            )
+            for v, d in results
+        ]
+
+    def get_projects_page(self, limit, cursor=None, core=True):
+        items, next_cursor = self._range_page('/project/', limit, cursor)
+
+        return [
+            self._build_project(name, loads(item["value"]), core)
+            for name, item in items
+        ], next_cursor
+
+    def get_scenarios_page(self, limit, cursor=None, core=True, project=None):
+        if project:
+            self._index_scenarios()
+            prefix = _scenario_index(project)
+        else:
+            prefix = '/scenario/'
+
+        items, next_cursor = self._range_page(prefix, limit, cursor)
+
+        return [
+            self._build_scenario(name, loads(item["value"]), core)
+            for name, item in items
+        ], next_cursor
+
+    def get_reservations_page(self, limit, cursor=None, core=True):
+        items, next_cursor = self._range_page(
+            '/reservation/project/', limit, cursor
+        )
+
+        return self._build_reservations([
+            (name, loads(item["value"])) for name, item in items
+        ], core), next_cursor
+
+    def snapshot_revision(self) -> int:
+        # Store revision now; pages read at it (until etcd compacts it away)
+        # all see this one point in time
+        result = self._range(self.PREFIXES["project"], count_only=True)
+        return int(result["header"]["revision"])
+
+    def export_page(self, kind: str, limit, cursor=None, revision=None):
+        items, next_cursor = self._range_page(
+            self.PREFIXES[kind], limit, cursor, revision=revision or 0
+        )
+        entries = [(name, loads(item["value"])) for name, item in items]
+
+        if kind == "reservation":
+            return self._build_reservations(entries, core=False), next_cursor
+
+        build = self._build_project if kind == "project" \
+            else self._build_scenario
+        return [build(name, data) for name, data in entries], next_cursor
+
+    def import_batch(self, projects, scenarios, reservations):
+        """
+        The batch in transactions of up to TXN_OPS_MAX operations and
+        TXN_BYTES_MAX bytes, each entry's together.  The scenarios replaced
+        are read first (batched) so their index entries move with them;
+        reservation leases are granted beforehand, concurrently.
+        """
+
+        self._index_scenarios()
+
+        entries = [
+            [_txn_put(f'/project/{project.name}', self._dumps({
+                "title": project.title, "description": project.description
+            }))]
+            for project in projects
+        ]
 
-        if core:
-            scenario = ScenarioCore(
-                name=name, title=data["title"], project=data["project"]
-            )
-        else:
-            scenario = Scenario(
-                name=name, title=data["title"], project=data["project"],
-                description=data["description"]
+        current = []
+        for start in range(0, len(scenarios), TXN_OPS_MAX):
+            _, responses = self._txn([], [
+                _txn_get(f'/scenario/{scenario.name}')
+                for scenario in scenarios[start:start + TXN_OPS_MAX]
+            ])
+            current += [_txn_got(response) for response in responses]
+
+        for scenario, old in zip(scenarios, current):
+            value = self._dumps({
+                "title": scenario.title,
+                "description": scenario.description,
+                "project": scenario.project
+            })
+            ops = [
+                _txn_put(f'/scenario/{scenario.name}', value),
+                _txn_put(_scenario_index(scenario.project, scenario.name), value)
+            ]
+            if old and old[0]["project"] != scenario.project:
+                ops.append(_txn_delete(
+                    _scenario_index(old[0]["project"], scenario.name)
+                ))
+            entries.append(ops)
+
+        granted = time.time()
+        leases = []
+        if reservations:
+            with ThreadPoolExecutor(
+                max_workers=min(len(reservations), 16)
+            ) as pool:
+                leases = list(pool.map(
+                    lambda r: self._reservation_lease(granted, r.ttl),
+                    reservations
+                ))
+
+        for reservation, lease in zip(reservations, leases):
+            entries.append([_txn_put(
+                f'/reservation/project/{reservation.project}',
+                self._dumps({
+                    "email": reservation.email,
+                    "id": lease.id,
+                    "ttl": lease.ttl,
+                    "expires": granted + lease.ttl
+                }),
+                lease.id
+            )])
+
+        txn, weight = [], 0
+        for ops in entries:
+            ops_bytes = _txn_bytes(ops)
+            if txn and (
+                len(txn) + len(ops) > TXN_OPS_MAX
+                or weight + ops_bytes > TXN_BYTES_MAX
+            ):
+                self._txn([], txn)
+                txn, weight = [], 0
+            txn += ops
+            weight += ops_bytes
+        if txn:
+            self._txn([], txn)
+
+    def _index_scenarios(self):
+        """
+        Index scenarios stored before the index existed, once per store.
+        Each entry is only written if its scenario is unchanged since read,
+        so a concurrent update is never overwritten with stale data.
+        """
+
+        marker = '/index/version/scenario'
+        if self._scenarios_indexed or self.storage_service.get(marker):
+            self._scenarios_indexed = True
+            return
+
+        for item in self._range('/scenario/').get("kvs", []):
+            value = item["value"]
+            name = item["key"].decode("utf-8").split('/')[-1]
+            project = loads(value)["project"]
+
+            self._txn(
+                [{
+                    "key": _encode(item["key"]), "result": "EQUAL",
+                    "target": "MOD", "mod_revision": item["mod_revision"]
+                }],
+                [_txn_put(_scenario_index(project, name), value)]
             )
 
-        return scenario
+        self.storage_service.put(marker, '1')
+        self._scenarios_indexed = True
 
-    def set_scenario(self, name, title, description, project):
-        data = {
-            "title": title,
-            "description": description,
-            "project": project
-        }
+    def get_reservation_list(self) -> List[str]:
+        # Values too: on a shared lease an expired reservation keeps its key
+        prefix = '/reservation/project/'
+        return [
+            item["key"].decode("utf-8")[len(prefix):]
+            for item in self._range(prefix).get("kvs", [])
+            if not _expired(loads(item["value"]))
+        ]
 
-        self.storage_service.put(
-            key=f'/scenario/{name}',
-            value=json.dumps(data)
-        )
+    def get_reservation_count(self) -> int:
+        # A count only read, unless shared leases keep expired keys around
+        if self.lease_buckets is not None:
+            return len(self.get_reservation_list())
 
-        # Fetch the scenario data, in schema format
-        return self.get_scenario(name)
+        result = self._range('/reservation/project/', count_only=True)
+        return int(result.get("count", 0))
 
-    def get_scenario_list(self) -> List[str]:
-        # Return list of (value, key metadata)
-        results = self.storage_service.get_prefix('/scenario/')
+    def get_reservations_bulk(self, core=True) -> List[ReservationCore]:
+        # One range read, values decoded in place (no per-key fetch)
+        results = self.storage_service.get_prefix('/reservation/project/')
 
-        scenarios = [
-            d["key"].decode("utf-8").split('/')[-1]
+        return self._build_reservations([
+            (d["key"].decode("utf-8").split('/')[-1], loads(v))
             for v, d in results
-        ]
+        ], core)
 
-        return scenarios
+    def _build_reservations(self, items: list, core: bool = True):
+        """
+        Schema for many (name, data) reservations.  Remaining time comes from
+        the stored expiry; only records written before expiries were stored
+        need their lease asked, once per distinct lease and concurrently.
+        """
 
-    def get_reservation_list(self) -> List[str]:
-        # Fetch all reservation keys from etcd
-        results = self.storage_service.get_prefix('/reservation/project/')
+        items = [(name, data) for name, data in items if not _expired(data)]
 
-        reservations = [
-            d["key"].decode("utf-8").split('/')[-1]
-            for v, d in results
+        if core:
+            return [self._build_reservation(n, d, core) for n, d in items]
+
+        legacy = list({int(d["id"]) for _, d in items if "expires" not in d})
+        ttls = {}
+        if legacy:
+            with ThreadPoolExecutor(max_workers=min(len(legacy), 16)) as pool:
+                ttls = dict(zip(legacy, pool.map(
+                    lambda id: Etcd3Lease(id, self.storage_service).ttl(),
+                    legacy
+                )))
+
+        return [
+            Reservation.construct(
+                project=name, email=data["email"], id=int(data["id"]),
+                ttl=(
+                    _remaining(data) if "expires" in data
+                    else ttls[int(data["id"])]
+                )
+            )
+            for name, data in items
         ]
 
-        return reservations
-
     def get_reservation(self, name: str, core: bool = False):
         """
         The returned TTL value is the time remaining on the reservation (calc).
@@ -277,27 +1673,41 @@ class EtcdStorage(Storage):
         """
 
         value = self.storage_service.get(f'/reservation/project/{name}')
+        data = loads(value[0]) if value else None
 
-        if not value:
+        if data is None or _expired(data):
             raise ReservationNameNotFound(name)
 
-        data = json.loads(value[0])
+        return self._build_reservation(name, data, core)
 
+    def _build_reservation(self, name: str, data: dict, core: bool = False):
         if core:
-            reservation = ReservationCore(
+            reservation = ReservationCore.construct(
                 project=name, email=data["email"]
             )
+        elif "expires" in data:
+            # The lease may be shared and outlast the reservation
+            reservation = Reservation.construct(
+                project=name, email=data["email"],
+                id=int(data["id"]), ttl=_remaining(data)
+            )
         else:
             lease = Etcd3Lease(int(data["id"]), client=self.storage_service)
             remaining = lease.ttl()
 
-            reservation = Reservation(
+            reservation = Reservation.construct(
                 project=name, email=data["email"],
                 id=int(data["id"]), ttl=remaining
             )
 
         return reservation
 
+    def get_lease_count(self) -> int:
+        result = self.storage_service.post(
+            self.storage_service.get_url('/lease/leases'), json={}
+        )
+        return len(result.get("leases", []))
+
     def create_lease(self, duration: int) -> Lease:
         result = self.storage_service.lease(ttl=duration)
 
@@ -305,6 +1715,36 @@ class EtcdStorage(Storage):
             ttl=duration, id=result.id
         )
 
+    def _reservation_lease(self, granted: float, duration: int) -> Lease:
+        """
+        Lease for a reservation of duration seconds from granted: its own,
+        or with lease buckets the shared lease of its expiry window (granted
+        unless known to be already).
+        """
+
+        if self.lease_buckets is None:
+            return self.create_lease(duration)
+
+        id, end = self.lease_buckets.bucket(granted + duration)
+        if not self.lease_buckets.granted(id):
+            try:
+                self.storage_service.post(
+                    self.storage_service.get_url('/lease/grant'),
+                    json={"TTL": math.ceil(end - time.time()), "ID": id}
+                )
+            except etcd_exceptions.Etcd3Exception as err:
+                # Another worker granted this window first
+                if 'lease already exists' not in str(err.detail_text):
+                    raise
+            self.lease_buckets.add(id, end)
+
+        return Lease(ttl=duration, id=id)
+
+    def _unused_lease(self, id: int):
+        # A losing racer's own lease is revoked, a shared one left alone
+        if not LeaseBuckets.shared(id):
+            self.revoke_lease(id)
+
     def revoke_lease(self, id: int) -> bool:
         lease = Etcd3Lease(id, client=self.storage_service)
 
@@ -313,131 +1753,525 @@ class EtcdStorage(Storage):
 
         return True
 
+    def release_reservation(self, name: str, id: int) -> bool:
+        if not LeaseBuckets.shared(id):
+            return self.revoke_lease(id)
+
+        # Shared lease: delete this key only, if it is still on that lease
+        key = f'/reservation/project/{name}'
+        succeeded, _ = self._txn([_txn_leased(key, id)], [_txn_delete(key)])
+        if not succeeded:
+            raise ReservationNameNotFound(name)
+
+        return True
+
+    def renew_reservation(
+        self, project: str, email: str, duration: int = None, auto=None
+    ) -> Reservation:
+        """
+        Owner only.  The renewed record is written in a transaction on the
+        revision that was read, so a concurrent change is never overwritten
+        (409, the client retries).
+        """
+
+        key = f'{self.PREFIXES["reservation"]}{project}'
+        kvs = self._range(key, range_end=_encode(f'{key}\0')).get("kvs", [])
+        data = loads(kvs[0]["value"]) if kvs else None
+
+        if data is None or _expired(data):
+            raise ReservationNameNotFound(project)
+        if data["email"] != email:
+            raise ReservationPermissionDenied(email, data["email"])
+
+        renewed = self._renewal(data, duration or data["ttl"], auto)
+        succeeded, _ = self._txn(
+            [_txn_unchanged(key, int(kvs[0]["mod_revision"]))],
+            [_txn_put(key, self._dumps(renewed), renewed["id"])]
+        )
+        self._renewed(data, renewed, succeeded)
+
+        if not succeeded:
+            raise StorageException(
+                status_code=409,
+                status_message=f'Reservation {project} changed, try again'
+            )
+
+        return Reservation(
+            project=project, email=email,
+            id=renewed["id"], ttl=renewed["ttl"]
+        )
+
+    def renew_due(self, within: float) -> List[str]:
+        """
+        One range read finds what is due.  Renewed records are written in
+        transactions of up to TXN_OPS_MAX reservations; only if one of those
+        meets a concurrent change are its reservations written one by one.
+        """
+
+        prefix = self.PREFIXES["reservation"]
+        due = time.time() + within
+
+        items = []
+        for item in self._range(prefix).get("kvs", []):
+            data = loads(item["value"])
+            if data.get("renew") and not _expired(data) and \
+                    data["expires"] <= due:
+                items.append((
+                    item["key"].decode("utf-8"), data,
+                    int(item["mod_revision"])
+                ))
+
+        renewed = []
+        for start in range(0, len(items), TXN_OPS_MAX):
+            batch = items[start:start + TXN_OPS_MAX]
+
+            with ThreadPoolExecutor(max_workers=min(len(batch), 16)) as pool:
+                # Window grants for the batch, concurrently
+                records = list(pool.map(
+                    lambda item: self._renewal(item[1], item[1]["ttl"]), batch
+                ))
+
+                writes = [
+                    ([_txn_unchanged(key, mod)],
+                     [_txn_put(key, self._dumps(record), record["id"])])
+                    for (key, _, mod), record in zip(batch, records)
+                ]
+                succeeded, _ = self._txn(
+                    [c for compares, _ in writes for c in compares],
+                    [p for _, puts in writes for p in puts]
+                )
+                results = [succeeded] * len(batch) if succeeded else [
+                    self._txn(compares, puts)[0] for compares, puts in writes
+                ]
+
+                # Then keep-alives of the leases kept, concurrently too
+                list(pool.map(
+                    lambda args: self._renewed(*args),
+                    [(data, record, done) for (_, data, _), record, done
+                     in zip(batch, records, results)]
+                ))
+
+            renewed += [
+                key[len(prefix):]
+                for (key, _, _), done in zip(batch, results) if done
+            ]
+
+        return renewed
+
+    def _renewal(self, data: dict, duration: int, auto=None) -> dict:
+        """
+        The record of a reservation renewed for duration from now.  It keeps
+        its own lease when the duration stays the same (kept alive once the
+        record is written, see _renewed); otherwise it moves to a new lease.
+        """
+
+        granted = time.time()
+        id = int(data["id"])
+
+        if self.lease_buckets is None and not LeaseBuckets.shared(id) and \
+                duration == data["ttl"]:
+            lease_id = id
+        else:
+            lease_id = self._reservation_lease(granted, duration).id
+
+        renewed = dict(
+            data, id=lease_id, ttl=duration, expires=granted + duration
+        )
+        if auto is not None:
+            renewed["renew"] = auto
+
+        return renewed
+
+    def _keep_alive(self, id: int) -> bool:
+        result = self.storage_service.post(
+            self.storage_service.get_url('/lease/keepalive'), json={"ID": id}
+        )
+        # No TTL: the lease is gone
+        return int(result.get("result", {}).get("TTL", 0)) > 0
+
+    def _renewed(self, data: dict, renewed: dict, succeeded: bool):
+        # Give up whichever lease of its own the reservation no longer uses,
+        # or restart the TTL of the one it keeps (LeaseKeepAlive) if written
+        old, new = int(data["id"]), renewed["id"]
+        if old == new:
+            if succeeded:
+                self._keep_alive(old)
+            return
+
+        try:
+            self._unused_lease(old if succeeded else new)
+        except Exception as err:
+            # It expires on its own
+            print(f'Unused lease not revoked: {err}')
+
+    def lead(self, role: str, worker: str, ttl: float) -> bool:
+        """
+        The leader keeps its role by keeping its lease alive (one round
+        trip).  Others only read the role's key, until it is gone with the
+        lease of a leader that stopped: then one transaction lets one of
+        them take it, on a lease of its own.
+        """
+
+        lease = self._leader_leases.pop(role, None)
+        if lease is not None and self._keep_alive(lease):
+            self._leader_leases[role] = lease
+            return True
+
+        key = f'{self.LEADER}{role}'
+        if self.storage_service.get(key):
+            return False
+
+        lease = self.create_lease(math.ceil(ttl)).id
+        succeeded, _ = self._txn(
+            [_txn_absent(key)], [_txn_put(key, worker, lease)]
+        )
+        if not succeeded:
+            self.revoke_lease(lease)
+            return False
+
+        self._leader_leases[role] = lease
+        return True
+
     def set_reservation(self, project: str, email: str, duration: int):
-        lease: Lease = self.create_lease(duration)
+        granted = time.time()
+        lease: Lease = self._reservation_lease(granted, duration)
 
         data = {
             "email": email,
             "id": lease.id,
-            "ttl": lease.ttl
+            "ttl": lease.ttl,
+            "expires": granted + lease.ttl
         }
 
         self.storage_service.put(
             key=f'/reservation/project/{project}',
-            value=json.dumps(data),
+            value=self._dumps(data),
             lease=Etcd3Lease(lease.id, self.storage_service)
         )
 
         return self.get_reservation(project)
 
+    def create_reservation(self, project: str, email: str, duration: int):
+        """
+        Grant the lease, then create the key bound to it in one transaction
+        that only succeeds if no reservation exists.  A losing racer revokes
+        its unused lease.  A reservation found past its expiry (its shared
+        lease not yet over) is replaced, if unchanged since it was read.
+        """
+
+        granted = time.time()
+        lease: Lease = self._reservation_lease(granted, duration)
+
+        data = {
+            "email": email,
+            "id": lease.id,
+            "ttl": lease.ttl,
+            "expires": granted + lease.ttl
+        }
+        key = f'/reservation/project/{project}'
+        put = _txn_put(key, self._dumps(data), lease.id)
+
+        succeeded, responses = self._txn(
+            [_txn_absent(key)], [put], [_txn_get(key)]
+        )
+        current = None if succeeded else _txn_got(responses[0])
+        if current and _expired(current[0]):
+            succeeded, _ = self._txn(
+                [_txn_unchanged(key, current[1])], [put]
+            )
+
+        if not succeeded:
+            self._unused_lease(lease.id)
+            raise ReservationExists(project)
+
+        return Reservation(
+            project=project, email=email, id=lease.id, ttl=lease.ttl
+        )
+
+
+class AsyncStorage:
+    """
+    Async face of a synchronous Storage backend: every method call runs in
+    the threadpool.  Native async backends subclass this and override the
+    methods they implement without blocking.
+    """
+
+    def __init__(self, svc: Storage):
+        self._sync = svc
+
+    def __getattr__(self, attr):
+        method = getattr(self._sync, attr)
+
+        async def call(*args, **kwargs):
+            return await run_in_threadpool(method, *args, **kwargs)
+
+        return call
+
+    async def close(self):
+        await run_in_threadpool(self._sync.close)
+
 
 class StorageService:
-    def __init__(self, svc=EtcdStorage()):
-        self._svc = svc
+    def __init__(self, svc=None, factory=EtcdStorage):
+        """
+        Either pass a constructed backend (svc) or a factory for one.  The
+        factory is only called on first use, so importing or starting the
+        service never opens storage connections.
+        """
 
-    # Web service related calls
-    def create_project(self, project: ProjectInput):
+        self._backend = None
+        self._factory = factory
+        # One backend, however many first uses race to build it (made on
+        # first use, in the event loop that awaits it)
+        self._building = None
+
+        # Optional callable wrapping the backend when attached (metrics)
+        self.wrapper = None
+
+        if svc is not None:
+            self._attach(svc)
+
+    def _attach(self, svc):
+        # Synchronous backends are kept for compatibility, via threadpool
+        if not isinstance(svc, AsyncStorage):
+            svc = AsyncStorage(svc)
+
+        if self.wrapper is not None:
+            svc = self.wrapper(svc)
+
+        self._backend = svc
+
+    async def _storage(self) -> AsyncStorage:
+        """
+        The backend, built on first use in the threadpool: a cache's
+        initial load or a journal replay must not stall the event loop.
+        """
+
+        if self._backend is None:
+            if self._building is None:
+                self._building = asyncio.Lock()
+
+            async with self._building:
+                # Another request may have built it while this one waited
+                if self._backend is None:
+                    self._attach(await run_in_threadpool(self._factory))
+
+        return self._backend
+
+    async def ready(self, timeout: float = 1.0) -> bool:
+        """
+        Readiness probe: build the backend if needed (off the event loop)
+        and run its bounded, read-only ping.
+        """
+
+        backend = await self._storage()
 
         try:
-            self._svc.get_project(project.name)
-        except ProjectNameNotFound:
-            # This is okay for creating a project
-            pass
-        else:
-            # This is not okay as it already exists
-            raise StorageException(
-                    status_code=409,
-                    status_message=f'Project {project.name} exists'
-            )
+            return await backend.ping(timeout=timeout)
+        except Exception as err:
+            print(f'Storage not ready: {err}')
+            return False
+
+    async def close(self):
+        if self._backend is not None:
+            await self._backend.close()
 
-        # Project data, in Project schema format
-        result_project = self._svc.set_project(
+    async def watch_reservations(self, callback, on_reset=None):
+        svc = await self._storage()
+        return await svc.watch_reservations(callback, on_reset)
+
+    async def count_reservations(self) -> int:
+        svc = await self._storage()
+        return await svc.get_reservation_count()
+
+    async def count_leases(self):
+        svc = await self._storage()
+        return await svc.get_lease_count()
+
+    async def etag(self, kind: str, name: str = None, project: str = None):
+        """
+        Entity tag for an entry or collection, from the storage revision.
+        None when the backend has none (or it could not be read): the
+        request is then served unconditionally.
+        """
+
+        try:
+            svc = await self._storage()
+            revision = await svc.get_revision(kind, name, project)
+        except Exception as err:
+            print(f'Storage revision unavailable: {err}')
+            return None
+
+        return self._etag(kind, revision)
+
+    async def fetch_tagged(
+        self, kind: str, name: str = None, project: str = None,
+        limit: int = None, cursor: str = None
+    ):
+        """
+        An entry, or a collection's summaries ((page, next cursor) with
+        limit), with its entity tag as etag gives it.  Taken from the read
+        itself where the backend can, so the tag costs no extra round trip.
+        """
+
+        svc = await self._storage()
+
+        result, revision = await svc.get_tagged(
+            kind, name, project, limit, cursor
+        )
+
+        return result, self._etag(kind, revision)
+
+    @staticmethod
+    def _etag(kind: str, revision):
+        return f'"{kind[0]}{revision}"' if revision is not None else None
+
+    @staticmethod
+    async def page_through(
+        fetch_page, cursor: str = None, limit: int = None, page_size=100
+    ) -> AsyncIterator[list]:
+        """
+        Walk a collection one page (one bounded storage read) at a time,
+        from cursor onwards and for at most limit entries if given.
+        fetch_page is one of the fetch_*_page methods.
+        """
+
+        while limit is None or limit > 0:
+            size = page_size if limit is None else min(page_size, limit)
+            page, cursor = await fetch_page(size, cursor)
+            yield page
+
+            if not cursor:
+                return
+            if limit is not None:
+                limit -= len(page)
+
+    # Web service related calls
+    async def create_project(self, project: ProjectInput):
+        svc = await self._storage()
+
+        # Project data, in Project schema format (409 if it already exists)
+        result_project = await svc.create_project(
             project.name, project.title, project.description
         )
 
-        self._svc.save_data()
+        await svc.save_data()
 
         return result_project
 
-    def fetch_project(self, name: str = None):
+    async def create_projects(self, projects: List[ProjectInput]):
+        """Create a batch of projects, returning a result per project"""
+
+        svc = await self._storage()
+
+        errors = await svc.create_projects_bulk(projects)
+        await svc.save_data()
+
+        return self._bulk_results(projects, errors)
+
+    @staticmethod
+    def _bulk_results(items: list, errors: list) -> List[BulkResult]:
+        return [
+            BulkResult.construct(name=item.name, status_code=200)
+            if error is None else BulkResult.construct(
+                name=item.name, status_code=error.status_code,
+                detail=error.status_message
+            )
+            for item, error in zip(items, errors)
+        ]
+
+    async def fetch_project(self, name: str = None):
         """
         Dual purpose method
             - full detail result for specified project name
             - list of project summaries for unspecified project name
         """
 
+        svc = await self._storage()
+
         # Easy part - specific project request
         if name:
             # No error handling here as we want to pass them all back
-            project: Project = self._svc.get_project(name)
+            project: Project = await svc.get_project(name)
             return project
 
-        # Longer part - list of summaries
-        project_list: List[str] = self._svc.get_project_list()
-
-        return_projects: List[ProjectCore] = []
-        for project in project_list:
-            return_projects.append(
-                self._svc.get_project(project, core=True)
-            )
+        # Longer part - list of summaries, one storage read
+        return_projects: List[ProjectCore] = \
+            await svc.get_projects_bulk(core=True)
 
         return return_projects
 
-    def create_scenario(self, scenario: ScenarioInput):
+    async def fetch_project_page(self, limit: int, cursor: str = None):
+        """Page of project summaries, with the cursor of the next page"""
 
-        # Are we creating a duplicate?
-        try:
-            self._svc.get_scenario(scenario.name)
-        except ScenarioNameNotFound:
-            # This is okay for creating a scenario
-            pass
-        else:
-            # This is not okay as it already exists
-            raise StorageException(
-                    status_code=409,
-                    status_message=f'Scenario {scenario.name} exists'
-            )
+        svc = await self._storage()
 
-        # Does project exist? (If not, pass not found exception back)
-        self.fetch_project(scenario.project)
+        return await svc.get_projects_page(limit, cursor, core=True)
 
-        # scenario data, in scenario schema format
-        result_scenario = self._svc.set_scenario(
+    async def create_scenario(self, scenario: ScenarioInput):
+        svc = await self._storage()
+
+        # scenario data, in scenario schema format (409 if it already
+        # exists, 404 if the project does not)
+        result_scenario = await svc.create_scenario(
             scenario.name,
             scenario.title,
             scenario.description,
             scenario.project
         )
 
-        self._svc.save_data()
+        await svc.save_data()
 
         return result_scenario
 
-    def fetch_scenario(self, name: str = None):
+    async def create_scenarios(self, scenarios: List[ScenarioInput]):
+        """Create a batch of scenarios, returning a result per scenario"""
+
+        svc = await self._storage()
+
+        errors = await svc.create_scenarios_bulk(scenarios)
+        await svc.save_data()
+
+        return self._bulk_results(scenarios, errors)
+
+    async def fetch_scenario(self, name: str = None, project: str = None):
         """
         Dual purpose method
             - full detail result for specified scenario name
             - list of scenario summaries for unspecified scenario name
+              (only those of one project, if specified)
         """
 
+        svc = await self._storage()
+
         # Easy part - specific scenario request
         if name:
             # No error handling here as we want to pass them all back
-            scenario: Scenario = self._svc.get_scenario(name)
+            scenario: Scenario = await svc.get_scenario(name)
             return scenario
 
-        # Longer part - list of summaries
-        scenario_list: List[str] = self._svc.get_scenario_list()
+        # Scenarios of one project, from the project index
+        if project:
+            return await svc.get_scenarios_by_project(project, core=True)
 
-        return_scenarios: List[ScenarioCore] = []
-        for scenario in scenario_list:
-            return_scenarios.append(
-                self._svc.get_scenario(scenario, core=True)
-            )
+        # Longer part - list of summaries, one storage read
+        return_scenarios: List[ScenarioCore] = \
+            await svc.get_scenarios_bulk(core=True)
 
         return return_scenarios
 
-    def create_reservation(self, reservation: ReservationInput):
+    async def fetch_scenario_page(
+        self, limit: int, cursor: str = None, project: str = None
+    ):
+        """Page of scenario summaries, with the cursor of the next page"""
+
+        svc = await self._storage()
+
+        return await svc.get_scenarios_page(
+            limit, cursor, core=True, project=project
+        )
+
+    async def create_reservation(self, reservation: ReservationInput):
         """
         - Need to determine if an existing reservation exists, if so. Fail.
         - Creating a reservation requires:
@@ -445,67 +2279,306 @@ class StorageService:
           - Creating a Reservation entry with Lease info
         """
 
-        # Assignment solely for PEP8
-        project = reservation.project
-
-        # Are we creating a duplicate?
-        try:
-            self._svc.get_reservation(project)
-        except ReservationNameNotFound:
-            # This is okay for creating a reservation
-            pass
-        else:
-            # This is not okay as it already exists
-            raise StorageException(
-                    status_code=409,
-                    status_message=f'Reservation for {project} exists'
-            )
+        svc = await self._storage()
 
-        # Create reservation bound to lease
-        result_reservation: Reservation = self._svc.set_reservation(
-            project=project,
+        # Create reservation bound to lease (409 if one already exists)
+        result_reservation: Reservation = await svc.create_reservation(
+            project=reservation.project,
             email=reservation.email, duration=reservation.duration
         )
 
-        self._svc.save_data()
+        await svc.save_data()
 
         return result_reservation
 
-    def fetch_reservation(self, name: str = None):
+    async def fetch_reservation(self, name: str = None, detail=False):
         """
         Dual purpose method
             - full detail result for specified project name
             - list of reservation summaries for unspecified project name
+              (or full details, with remaining time, if detail requested)
         """
 
+        svc = await self._storage()
+
         # Easy part - specific reservation request
         if name:
             # No error handling here as we want to pass them all back
-            result: Reservation = self._svc.get_reservation(name)
+            result: Reservation = await svc.get_reservation(name)
             return result
 
-        # Longer part - list of summaries
-        reservation_list: List[str] = self._svc.get_reservation_list()
-
-        return_reservations: List[ReservationCore] = []
-        for reservation in reservation_list:
-            return_reservations.append(
-                self._svc.get_reservation(reservation, core=True)
-            )
+        # Longer part - list of summaries, one storage read
+        return_reservations: List[ReservationCore] = \
+            await svc.get_reservations_bulk(core=not detail)
 
         return return_reservations
 
-    def delete_reservation(
+    async def fetch_reservation_page(
+        self, limit: int, cursor: str = None, detail=False
+    ):
+        """Page of reservations, with the cursor of the next page"""
+
+        svc = await self._storage()
+
+        return await svc.get_reservations_page(
+            limit, cursor, core=not detail
+        )
+
+    async def delete_reservation(
         self, project: str, email: ReservationEmail
     ) -> bool:
+        svc = await self._storage()
 
         # Does the reservation exist?  If not, exception passed back up.
-        result: Reservation = self._svc.get_reservation(project)
+        result: Reservation = await svc.get_reservation(project)
 
         # Only the owner can revoke it.
         if result.email != email.email:
             raise ReservationPermissionDenied(
                 email.email, result.email
             )
-        # Delete it by revoking the lease. Exception passed back up if fails
-        return self._svc.revoke_lease(result.id)
+        # Delete it (revoking its lease unless shared). Exception passed
+        # back up if fails
+        revoked = await svc.release_reservation(project, result.id)
+
+        await svc.save_data()
+
+        return revoked
+
+    async def renew_reservation(
+        self, project: str, renewal: ReservationRenewal
+    ) -> Reservation:
+        """
+        Extend a reservation in place (owner only): the project is never
+        free in between, unlike deleting and reserving it again.
+        """
+
+        svc = await self._storage()
+
+        result: Reservation = await svc.renew_reservation(
+            project, renewal.email, renewal.duration, renewal.auto
+        )
+
+        await svc.save_data()
+
+        return result
+
+    async def lead(self, role: str, worker: str, ttl: float) -> bool:
+        svc = await self._storage()
+        return await svc.lead(role, worker, ttl)
+
+    async def renew_due(self, within: float) -> List[str]:
+        svc = await self._storage()
+
+        names = await svc.renew_due(within)
+
+        if names:
+            await svc.save_data()
+
+        return names
+
+    async def enqueue_reservation(
+        self, project: str, waiter: WaitlistInput, ttl: float = None
+    ) -> int:
+        svc = await self._storage()
+
+        position = await svc.enqueue_reservation(
+            project, waiter.email, waiter.duration, waiter.priority, ttl
+        )
+
+        await svc.save_data()
+
+        return position
+
+    async def fetch_waitlist(self, project: str) -> List[Waiter]:
+        svc = await self._storage()
+        return await svc.get_waitlist(project)
+
+    async def waitlist_status(self, project: str, email: str) -> WaitlistStatus:
+        """
+        Where a requester stands: its position while waiting, the
+        reservation once handed to it (404 if neither).  The waitlist is
+        read first, so a hand-off in between is never missed.
+        """
+
+        svc = await self._storage()
+
+        for waiter in await svc.get_waitlist(project):
+            if waiter.email == email:
+                return WaitlistStatus.construct(
+                    project=project, email=email, position=waiter.position
+                )
+
+        try:
+            reservation: Reservation = await svc.get_reservation(project)
+        except ReservationNameNotFound:
+            reservation = None
+
+        if reservation is None or reservation.email != email:
+            raise WaiterNotFound(project, email)
+
+        return WaitlistStatus.construct(
+            project=project, email=email, reservation=reservation
+        )
+
+    async def keep_waiting(self, project: str, email: str, ttl: float):
+        svc = await self._storage()
+        return await svc.keep_waiting(project, email, ttl)
+
+    async def dequeue_reservation(
+        self, project: str, email: ReservationEmail
+    ) -> bool:
+        svc = await self._storage()
+
+        removed = await svc.dequeue_reservation(project, email.email)
+
+        await svc.save_data()
+
+        return removed
+
+    async def hand_off(self, project: str):
+        svc = await self._storage()
+
+        reservation = await svc.hand_off(project)
+
+        if reservation is not None:
+            await svc.save_data()
+
+        return reservation
+
+    async def waiting_projects(self) -> List[str]:
+        svc = await self._storage()
+        return await svc.waiting_projects()
+
+    async def share_usage(self, worker: str, usage: dict, ttl: float) -> dict:
+        svc = await self._storage()
+        return await svc.share_usage(worker, usage, ttl)
+
+    # Snapshot export and import
+    async def export_catalog(self, page_size: int = 500):
+        """
+        Every project, scenario and active reservation as (kind, page)
+        pairs, one bounded storage read per page, all read at the same
+        storage revision when the backend has one.
+        """
+
+        svc = await self._storage()
+
+        revision = await svc.snapshot_revision()
+
+        for kind in SNAPSHOT_MODELS:
+            fetch_page = partial(svc.export_page, kind, revision=revision)
+            async for page in self.page_through(
+                fetch_page, page_size=page_size
+            ):
+                yield kind, page
+
+    async def import_catalog(
+        self, snapshot: Callable[[], AsyncIterator[bytes]],
+        batch_size: int = 1000
+    ) -> ImportSummary:
+        """
+        Write snapshot lines (as export_catalog's, one JSON {kind: entry}
+        per line, then the SNAPSHOT_END record) batch_size entries at a
+        time.  snapshot() gives the lines, and is read twice: nothing is
+        written unless they end with the end record and its counts.
+        Entries replace those of the same name, so an interrupted import
+        can simply be run again; invalid lines are skipped and reported.
+        """
+
+        await self._check_snapshot(snapshot())
+
+        summary = ImportSummary()
+        batch = {kind: {} for kind in SNAPSHOT_MODELS}
+        number = 0
+
+        async for line in snapshot():
+            number += 1
+            if not line.strip():
+                continue
+
+            try:
+                (kind, entry), = loads(line).items()
+                if kind == SNAPSHOT_END:
+                    break
+                model = SNAPSHOT_MODELS[kind](**entry)
+            except ValidationError as err:
+                self._rejected(summary, number, '; '.join(
+                    f'{".".join(map(str, e["loc"]))}: {e["msg"]}'
+                    for e in err.errors()
+                ))
+                continue
+            except Exception as err:
+                self._rejected(summary, number, f'not a snapshot entry ({err})')
+                continue
+
+            # Within a batch the last of a name wins, as if written in order
+            name = model.project if kind == "reservation" else model.name
+            batch[kind].pop(name, None)
+            batch[kind][name] = model
+
+            if sum(len(entries) for entries in batch.values()) >= batch_size:
+                await self._import_batch(batch, summary)
+                batch = {kind: {} for kind in SNAPSHOT_MODELS}
+
+        await self._import_batch(batch, summary)
+        return summary
+
+    @staticmethod
+    async def _check_snapshot(lines: AsyncIterator[bytes]):
+        """
+        A snapshot is complete if it ends with the end record, and that
+        counts the entry lines of each kind before it (an export cut short
+        has none, or its error record).
+        """
+
+        counts = {kind: 0 for kind in SNAPSHOT_MODELS}
+        end = None
+
+        async for line in lines:
+            if not line.strip():
+                continue
+            if end is not None:
+                raise StorageException(422, 'Snapshot continues past its end')
+
+            try:
+                (kind, entry), = loads(line).items()
+            except Exception:
+                # Counted short below, or rejected on its own when written
+                continue
+
+            if kind == SNAPSHOT_ERROR:
+                raise StorageException(
+                    422, f'Snapshot incomplete, its export failed: {entry}'
+                )
+            if kind == SNAPSHOT_END:
+                end = entry
+            elif kind in counts:
+                counts[kind] += 1
+
+        if end is None:
+            raise StorageException(422, 'Snapshot incomplete, no end record')
+        if end != counts:
+            raise StorageException(
+                422, f'Snapshot incomplete, {counts} of {end} entries'
+            )
+
+    async def _import_batch(self, batch: dict, summary: ImportSummary):
+        if not any(batch.values()):
+            return
+
+        svc = await self._storage()
+        await svc.import_batch(*[
+            list(batch[kind].values()) for kind in SNAPSHOT_MODELS
+        ])
+        await svc.save_data()
+
+        summary.projects += len(batch["project"])
+        summary.scenarios += len(batch["scenario"])
+        summary.reservations += len(batch["reservation"])
+
+    @staticmethod
+    def _rejected(summary: ImportSummary, number: int, error: str):
+        summary.rejected += 1
+        if len(summary.errors) < IMPORT_ERRORS_MAX:
+            summary.errors.append(f'line {number}: {error}')
@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+
+
+import asyncio
+
+from service.events import ReservationEvents
+from service.storage import StorageException, StorageService
+
+from service.models import WaitlistInput, WaitlistStatus
+
+
+class Waitlist:
+    """
+    Serves reservation waitlists from this worker.  The reservation watch
+    shared with the SSE events (started once someone waits) triggers a
+    hand-off whenever a reservation is deleted: released, revoked or
+    expired.  Every worker tries it; the storage transaction lets exactly
+    one win.
+
+    A periodic sweep covers what the watch does not show: a record past
+    its expiry on a shared lease, changes lost in a reset and waiters left
+    from before this worker started.  Disabled with an interval of 0.
+
+    Waiters long-poll status(), woken whenever their project's reservation
+    changes, instead of retrying the reservation.  Each poll keeps its
+    waiter for waiter_ttl seconds more; one that stops polling for longer
+    is skipped and dropped by the next hand-off (0 keeps waiters forever).
+    """
+
+    def __init__(
+        self, storage_service: StorageService,
+        reservation_events: ReservationEvents, sweep_interval: float = 5.0,
+        waiter_ttl: float = 300.0
+    ):
+        self.storage_service = storage_service
+        self.reservation_events = reservation_events
+        self.sweep_interval = sweep_interval
+        self.waiter_ttl = waiter_ttl
+        self.handed_off = 0
+
+        self._changed = {}      # project -> asyncio.Event of its pollers
+        self._tasks = set()
+        self._task = None
+        self._watching = False
+
+        reservation_events.listen(self._on_change)
+
+    def start(self):
+        if self.sweep_interval > 0 and self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def watch(self):
+        if not self._watching:
+            try:
+                await self.reservation_events.start()
+            except StorageException as err:
+                # No events from this backend (sharded): the sweep serves
+                print(f'Waitlist without reservation watch: {err.status_message}')
+            self._watching = True
+
+    async def enqueue(
+        self, project: str, waiter: WaitlistInput
+    ) -> WaitlistStatus:
+        await self.storage_service.enqueue_reservation(
+            project, waiter, self.waiter_ttl or None
+        )
+        await self.watch()
+
+        # The project may be free already
+        await self.hand_off(project)
+
+        return await self.storage_service.waitlist_status(
+            project, waiter.email
+        )
+
+    async def status(
+        self, project: str, email: str, wait: float = 0
+    ) -> WaitlistStatus:
+        """
+        The requester's status; while it is still waiting, wait up to wait
+        seconds for the reservation to be handed to it.
+        """
+
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + wait
+
+        if self.waiter_ttl:
+            await self.storage_service.keep_waiting(
+                project, email, self.waiter_ttl
+            )
+
+        while True:
+            # Taken before reading, so a change in between still wakes us
+            changed = self._changed.setdefault(project, asyncio.Event())
+            result = await self.storage_service.waitlist_status(project, email)
+
+            remaining = deadline - loop.time()
+            if result.position is None or remaining <= 0:
+                return result
+
+            try:
+                await asyncio.wait_for(changed.wait(), remaining)
+            except asyncio.TimeoutError:
+                pass
+
+    async def hand_off(self, project: str):
+        try:
+            reservation = await self.storage_service.hand_off(project)
+        except Exception as err:
+            print(f'Waitlist hand-off for {project} failed: {err}')
+            return None
+
+        if reservation is not None:
+            self.handed_off += 1
+            self._wake(project)
+
+        return reservation
+
+    async def sweep(self):
+        try:
+            projects = await self.storage_service.waiting_projects()
+            if projects:
+                await self.watch()
+        except Exception as err:
+            print(f'Waitlist sweep failed: {err}')
+            return
+
+        await asyncio.gather(*[self.hand_off(p) for p in projects])
+
+    def _wake(self, project: str):
+        changed = self._changed.pop(project, None)
+        if changed is not None:
+            changed.set()
+
+    # Called on the event loop by the reservation watch
+    def _on_change(self, name: str, project: str, data: dict):
+        if name == "reset":
+            self._spawn(self.sweep())
+            return
+
+        self._wake(project)
+        if name == "deleted":
+            self._spawn(self.hand_off(project))
+
+    def _spawn(self, coroutine):
+        task = asyncio.get_running_loop().create_task(coroutine)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.sweep_interval)
+            await self.sweep()
@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+
+
+import time
+from typing import List
+
+from service.codec import loads
+from service.etcd_txn import TXN_OPS_MAX, _expired
+from service.etcd_txn import _txn_absent, _txn_present, _txn_put, _txn_delete
+from service.etcd_txn import _txn_get, _txn_got, _txn_range, _txn_ranged
+from service.etcd_txn import _txn_unchanged
+from service.exceptions import StorageException, WaiterNotFound
+
+from service.models import Lease, Reservation, Waiter
+
+
+class EtcdWaitlist:
+    """
+    Reservation waitlists (see Storage) kept in etcd, mixed into
+    EtcdStorage: its transactions, reads and reservation leases do the
+    work.
+    """
+
+    # Waiters, one key per project and email (not cached, not watched)
+    WAITLIST = "/waitlist/project/"
+
+    def enqueue_reservation(
+        self, project: str, email: str, duration: int, priority: int = 0,
+        ttl: float = None
+    ) -> int:
+        """
+        Put the requester on the project's waitlist, unless already there
+        (its place, duration and priority are then kept).  The holder of
+        the reservation can not queue for it.  Returns the 1-based position.
+        With a ttl the waiter expires unless kept waiting (keep_waiting).
+        """
+
+        current = self.storage_service.get(
+            f'{self.PREFIXES["reservation"]}{project}'
+        )
+        if current:
+            holder = loads(current[0])
+            if holder["email"] == email and not _expired(holder):
+                raise StorageException(
+                    status_code=409,
+                    status_message=f'{email} already holds {project}'
+                )
+
+        key = f'{self.WAITLIST}{project}/{email}'
+        data = {
+            "duration": duration, "priority": priority, "queued": time.time()
+        }
+        if ttl:
+            data["expires"] = data["queued"] + ttl
+        self._txn([_txn_absent(key)], [_txn_put(key, self._dumps(data))])
+
+        for waiter in self.get_waitlist(project):
+            if waiter.email == email:
+                return waiter.position
+
+        # Handed off (or withdrawn) meanwhile
+        return None
+
+    def get_waitlist(self, project: str) -> List[Waiter]:
+        return [
+            waiter for waiter, _ in self._waiters(self._range(
+                f'{self.WAITLIST}{project}/'
+            ).get("kvs", []), project)
+        ]
+
+    @staticmethod
+    def _waiters(kvs: list, project: str) -> list:
+        """
+        (Waiter, mod_revision) for the decoded waitlist keys of a project,
+        in serving order: priority, then creation revision (arrival).
+        Expired waiters are left out.
+        """
+
+        entries = sorted(
+            (
+                entry for entry in (
+                    (item["key"].decode("utf-8").split('/')[-1],
+                     loads(item["value"]), item)
+                    for item in kvs
+                )
+                if not _expired(entry[1])
+            ),
+            key=lambda e: (-e[1]["priority"], int(e[2]["create_revision"]))
+        )
+
+        return [
+            (Waiter.construct(
+                project=project, email=email, duration=data["duration"],
+                priority=data["priority"], position=position
+            ), int(item["mod_revision"]))
+            for position, (email, data, item) in enumerate(entries, 1)
+        ]
+
+    def keep_waiting(self, project: str, email: str, ttl: float) -> bool:
+        """
+        Push a waiter's expiry back to ttl from now, False if it is not
+        waiting (any more).  Only written once half the ttl has passed, so
+        frequent polls cost a read; a change since then (a hand-off) wins.
+        """
+
+        key = f'{self.WAITLIST}{project}/{email}'
+        _, responses = self._txn([], [_txn_get(key)])
+
+        current = _txn_got(responses[0])
+        if current is None or _expired(current[0]):
+            return False
+
+        data, mod_revision = current
+        now = time.time()
+        if data.get("expires", now) - now > ttl / 2:
+            return True
+
+        data["expires"] = now + ttl
+        succeeded, _ = self._txn(
+            [_txn_unchanged(key, mod_revision)],
+            [_txn_put(key, self._dumps(data))]
+        )
+
+        return succeeded
+
+    def dequeue_reservation(self, project: str, email: str) -> bool:
+        key = f'{self.WAITLIST}{project}/{email}'
+        succeeded, _ = self._txn([_txn_present(key)], [_txn_delete(key)])
+        if not succeeded:
+            raise WaiterNotFound(project, email)
+
+        return True
+
+    def hand_off(self, project: str):
+        """
+        Grant a free project to its first waiter.  One read gets the
+        reservation and the waitlist; one transaction then writes the
+        reservation and removes the waiter, only if the project is still
+        free (or still holds the expired record read) and the waiter is
+        still waiting, unchanged.  Losing to another worker's hand-off or a
+        direct reservation changes nothing.  Expired waiters are skipped,
+        and deleted unless kept waiting meanwhile.
+        """
+
+        key = f'{self.PREFIXES["reservation"]}{project}'
+        prefix = f'{self.WAITLIST}{project}/'
+        _, responses = self._txn([], [_txn_get(key), _txn_range(prefix)])
+
+        current = _txn_got(responses[0])
+        if current and not _expired(current[0]):
+            return None
+
+        kvs = _txn_ranged(responses[1])
+        self._drop_expired_waiters(kvs)
+
+        waiters = self._waiters(kvs, project)
+        if not waiters:
+            return None
+
+        waiter, mod_revision = waiters[0]
+        waiter_key = f'{prefix}{waiter.email}'
+
+        granted = time.time()
+        lease: Lease = self._reservation_lease(granted, waiter.duration)
+        data = {
+            "email": waiter.email,
+            "id": lease.id,
+            "ttl": lease.ttl,
+            "expires": granted + lease.ttl
+        }
+
+        succeeded, _ = self._txn(
+            [
+                _txn_absent(key) if current is None
+                else _txn_unchanged(key, current[1]),
+                _txn_unchanged(waiter_key, mod_revision)
+            ],
+            [_txn_put(key, self._dumps(data), lease.id), _txn_delete(waiter_key)]
+        )
+
+        if not succeeded:
+            self._unused_lease(lease.id)
+            return None
+
+        return Reservation(
+            project=project, email=waiter.email, id=lease.id, ttl=lease.ttl
+        )
+
+    def _drop_expired_waiters(self, kvs: list):
+        expired = [
+            item for item in kvs if _expired(loads(item["value"]))
+        ][:TXN_OPS_MAX]
+        if expired:
+            self._txn(
+                [
+                    _txn_unchanged(item["key"], int(item["mod_revision"]))
+                    for item in expired
+                ],
+                [_txn_delete(item["key"]) for item in expired]
+            )
+
+    def waiting_projects(self) -> List[str]:
+        return sorted({
+            name.rsplit('/', 1)[0] for name in self._key_names(self.WAITLIST)
+        })
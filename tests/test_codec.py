@@ -0,0 +1,45 @@
+#!/usr/bin/env python3
+
+
+import json
+
+import pytest
+
+from service import codec
+
+
+VALUE = {
+    "name": "scenario-1",
+    "project": "project-1",
+    "expires": 1700000000.25,
+    "tags": ["a", "é"],
+    "nested": {"count": 3, "empty": None, "flag": True},
+}
+
+
+@pytest.mark.parametrize("name", codec.CODECS)
+def test_round_trip(name):
+    raw = codec.encoder(name)(VALUE)
+
+    assert isinstance(raw, bytes)
+    assert codec.loads(raw) == VALUE
+
+
+def test_msgpack_values_are_marked():
+    assert codec.dumps_msgpack(VALUE)[:1] == codec.MSGPACK_V1
+    assert codec.dumps_json(VALUE)[:1] == b'{'
+
+
+@pytest.mark.parametrize("raw", [
+    json.dumps(VALUE),
+    json.dumps(VALUE).encode("utf-8"),
+    json.dumps(VALUE, indent=2),
+])
+def test_reads_values_written_before_msgpack(raw):
+    # Keys written as JSON text (str from etcd3gw, or bytes) by older workers
+    assert codec.loads(raw) == VALUE
+
+
+def test_unknown_codec():
+    with pytest.raises(ValueError):
+        codec.encoder("yaml")
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+
+
+import json
+
+import pytest
+
+from service.journal import Journal, JournalCorrupt
+
+
+@pytest.fixture
+def snapshot(tmp_path):
+    return str(tmp_path / "conductor.json")
+
+
+def written(snapshot, records):
+    journal = Journal(snapshot)
+    journal.load()
+    for record in records:
+        journal.append(*record)
+    journal.commit()
+    journal.close()
+
+
+def reloaded(snapshot):
+    journal = Journal(snapshot)
+    data = journal.load()
+    journal.close()
+    return journal, data
+
+
+def test_replays_the_log(snapshot):
+    written(snapshot, [
+        ("put", "project", "p1", {"name": "p1"}),
+        ("put", "project", "p2", {"name": "p2"}),
+        ("delete", "project", "p1"),
+    ])
+
+    journal, data = reloaded(snapshot)
+
+    assert data == {"project": {"p2": {"name": "p2"}}}
+    assert journal.seq == 3
+
+
+def test_truncated_record_is_dropped_and_cut_off(snapshot):
+    written(snapshot, [
+        ("put", "project", "p1", {"name": "p1"}),
+        ("put", "project", "p2", {"name": "p2"}),
+    ])
+    with open(f'{snapshot}.log', "rb") as infile:
+        good = infile.read()
+
+    # A crash mid-append leaves part of a record
+    torn = json.dumps({"seq": 3, "op": "put", "kind": "project",
+                       "name": "p3", "value": {"name": "p3"}}).encode()
+    with open(f'{snapshot}.log', "ab") as outfile:
+        outfile.write(torn[:len(torn) // 2])
+
+    journal, data = reloaded(snapshot)
+
+    assert data == {"project": {"p1": {"name": "p1"}, "p2": {"name": "p2"}}}
+    assert journal.seq == 2
+    with open(f'{snapshot}.log', "rb") as infile:
+        assert infile.read() == good
+
+
+def test_appends_after_a_torn_record_replay(snapshot):
+    written(snapshot, [("put", "project", "p1", {"name": "p1"})])
+    with open(f'{snapshot}.log', "ab") as outfile:
+        outfile.write(b'{"seq": 2, "op": "pu')
+
+    written(snapshot, [("put", "project", "p2", {"name": "p2"})])
+
+    journal, data = reloaded(snapshot)
+
+    assert data == {"project": {"p1": {"name": "p1"}, "p2": {"name": "p2"}}}
+    assert journal.seq == 2
+
+
+def test_replays_only_records_newer_than_the_snapshot(snapshot):
+    journal = Journal(snapshot)
+    data = journal.load()
+    for name in ("p1", "p2"):
+        journal.append("put", "project", name, {"name": name})
+        Journal._apply(data, {"op": "put", "kind": "project",
+                              "name": name, "value": {"name": name}})
+    journal.compact(data)
+    journal.append("delete", "project", "p1")
+    journal.commit()
+    journal.close()
+
+    journal, data = reloaded(snapshot)
+
+    assert data == {"project": {"p2": {"name": "p2"}}}
+    assert journal.records == 1
+
+
+def test_reads_a_plain_data_file(snapshot):
+    with open(snapshot, "w") as outfile:
+        json.dump({"project": {"p1": {"name": "p1"}}}, outfile)
+
+    _, data = reloaded(snapshot)
+
+    assert data == {"project": {"p1": {"name": "p1"}}}
+
+
+def test_corrupt_snapshot(snapshot):
+    with open(snapshot, "w") as outfile:
+        outfile.write('{"seq": 1, "da')
+
+    with pytest.raises(JournalCorrupt):
+        Journal(snapshot).load()
@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+
+
+import time
+
+from service.storage import LeaseBuckets
+
+
+def test_bucket_is_the_window_ending_at_or_after_expiry():
+    buckets = LeaseBuckets(window=10)
+
+    assert buckets.bucket(1001)[1] == 1010
+    assert buckets.bucket(1010)[1] == 1010
+    assert buckets.bucket(1010.5)[1] == 1020
+
+
+def test_every_worker_derives_the_same_id():
+    first, second = LeaseBuckets(window=10), LeaseBuckets(window=10)
+
+    assert first.bucket(1003) == second.bucket(1009)
+    assert first.bucket(1003)[0] != first.bucket(1013)[0]
+
+
+def test_bucket_ids_are_shared():
+    buckets = LeaseBuckets(window=30)
+    id, _ = buckets.bucket(time.time() + 3600)
+
+    assert LeaseBuckets.shared(id)
+    assert id < 2 ** 63
+
+
+def test_granted_leases_are_not_shared():
+    # etcd's own IDs start with the member ID, not the bucket prefix
+    for id in (1, 7587862072079563271, 0x0B0B << 48, 0x0B0D << 48):
+        assert not LeaseBuckets.shared(id)
+
+
+def test_granted_windows_are_forgotten_once_ended():
+    buckets = LeaseBuckets(window=10)
+    live, live_end = buckets.bucket(time.time() + 60)
+    ended, ended_end = buckets.bucket(time.time() - 60)
+
+    buckets.add(live, live_end)
+    buckets.add(ended, ended_end)
+
+    assert buckets.granted(live)
+    assert not buckets.granted(ended)
+    assert not buckets.granted(buckets.bucket(time.time() + 600)[0])
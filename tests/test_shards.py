@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+
+
+from operator import itemgetter
+
+from service.shards import HashRing, ShardedEtcdStorage
+
+
+KEYS = [f'project-{i}' for i in range(2000)]
+
+
+def test_ring_spreads_keys():
+    ring = HashRing(['a', 'b', 'c'])
+    owners = [ring.locate(key) for key in KEYS]
+
+    for name in 'abc':
+        assert len(KEYS) / 6 < owners.count(name) < len(KEYS) / 2
+
+
+def test_ring_is_stable_when_a_shard_is_added():
+    before = HashRing(['a', 'b', 'c'])
+    after = HashRing(['a', 'b', 'c', 'd'])
+
+    moved = [key for key in KEYS if before.locate(key) != after.locate(key)]
+
+    # Keys only move onto the new shard, about a quarter of them
+    assert all(after.locate(key) == 'd' for key in moved)
+    assert len(KEYS) / 8 < len(moved) < len(KEYS) / 2
+
+
+def test_ring_does_not_depend_on_shard_order():
+    first = HashRing(['a', 'b', 'c'])
+    second = HashRing(['c', 'a', 'b'])
+
+    assert all(first.locate(key) == second.locate(key) for key in KEYS)
+
+
+def shard_page(names, limit, cursor):
+    # What one shard answers: names after cursor, a cursor if more remain
+    after = [{"name": name} for name in names if cursor is None or name > cursor]
+    page = after[:limit]
+    return page, page[-1]["name"] if len(after) > limit else None
+
+
+def walk(shards, limit):
+    key = itemgetter("name")
+    cursor, seen, pages = None, [], 0
+
+    while True:
+        page, cursor = ShardedEtcdStorage._merged_page(
+            [shard_page(names, limit, cursor) for names in shards], limit, key
+        )
+        seen.extend(key(entry) for entry in page)
+        pages += 1
+        if cursor is None:
+            return seen, pages
+
+
+def test_merged_pages_visit_every_entry_once_in_order():
+    names = sorted(KEYS[:101])
+    ring = HashRing(['a', 'b', 'c'])
+    shards = [
+        [name for name in names if ring.locate(name) == shard]
+        for shard in 'abc'
+    ]
+
+    seen, pages = walk(shards, limit=10)
+
+    assert seen == names
+    assert pages == 11
+
+
+def test_merged_pages_with_uneven_shards():
+    shards = [['a1', 'a2', 'a3', 'a4', 'a5'], [], ['b1']]
+
+    assert walk(shards, limit=2) == (['a1', 'a2', 'a3', 'a4', 'a5', 'b1'], 3)
+
+
+def test_merged_page_ends_when_no_shard_has_more():
+    key = itemgetter("name")
+    pages = [([{"name": "a"}], None), ([{"name": "b"}], None)]
+
+    assert ShardedEtcdStorage._merged_page(pages, 2, key) == (
+        [{"name": "a"}, {"name": "b"}], None
+    )
+    assert ShardedEtcdStorage._merged_page([([], None)], 2, key) == ([], None)